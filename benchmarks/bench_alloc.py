@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Memory allocated by the planner per digest.
+#
+# Example: python3 benchmarks/bench_alloc.py -o alloc.json
+#
+# --plans digests (1 to 4 enzymes) are planned with plan_digest() and
+# converted to JSON records (batch.plan_to_dict()) while tracemalloc
+# traces every allocation. Measured per plan:
+# - the memory blocks and bytes that the plans keep (all plans are kept
+#   alive, as a batch or a server cache would)
+# - the peak memory while a digest is planned (above the memory before)
+# - the same for the JSON records
+# The results are written as JSON.
+import sys, os, argparse, json, time, random, tempfile, platform, tracemalloc, gc
+
+import fixtures
+
+# Blocks and bytes traced since the snapshot before
+def traced(before):
+    after = tracemalloc.take_snapshot()
+    statistics = after.compare_to(before, 'filename')
+    return sum(stat.count_diff for stat in statistics), sum(stat.size_diff for stat in statistics)
+
+def run():
+    parser = argparse.ArgumentParser(description='Memory allocated by the planner per digest.')
+    parser.add_argument('-p','--plans', help='Number of digests (default: 2000)', default=2000, type=int)
+    parser.add_argument('-n','--enzymes', help='Number of enzymes in the synthetic database (default: all NEB enzymes)', type=int)
+    parser.add_argument('-o','--output', help='Write the results (JSON) to this file')
+    args = parser.parse_args()
+
+    from reoptimize import reoptimize, batch
+    results = {'benchmark': 'alloc',
+               'python': sys.version.split()[0],
+               'platform': platform.platform(),
+               'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'metrics': {}}
+    with tempfile.TemporaryDirectory() as directory:
+        sqlite_file = fixtures.build_database(os.path.join(directory, 'REsqlite3.db'), fixtures.neb_enzymes(args.enzymes))
+        names = fixtures.enzyme_names(sqlite_file)
+        rng = random.Random(6)
+        digests = [[name + ' ' + str(rng.randint(1, 3)) for name in rng.sample(names, rng.randint(1, 4))] for i in range(args.plans)]
+        # Warm up (imports, buffer tables, prepared statements)
+        for enzyme in digests[:20]:
+            batch.plan_to_dict(reoptimize.plan_digest(enzyme, 1, 5000, 1, sqlite_file))
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        plans = []
+        peak = 0
+        for enzyme in digests:
+            current = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            plans.append(reoptimize.plan_digest(enzyme, 1, 5000, 1, sqlite_file))
+            peak += tracemalloc.get_traced_memory()[1] - current
+        blocks, size = traced(before)
+        before = tracemalloc.take_snapshot()
+        records = [batch.plan_to_dict(plan) for plan in plans]
+        record_blocks, record_size = traced(before)
+        tracemalloc.stop()
+        n = len(plans)
+        metrics = results['metrics']
+        metrics['plan_blocks'] = {'value': round(blocks / n, 1), 'unit': 'blocks/plan', 'better': 'lower'}
+        metrics['plan_bytes'] = {'value': round(size / n), 'unit': 'bytes/plan', 'better': 'lower'}
+        metrics['plan_peak_bytes'] = {'value': round(peak / n), 'unit': 'bytes/plan', 'better': 'lower'}
+        metrics['record_blocks'] = {'value': round(record_blocks / n, 1), 'unit': 'blocks/plan', 'better': 'lower'}
+        metrics['record_bytes'] = {'value': round(record_size / n), 'unit': 'bytes/plan', 'better': 'lower'}
+        for name, metric in metrics.items():
+            print("%-16s %10s %s" % (name, metric['value'], metric['unit']), file=sys.stderr)
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+
+if __name__ == '__main__':
+    run()
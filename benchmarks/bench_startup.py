@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Startup-time benchmark for the reoptimize command line tool.
+#
+# Example: python3 benchmarks/bench_startup.py -r 10 -o startup.json
+#
+# Every measurement is done in a fresh python process, once "cold" (with
+# an empty bytecode cache, i.e. all modules need to be compiled) and once
+# "warm" (the bytecode cache of the cold run is reused). For each scenario
+# the wall time of the process and the "python -X importtime" numbers of
+# the reoptimize modules are recorded.
+#
+# The script exits with status 1 if a module, that should only be
+# imported lazily, is imported by "reoptimize --help" or if the warm
+# startup is slower than --max-help-ms.
+import sys, os, argparse, json, subprocess, tempfile, time, statistics, re
+
+# Directory that contains the reoptimize package
+root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# Modules that must not be imported by "reoptimize --help"
+lazy_modules = ['sqlite3', 'reoptimize.Restriction_Dictionary', 'Bio']
+
+# What is measured: name and the python code that is run
+scenarios = {
+    'help': ['-m', 'reoptimize.reoptimize', '--help'],
+    'import': ['-c', 'import reoptimize.reoptimize'],
+    'dictionary': ['-c', 'import reoptimize.enzymes; reoptimize.enzymes.restriction_dictionary()'],
+}
+
+# Run the python interpreter once and return wall time (in ms) and the
+# parsed output of -X importtime as {module: (self_us, cumulative_us)}
+def run_once(arguments, pycache_prefix):
+    environment = dict(os.environ)
+    environment['PYTHONPYCACHEPREFIX'] = pycache_prefix
+    environment['PYTHONPATH'] = root + os.pathsep + environment.get('PYTHONPATH', '')
+    command = [sys.executable, '-X', 'importtime'] + arguments
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=root, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    wall_ms = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        sys.exit("Benchmark command failed: " + ' '.join(command) + "\n" + result.stderr)
+    imports = {}
+    for line in result.stderr.splitlines():
+        m = re.match(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)', line)
+        if m is not None:
+            imports[m.group(4)] = (int(m.group(1)), int(m.group(2)))
+    return wall_ms, imports
+
+# Summarize the runs of one scenario
+def summarize(runs):
+    wall = [run[0] for run in runs]
+    imports = runs[-1][1]
+    own_modules = {name: value[1] for name, value in imports.items() if name.startswith('reoptimize')}
+    return {'wall_ms_min': round(min(wall), 2),
+            'wall_ms_median': round(statistics.median(wall), 2),
+            'modules_imported': len(imports),
+            'import_us_total': sum(value[0] for value in imports.values()),
+            'import_us_reoptimize': own_modules}
+
+def benchmark(repeats):
+    results = {}
+    for name, arguments in scenarios.items():
+        results[name] = {}
+        # Cold: a new, empty bytecode cache for every run
+        runs = []
+        for i in range(repeats):
+            with tempfile.TemporaryDirectory() as pycache_prefix:
+                runs.append(run_once(arguments, pycache_prefix))
+        results[name]['cold'] = summarize(runs)
+        # Warm: the bytecode cache is filled by the first run and then reused
+        with tempfile.TemporaryDirectory() as pycache_prefix:
+            run_once(arguments, pycache_prefix)
+            runs = [run_once(arguments, pycache_prefix) for i in range(repeats)]
+        results[name]['warm'] = summarize(runs)
+        results[name]['lazy_modules_imported'] = sorted(module for module in runs[-1][1] if module.split('.')[0] in lazy_modules or module in lazy_modules)
+    return results
+
+def run():
+    parser = argparse.ArgumentParser(description='Measure the startup time of reoptimize.')
+    parser.add_argument('-r','--repeats', help='Number of runs per scenario', default=5, type=int)
+    parser.add_argument('-o','--output', help='Write the results (JSON) to this file')
+    parser.add_argument('--max-help-ms', help='Fail if the warm "reoptimize --help" takes longer (in ms)', type=float)
+    args = parser.parse_args()
+    results = {'benchmark': 'startup',
+               'python': sys.version.split()[0],
+               'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'results': benchmark(args.repeats)}
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+    # Regression checks
+    failed = False
+    if results['results']['help']['lazy_modules_imported']:
+        print("Modules that should be imported lazily are imported by --help: " + ', '.join(results['results']['help']['lazy_modules_imported']), file=sys.stderr)
+        failed = True
+    if args.max_help_ms is not None and results['results']['help']['warm']['wall_ms_median'] > args.max_help_ms:
+        print("Warm startup (" + str(results['results']['help']['warm']['wall_ms_median']) + " ms) is slower than " + str(args.max_help_ms) + " ms", file=sys.stderr)
+        failed = True
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,280 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Benchmark suite for reoptimize.
+#
+# Example: python3 benchmarks/bench_suite.py -o results.json
+#          python3 benchmarks/bench_suite.py --compare results.json
+#
+# Measures
+# - digest() latency for 1, 2, 4 and 8 enzymes
+# - batch throughput (many digests planned one after the other)
+# - the ranking of the (plan, buffer) candidates of many plans by the
+#   buffer-ranking objectives (top 10)
+# - import time and memory (RSS) of the bundled Restriction_Dictionary
+# - catalogue load time (all enzyme and buffer data read from the database)
+# - the unique/double cutter search in a 10 kb and a 200 kb sequence
+# - the throughput of counting the sites of three enzymes in a gzipped
+#   20 Mb genome, read piece by piece
+# - the fetch, parse, FASTA scan and write stages of make_sqlite_database.py
+#
+# All measurements use synthetic NEB pages and a database built from them
+# (see fixtures.py), the pages are served by a local web server. The
+# results are written as JSON: every metric has a value, a unit and
+# whether lower or higher is better, so that the results of two releases
+# can be compared with --compare. The script exits with status 1 if a
+# metric is worse than in the baseline by more than --tolerance.
+import sys, os, argparse, json, time, statistics, random, tempfile, subprocess, contextlib, io, platform
+
+import fixtures
+
+root = fixtures.root
+
+# Time a function call (in ms)
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return (time.perf_counter() - start) * 1000
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+# Make a random digest (list of 'enzyme sites' strings) with n enzymes
+def random_digest(rng, names, n):
+    return [name + ' ' + str(rng.randint(1, 3)) for name in rng.sample(names, n)]
+
+def bench_digest(metrics, sqlite_file, names, repeats):
+    from reoptimize import reoptimize
+    rng = random.Random(2)
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Warm up (module imports, buffer table discovery)
+        reoptimize.digest(random_digest(rng, names, 1), 1, 5000, 1, sqlite_file=sqlite_file)
+        for n in [1, 2, 4, 8]:
+            latencies = [timed(reoptimize.digest, random_digest(rng, names, n), 1, 5000, 1, sqlite_file=sqlite_file) for i in range(repeats)]
+            metrics['digest_latency_' + str(n) + '_enzymes_median'] = (statistics.median(latencies), 'ms', 'lower')
+            metrics['digest_latency_' + str(n) + '_enzymes_p95'] = (percentile(latencies, 0.95), 'ms', 'lower')
+
+def bench_batch(metrics, sqlite_file, names, size):
+    from reoptimize import reoptimize
+    rng = random.Random(3)
+    batch = [(random_digest(rng, names, rng.randint(1, 4)), rng.choice([0.5, 1, 2, 4]), rng.choice([3000, 5000, 10000]), rng.choice([0.25, 1, 2, 8])) for i in range(size)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for enzyme, microgram, length, hours in batch:
+            reoptimize.digest(enzyme, microgram, length, hours, sqlite_file=sqlite_file)
+        elapsed = time.perf_counter() - start
+    metrics['batch_throughput'] = (size / elapsed, 'plans/s', 'higher')
+
+# Rank the candidates of many plans (every plan is offered 50 times, as
+# in a combination search) by every objective
+def bench_rank(metrics, sqlite_file, names, size):
+    from reoptimize import reoptimize, ranking
+    rng = random.Random(7)
+    plans = [reoptimize.plan_digest(random_digest(rng, names, rng.randint(1, 4)), 1, 5000, 1, sqlite_file) for i in range(size)]
+    candidates = [(number, plan) for number, plan in enumerate(plans * 50)]
+    count = sum(len(plan.possible_buffers) for label, plan in candidates)
+    for objective in ranking.objectives_without_prices():
+        start = time.perf_counter()
+        ranking.top_candidates(candidates, objective, 10)
+        metrics['rank_' + objective + '_throughput'] = (count / (time.perf_counter() - start), 'candidates/s', 'higher')
+
+# Unique/double cutter search (reoptimize sites) in a plasmid and a BAC
+def bench_sites(metrics, repeats):
+    from reoptimize import sites
+    rng = random.Random(4)
+    for name, length in [('10kb', 10000), ('200kb', 200000)]:
+        sequence = ''.join(rng.choice('ACGT') for i in range(length))
+        # Warm up (Restriction_Dictionary, building the scanner)
+        sites.cutters(sequence, True)
+        latencies = [timed(sites.cutters, sequence, True) for i in range(max(1, repeats // 4))]
+        metrics['sites_' + name + '_median'] = (statistics.median(latencies), 'ms', 'lower')
+
+def bench_stream(metrics, directory):
+    import gzip
+    from reoptimize import count
+    rng = random.Random(5)
+    bases = bytes(b'ACGT'[byte & 3] for byte in range(256))
+    filename = os.path.join(directory, 'genome.fasta.gz')
+    length = 20000000
+    with gzip.open(filename, 'wb', compresslevel=1) as f:
+        f.write(b'>genome\n')
+        for start in range(0, length, 1000000):
+            block = rng.randbytes(1000000).translate(bases)
+            f.write(b'\n'.join(block[i:i + 80] for i in range(0, len(block), 80)) + b'\n')
+    names = count.enzyme_names(['EcoRI', 'NotI', 'BsaI'])
+    start = time.perf_counter()
+    for result in count.count_sites(filename, names, True):
+        pass
+    metrics['stream_count_throughput'] = (length / 1000000 / (time.perf_counter() - start), 'MB/s', 'higher')
+
+# The import is measured in a new process, so that its memory can be measured
+dictionary_code = '''
+import resource, time, json
+# Current resident memory (in kB), from /proc on Linux, peak memory elsewhere
+def rss():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+before = rss()
+start = time.perf_counter()
+from reoptimize import Restriction_Dictionary
+elapsed = time.perf_counter() - start
+after = rss()
+print(json.dumps([elapsed * 1000, (after - before) / 1024, len(Restriction_Dictionary.rest_dict)]))
+'''
+
+def bench_dictionary(metrics, repeats):
+    times = []
+    for i in range(repeats):
+        result = subprocess.run([sys.executable, '-c', dictionary_code], cwd=root, stdout=subprocess.PIPE, check=True, universal_newlines=True)
+        elapsed, rss, count = json.loads(result.stdout)
+        times.append(elapsed)
+    metrics['dictionary_import_median'] = (statistics.median(times), 'ms', 'lower')
+    metrics['dictionary_import_rss'] = (rss, 'MB', 'lower')
+    metrics['dictionary_enzymes'] = (count, 'enzymes', 'info')
+
+# Read everything a planner needs from the database into python
+def load_catalogue(sqlite_file):
+    from reoptimize import reoptimize
+    sqlcon = reoptimize.open_database(sqlite_file)
+    cursor = sqlcon.cursor()
+    cursor.execute("SELECT enzyme_id, default_buffer, assay_DNA, assay_DNA_cuts, survival, reaction_temperature, enzyme_name, reaction_supplement, enzyme_concentration, timesaver FROM restriction_enzyme")
+    catalogue = {row[0]: [row] for row in cursor.fetchall()}
+    for buffer in reoptimize.discover_buffers(cursor, sqlite_file):
+        cursor.execute("SELECT enzyme_id, activity, star_activity FROM `" + buffer + "`")
+        for row in cursor.fetchall():
+            catalogue[row[0]].append((buffer, row[1], row[2]))
+    sqlcon.close()
+    return catalogue
+
+def bench_catalogue(metrics, sqlite_file, repeats):
+    from reoptimize import reoptimize
+    latencies = []
+    for i in range(repeats):
+        # Forget the buffer tables, this is a cold load
+        reoptimize.buffer_table_cache.clear()
+        latencies.append(timed(load_catalogue, sqlite_file))
+    metrics['catalogue_load_median'] = (statistics.median(latencies), 'ms', 'lower')
+
+def bench_builder(metrics, enzymes, directory):
+    from reoptimize import make_sqlite_database as builder
+    import sqlite3
+    site = os.path.join(directory, 'site')
+    fixtures.write_neb_site(site, enzymes)
+    pages = fixtures.neb_pages(enzymes)
+    # FETCH (needs urllib3)
+    try:
+        http = builder.http_pool()
+    except ImportError:
+        print("urllib3 is not installed, skipping the fetch stage", file=sys.stderr)
+    else:
+        with fixtures.serve(site) as base_url:
+            start = time.perf_counter()
+            for page in pages:
+                builder.fetch_page(http, base_url + '/' + page)
+            metrics['builder_fetch'] = ((time.perf_counter() - start) * 1000, 'ms', 'lower')
+    with contextlib.redirect_stdout(io.StringIO()):
+        # PARSE
+        start = time.perf_counter()
+        enzyme_list = builder.parse_enzyme_list(pages['products/restriction-endonucleases'])
+        rows = [(i, name, url) for i, (name, url) in enumerate(enzyme_list)]
+        parsed = []
+        for enzyme, fixture in zip(rows, enzymes):
+            parsed.append((enzyme,
+                           builder.parse_enzyme_page(pages['products/' + fixture['slug']], enzyme),
+                           builder.parse_survival(pages[fixtures.survival_path], enzyme),
+                           builder.parse_timesaver(pages[fixtures.timesaver_path], enzyme),
+                           fixture['frequency']))
+        metrics['builder_parse'] = ((time.perf_counter() - start) * 1000, 'ms', 'lower')
+        # FASTA SCAN
+        start = time.perf_counter()
+        assay_DNAs = builder.read_assay_DNAs()
+        for enzyme, data, survival, timesaver, frequency in parsed:
+            builder.count_sites(enzyme[1], data['assay_DNA'], assay_DNAs)
+        metrics['builder_fasta_scan'] = ((time.perf_counter() - start) * 1000, 'ms', 'lower')
+        # WRITE
+        start = time.perf_counter()
+        sqlcon = sqlite3.connect(os.path.join(directory, 'builder.db'))
+        c = sqlcon.cursor()
+        builder.create_tables(c, sqlcon)
+        builder.insert_enzymes(c, sqlcon, enzyme_list)
+        for enzyme, data, survival, timesaver, frequency in parsed:
+            builder.write_enzyme_data(c, sqlcon, enzyme, data, survival, timesaver, frequency)
+        sqlcon.close()
+        metrics['builder_write'] = ((time.perf_counter() - start) * 1000, 'ms', 'lower')
+
+# Compare with the results of an earlier run. Returns the list of regressions.
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, metric in results['metrics'].items():
+        if name not in baseline['metrics'] or metric['better'] == 'info':
+            continue
+        old = baseline['metrics'][name]['value']
+        new = metric['value']
+        if old == 0:
+            continue
+        change = (new - old) / old
+        if metric['better'] == 'higher':
+            change = -change
+        print("%-40s %12.3f %12.3f %+8.1f%%" % (name, old, new, change * 100), file=sys.stderr)
+        if change > tolerance:
+            regressions.append(name)
+    return regressions
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip()
+    except OSError:
+        return ''
+
+def run():
+    parser = argparse.ArgumentParser(description='Benchmark suite for reoptimize.')
+    parser.add_argument('-r','--repeats', help='Number of repeats per measurement', default=20, type=int)
+    parser.add_argument('-b','--batch', help='Number of digests in the batch throughput benchmark', default=500, type=int)
+    parser.add_argument('-n','--enzymes', help='Number of enzymes in the synthetic database (default: all NEB enzymes)', type=int)
+    parser.add_argument('-o','--output', help='Write the results (JSON) to this file')
+    parser.add_argument('-c','--compare', help='Compare with the results (JSON) of an earlier run')
+    parser.add_argument('--tolerance', help='Allowed slow-down when comparing (default: 0.2 = 20%%)', default=0.2, type=float)
+    args = parser.parse_args()
+
+    metrics = {}
+    enzymes = fixtures.neb_enzymes(args.enzymes)
+    with tempfile.TemporaryDirectory() as directory:
+        sqlite_file = fixtures.build_database(os.path.join(directory, 'REsqlite3.db'), enzymes)
+        names = fixtures.enzyme_names(sqlite_file)
+        bench_digest(metrics, sqlite_file, names, args.repeats)
+        bench_batch(metrics, sqlite_file, names, args.batch)
+        bench_rank(metrics, sqlite_file, names, args.batch)
+        bench_catalogue(metrics, sqlite_file, args.repeats)
+        bench_sites(metrics, args.repeats)
+        bench_stream(metrics, directory)
+        bench_dictionary(metrics, max(1, args.repeats // 5))
+        bench_builder(metrics, enzymes, directory)
+
+    results = {'benchmark': 'suite',
+               'revision': git_revision(),
+               'python': sys.version.split()[0],
+               'platform': platform.platform(),
+               'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'metrics': {name: {'value': round(value, 3), 'unit': unit, 'better': better} for name, (value, unit, better) in metrics.items()}}
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions: " + ', '.join(regressions), file=sys.stderr)
+            sys.exit(1)
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Throughput of the planner when it is called from many threads (as in a
+# threaded WSGI server).
+#
+# Example: python3 benchmarks/bench_threads.py -o threads.json
+#
+# For 1, 8 and 32 threads, every thread plans digests (plan_digest())
+# for --seconds seconds. This is done twice: with the connection pool
+# (one connection per thread, reused by every digest) and without it (a
+# new connection for every digest, as before the pool existed). The
+# results (plans/s and the number of connections opened) are written as
+# JSON.
+import sys, os, argparse, json, time, random, tempfile, threading, platform
+
+import fixtures
+
+def worker(sqlite_file, names, seconds, seed, counts, index):
+    from reoptimize import reoptimize
+    rng = random.Random(seed)
+    plans = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        enzyme = [name + ' ' + str(rng.randint(1, 3)) for name in rng.sample(names, rng.randint(1, 4))]
+        reoptimize.plan_digest(enzyme, 1, 5000, 1, sqlite_file)
+        plans += 1
+    counts[index] = plans
+
+# Plans per second with the given number of threads
+def throughput(sqlite_file, names, threads, seconds):
+    counts = [0] * threads
+    workers = [threading.Thread(target=worker, args=(sqlite_file, names, seconds, i, counts, i)) for i in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return sum(counts) / (time.perf_counter() - start)
+
+def run():
+    parser = argparse.ArgumentParser(description='Planner throughput with 1, 8 and 32 threads.')
+    parser.add_argument('-s','--seconds', help='Duration of every measurement (default: 2)', default=2, type=float)
+    parser.add_argument('--threads', help='Numbers of threads (default: 1 8 32)', nargs='+', default=[1, 8, 32], type=int)
+    parser.add_argument('-n','--enzymes', help='Number of enzymes in the synthetic database (default: all NEB enzymes)', type=int)
+    parser.add_argument('-o','--output', help='Write the results (JSON) to this file')
+    args = parser.parse_args()
+
+    from reoptimize import database, metrics
+    metrics.enable()
+    results = {'benchmark': 'threads',
+               'python': sys.version.split()[0],
+               'platform': platform.platform(),
+               'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'metrics': {}}
+    with tempfile.TemporaryDirectory() as directory:
+        sqlite_file = fixtures.build_database(os.path.join(directory, 'REsqlite3.db'), fixtures.neb_enzymes(args.enzymes))
+        names = fixtures.enzyme_names(sqlite_file)
+        for pooling in [True, False]:
+            database.pooling = pooling
+            mode = 'pooled' if pooling else 'unpooled'
+            for threads in args.threads:
+                metrics.reset()
+                plans_per_second = throughput(sqlite_file, names, threads, args.seconds)
+                connections = metrics.value('reoptimize_connections_opened_total') if pooling else metrics.value('reoptimize_plans_total')
+                results['metrics'][mode + '_' + str(threads) + '_threads'] = {'value': round(plans_per_second, 1), 'unit': 'plans/s', 'better': 'higher'}
+                results['metrics'][mode + '_' + str(threads) + '_threads_connections'] = {'value': connections, 'unit': 'connections', 'better': 'info'}
+                print("%-9s %3d threads: %10.1f plans/s, %d connections" % (mode, threads, plans_per_second, connections), file=sys.stderr)
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+#
+# Synthetic test data for the benchmarks: NEB-like html pages (in exactly
+# the format that make_sqlite_database.py parses), a local web server that
+# serves them and an enzyme database built from them.
+#
+# The enzymes are the NEB-supplied enzymes of the bundled
+# Restriction_Dictionary; activities, survival, concentrations etc. are
+# random, but always the same for the same seed.
+import sys, os, random, contextlib, threading, functools, io
+import http.server
+
+# Directory that contains the reoptimize package
+root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+if root not in sys.path:
+    sys.path.insert(0, root)
+
+# Assay DNAs as named on the NEB pages (keys of reoptimize.assay_DNA_length)
+assay_DNAs = ['λ', 'pXba', 'T7', 'Adeno-2', 'pBC4', 'pBR322', 'ΦX174 RF I', 'supercoiled pUC19']
+
+activity_values = ['10%', '25%', '50%', '75%', '100%', '100%', '100%']
+
+# Make a list of synthetic enzymes. Every enzyme is a dictionary with the
+# same keys as the result of make_sqlite_database.parse_enzyme_page().
+def neb_enzymes(count=None, seed=1):
+    from reoptimize import enzymes
+    names = sorted(enzymes.restriction_dictionary().suppliers['N'][1])
+    if count is not None:
+        names = names[:count]
+    rng = random.Random(seed)
+    result = []
+    for name in names:
+        page_name = name
+        # Some enzymes are sold as High Fidelity versions
+        if rng.random() < 0.1:
+            page_name = name + '-HF&reg;'
+        result.append({'page_name': page_name,
+                       'slug': name.lower(),
+                       'buffer': rng.choice(['NEBuffer 1.1', 'NEBuffer 2.1', 'NEBuffer 3.1', 'CutSmart® Buffer']),
+                       'temperature': rng.choice([37, 37, 37, 37, 25, 50, 55, 65]),
+                       'supplement': 'Supplement with 80 µM SAM' if rng.random() < 0.05 else '',
+                       'activities': [rng.choice(activity_values) for i in range(4)],
+                       'star': [rng.random() < 0.1 for i in range(4)],
+                       'assay_DNA': rng.choice(assay_DNAs),
+                       'frequency': rng.randint(1, 20),
+                       'concentrations': sorted(rng.sample([5000, 10000, 20000, 50000, 100000], rng.randint(1, 2))),
+                       'survival': rng.choice(['+++', '++', '+', '-', '']),
+                       'timesaver': rng.choice(['5', '15', '', ''])})
+    return result
+
+def enzyme_list_page(enzymes):
+    lines = ['<html>', '\t\t\t\tRestriction Endonucleases: A']
+    for enzyme in enzymes:
+        lines.append("\t\t\t\t\t<span class=\"decorate order open\">Order</span><a href=\"/products/" + enzyme['slug'] + "\">" + enzyme['page_name'] + "</a>")
+    lines.append('\t\t\t\tRestriction Endonuclease Buffers &amp; Diluents')
+    lines.append('</html>')
+    return '\n'.join(lines) + '\n'
+
+def enzyme_page(enzyme):
+    conditions = '<h4>Reaction Conditions</h4><p>1X ' + enzyme['buffer'] + '<br />'
+    if enzyme['supplement'] != '':
+        conditions += enzyme['supplement'] + '<br />'
+    conditions += 'Incubate at ' + str(enzyme['temperature']) + '°C</p>'
+    activity = '<h4>Activity in NEBuffers</h4>' + '<br />'.join(buffer + ': ' + value for buffer, value in zip(['NEBuffer 1.1', 'NEBuffer 2.1', 'NEBuffer 3.1', 'CutSmart Buffer'], enzyme['activities']))
+    lines = ['<html>', '\tReaction Conditions', conditions, '\tActivity in NEBuffers', activity,
+             '\tUnit Definition', 'One unit is defined as the amount of enzyme required to digest 1 µg of ' + enzyme['assay_DNA'] + ' DNA in 1 hour at 37°C in a total reaction volume of 50 µl.']
+    star = [buffer for buffer, value in zip(['NEBuffer 1.1', 'NEBuffer 2.1', 'NEBuffer 3.1', 'CutSmart'], enzyme['star']) if value]
+    if star:
+        lines.append('\t\t<li id="note-1">Star activity may result in ' + ', '.join(star) + '</li>')
+    for concentration in enzyme['concentrations']:
+        lines.append('<tr><td>1,000 units</td><td>' + '{:,}'.format(concentration) + ' units/ml</td><td class="price">$60</td></tr>')
+    lines.append('</html>')
+    return '\n'.join(lines) + '\n'
+
+# Survival and time-saver tables share the same line prefix
+def table_line(enzyme, name, cell):
+    return "\t\t\t\t<td><a href=\"/products/" + enzyme['slug'] + "\">" + name + "</a></td><td>" + cell
+
+def survival_page(enzymes, names):
+    lines = ['<html>']
+    for enzyme, name in zip(enzymes, names):
+        lines.append(table_line(enzyme, name, enzyme['survival'] + '</td></tr>'))
+    return '\n'.join(lines + ['</html>']) + '\n'
+
+def timesaver_page(enzymes, names):
+    lines = ['<html>']
+    for enzyme, name in zip(enzymes, names):
+        if enzyme['timesaver'] != '':
+            lines.append(table_line(enzyme, name, '<img src="/ts.gif" alt="Digest in ' + enzyme['timesaver'] + ' minutes" Title="Time-Saver"></td></tr>'))
+    return '\n'.join(lines + ['</html>']) + '\n'
+
+survival_path = 'tools-and-resources/usage-guidelines/restriction-endonucleases-survival-in-a-reaction'
+timesaver_path = 'tools-and-resources/selection-charts/time-saver-qualified-restriction-enzymes'
+
+# Return {url path: page text} for the whole synthetic NEB web site
+def neb_pages(enzymes):
+    from reoptimize import make_sqlite_database
+    names = [make_sqlite_database.fix_enzyme_name(enzyme['page_name']) for enzyme in enzymes]
+    pages = {'products/restriction-endonucleases': enzyme_list_page(enzymes),
+             survival_path: survival_page(enzymes, names),
+             timesaver_path: timesaver_page(enzymes, names)}
+    for enzyme in enzymes:
+        pages['products/' + enzyme['slug']] = enzyme_page(enzyme)
+    return pages
+
+# Save the pages in a directory, so that they can be served by serve()
+def write_neb_site(directory, enzymes):
+    for page, text in neb_pages(enzymes).items():
+        filename = os.path.join(directory, *page.split('/'))
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+# Serve the files of a directory on localhost. Yields the base url.
+@contextlib.contextmanager
+def serve(directory):
+    handler = functools.partial(QuietHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield 'http://127.0.0.1:' + str(server.server_address[1])
+    finally:
+        server.shutdown()
+        server.server_close()
+
+# Build an enzyme database with the parse and write stages of
+# make_sqlite_database.py from the synthetic pages. The assay DNA site
+# counts are taken from the fixture (the FASTA scan stage is benchmarked
+# on its own, see bench_suite.py).
+def build_database(sqlite_file, enzymes):
+    import sqlite3
+    from reoptimize import make_sqlite_database as builder
+    pages = neb_pages(enzymes)
+    sqlcon = sqlite3.connect(sqlite_file)
+    c = sqlcon.cursor()
+    with contextlib.redirect_stdout(io.StringIO()):
+        builder.create_tables(c, sqlcon)
+        builder.insert_enzymes(c, sqlcon, builder.parse_enzyme_list(pages['products/restriction-endonucleases'], builder.NEB_URL))
+        c.execute("SELECT enzyme_id, enzyme_name, enzyme_url FROM restriction_enzyme")
+        for enzyme, fixture in zip(c.fetchall(), enzymes):
+            data = builder.parse_enzyme_page(pages['products/' + fixture['slug']], enzyme)
+            survival = builder.parse_survival(pages[survival_path], enzyme)
+            timesaver = builder.parse_timesaver(pages[timesaver_path], enzyme)
+            builder.write_enzyme_data(c, sqlcon, enzyme, data, survival, timesaver, fixture['frequency'])
+        builder.write_equivalent_enzymes(c, sqlcon)
+    sqlcon.close()
+    return sqlite_file
+
+# Names of the enzymes in a database built by build_database(), in the
+# order in which they were inserted. Names with a space (e.g. "EcoRI-HF (reg)")
+# are left out, since they can't be given in the 'enzyme sites' format.
+def enzyme_names(sqlite_file):
+    import sqlite3
+    sqlcon = sqlite3.connect(sqlite_file)
+    names = [row[0] for row in sqlcon.execute("SELECT enzyme_name FROM restriction_enzyme ORDER BY enzyme_id") if ' ' not in row[0]]
+    sqlcon.close()
+    return names
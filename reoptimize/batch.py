@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+#
+# Batch mode: plan many digests in one process.
+#
+# Example: reoptimize batch digests.jsonl -o plans.jsonl --metrics metrics.prom
+#
+# Every line of the input file (or stdin) is a JSON object that describes
+# one digest, e.g.
+#
+# {"id": "A1", "enzymes": ["EcoRI 2", "HindIII 1"], "length": 3000, "time": 2, "microgram": 4}
+#
+# Only "enzymes" is required, the defaults for "length", "time" and
+# "microgram" are the same as on the command line. If the sequence of the
+# target DNA is given ("sequence": the sequence itself, or
+# "sequence_file": a FASTA/GenBank file, "circular": true/false, "host":
+# see methylation.py), the fragment sizes are calculated, too. With
+# "substitute": true, enzymes that are not in the database are replaced by
+# an isoschizomer that is (see reoptimize.plan_digest()). "objective" sets
+# how the possible buffers are ranked (see ranking.py). For every input
+# line, one line with the plan (see plan_to_dict()) or with an "error" is
+# written, in the same order.
+#
+# With --plan-cache FILE, plans are shared with other planner processes
+# (see plancache.py).
+#
+# With --best N, the N best digests of the whole batch (request and buffer,
+# by the objective) are printed to stderr at the end.
+import sys, json, contextlib
+
+from . import reoptimize, metrics, ranking, plancache
+
+defaults = {'microgram': 1, 'length': 5000, 'time': 1}
+
+# Read the digest requests (one JSON object per line). Empty lines are
+# skipped, lines that are not valid JSON are returned as {'error': ...}.
+def read_requests(lines):
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if line == '':
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError as err:
+            yield {'id': line_number, 'error': "Line " + str(line_number) + " is not valid JSON: " + str(err)}
+            continue
+        if not isinstance(request, dict):
+            yield {'id': line_number, 'error': "Line " + str(line_number) + " is not a JSON object"}
+            continue
+        request.setdefault('id', line_number)
+        yield request
+
+# Sequence of the target DNA of a request: (sequence, circular), or
+# (None, False) if the request has none
+def request_sequence(request):
+    if request.get('sequence_file'):
+        from . import sequence
+        record = sequence.read_sequence(request['sequence_file'])
+        return record['sequence'], bool(request.get('circular', record['circular']))
+    if request.get('sequence'):
+        return str(request['sequence']).upper(), bool(request.get('circular', False))
+    return None, False
+
+# Plan all digests (index: scan index for the sequences, see scanindex.py;
+# objective: for requests without one, see ranking.py; prices: {enzyme:
+# price of a unit} for the cost objective).
+# Yields (request, plan, error) for every request as soon
+# as it has been planned; plan is None if the digest could not be planned.
+def plan_batch(requests, sqlite_file=None, index=None, objective=None, prices=None):
+    for request in requests:
+        if 'error' in request:
+            metrics.increment('reoptimize_plan_errors_total')
+            yield request, None, request['error']
+            continue
+        enzyme = request.get('enzymes', request.get('enzyme'))
+        if isinstance(enzyme, str):
+            enzyme = [enzyme]
+        if not enzyme:
+            metrics.increment('reoptimize_plan_errors_total')
+            yield request, None, "No enzymes given"
+            continue
+        try:
+            sequence, circular = request_sequence(request)
+            # Messages of the planner must not end up in the JSON output
+            with contextlib.redirect_stdout(sys.stderr):
+                plan = reoptimize.plan_digest(enzyme,
+                                              float(request.get('microgram', defaults['microgram'])),
+                                              int(request.get('length', defaults['length'])),
+                                              float(request.get('time', defaults['time'])),
+                                              sqlite_file,
+                                              sequence=sequence,
+                                              circular=circular,
+                                              host=request.get('host'),
+                                              substitute=bool(request.get('substitute', False)),
+                                              index=index,
+                                              objective=request.get('objective', objective),
+                                              prices=prices)
+        except SystemExit as err:
+            # The planner exits with a message, e.g. for an unknown enzyme
+            metrics.increment('reoptimize_plan_errors_total')
+            yield request, None, str(err.code)
+            continue
+        except (TypeError, ValueError, OSError) as err:
+            metrics.increment('reoptimize_plan_errors_total')
+            yield request, None, str(err)
+            continue
+        yield request, plan, None
+
+# Convert a plan (see reoptimize.plan_digest()) into a dictionary for JSON
+def plan_to_dict(plan):
+    enzymes = {}
+    temperatures = set()
+    for name, value in plan.enzymes.items():
+        enzymes[name] = {'units': round(value.units, 3),
+                         'reaction_temperature': value.reaction_temperature,
+                         'reaction_supplement': value.reaction_supplement,
+                         'activity': value.reaction_buffers}
+        temperatures.add(value.reaction_temperature)
+    possible_buffers = []
+    for buffer, cumulative_activity in plan.possible_buffers:
+        possible_buffers.append({'buffer': buffer,
+                                 'activity': round(cumulative_activity / plan.how_many_enzymes),
+                                 'units': {name: round(value.units * 100 / value.activity(buffer), 3) for name, value in sorted(plan.enzymes.items())}})
+    result = {'enzymes': enzymes,
+              'possible_buffers': possible_buffers,
+              'recommended': len(possible_buffers) > 0,
+              'sequential': len(temperatures) > 1}
+    if plan.sequential is not None:
+        steps = []
+        for step in plan.sequential['steps']:
+            step = dict(step)
+            if 'units' in step:
+                step['units'] = {name: None if units is None else round(units, 3) for name, units in step['units'].items()}
+            steps.append(step)
+        result['sequential_plan'] = dict(plan.sequential, steps=steps)
+    if plan.fragments is not None:
+        result['fragments'] = plan.fragments
+    if plan.substitutions:
+        result['substitutions'] = plan.substitutions
+    return result
+
+def result_record(request, plan, error):
+    if error is not None:
+        return {'id': request.get('id'), 'error': error}
+    record = {'id': request.get('id')}
+    record.update(plan_to_dict(plan))
+    return record
+
+def run(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog='reoptimize batch', description='Plan many digests. Reads one JSON object per line, e.g.\n{"id": "A1", "enzymes": ["EcoRI 2", "HindIII 1"], "length": 3000, "time": 2, "microgram": 4}\nand writes one JSON object with the plan per line.', formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('input', help='JSON lines file with the digests (default: stdin)', nargs='?')
+    parser.add_argument('-o','--output', help='Write the plans to this file (default: stdout)')
+    parser.add_argument('--database', help='Enzyme database file (default: $REOPTIMIZE_DATABASE or REsqlite3.db in the package directory)')
+    parser.add_argument('--index', help='Scan index of the sequences (see reoptimize index --help)', metavar='FILE')
+    parser.add_argument('--objective', help='Rank the possible buffers by this objective, unless the request has its own (default: %s)' % ranking.default_objective, choices=sorted(ranking.objectives))
+    parser.add_argument('--prices', help='Price table for the cost objective (CSV, see reoptimize cost --help)', metavar='FILE')
+    parser.add_argument('--plan-cache', help='Plan cache shared by the planner processes (SQLite file, default: $REOPTIMIZE_PLAN_CACHE, see plancache.py)', metavar='FILE')
+    parser.add_argument('--best', help='Print the N best digests (request and buffer) of the batch to stderr', metavar='N', type=int)
+    parser.add_argument('--metrics', help='Write metrics to this file after the batch', metavar='FILE')
+    parser.add_argument('--metrics-format', help='Format of the metrics file (default: json for *.json, otherwise prometheus)', choices=['json', 'prometheus'])
+    args = parser.parse_args(argv)
+    if args.objective == 'cost' and not args.prices:
+        parser.error("--objective cost needs --prices")
+
+    if args.metrics:
+        metrics.enable()
+    if args.plan_cache:
+        plancache.configure(args.plan_cache)
+    prices = None
+    if args.prices:
+        from . import cost
+        prices = cost.unit_prices(cost.read_prices(args.prices))
+    infile = open(args.input, encoding='utf-8') if args.input else sys.stdin
+    outfile = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    # The plans are written as they are planned; with --best, the written
+    # plans are ranked on the way (only the best are kept)
+    def written():
+        for request, plan, error in plan_batch(read_requests(infile), args.database, args.index, args.objective, prices):
+            outfile.write(json.dumps(result_record(request, plan, error), ensure_ascii=False) + '\n')
+            if plan is not None:
+                yield request['id'], plan
+    try:
+        if args.best:
+            best = ranking.top_candidates(written(), args.objective, args.best, prices)
+        else:
+            for candidate in written():
+                pass
+    finally:
+        if args.input:
+            infile.close()
+        if args.output:
+            outfile.close()
+    if args.best:
+        print("Best digests (" + (args.objective or ranking.default_objective) + "):", file=sys.stderr)
+        for rank, (label, buffer, score) in enumerate(best, 1):
+            print(str(rank) + ". " + str(label) + " in " + buffer + " (" + str(round(abs(score), 2)) + ")", file=sys.stderr)
+    if args.metrics:
+        metrics.write(args.metrics, args.metrics_format)
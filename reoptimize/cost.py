@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+#
+# Reagent cost of digests.
+#
+# Example: reoptimize cost digests.jsonl --prices prices.csv
+#
+# The price table is a CSV file with one line per product (SKU):
+#
+# enzyme,sku,concentration,units,price
+# EcoRI-HF,R3101S,20,10000,86.00
+# EcoRI-HF,R3101L,20,50000,344.00
+# EcoRI-HF,R3101T,100,50000,361.00
+#
+# (concentration in units/µl, units per pack, price per pack). The enzymes
+# are NEB product names; a registered trademark is ignored, so EcoRI-HF
+# is the product "EcoRI-HF (reg)" of the database (see
+# enzymes.product_name()). For every
+# digest (same input as batch mode), the buffer, the incubation time and
+# the products are chosen with the lowest cost of the enzymes: the units
+# every enzyme needs in the buffer at that time (see incubation.py) times
+# the price per unit of the cheapest product of which it needs at most
+# --max-volume µl. The costs of all buffers and times of a digest are
+# calculated at once: for every enzyme one pass over the time grid per
+# buffer, and the units curves are calculated only once for enzymes with
+# the same assay data. Costs that differ by less than cost_tolerance (a
+# cent) are the same: of these, the shortest time is chosen (and the first
+# buffer for the same time), so that a digest doesn't take 16 h to save a
+# fraction of a cent. Digests that can't stay within the volume use the
+# cheapest products regardless of the volume and are marked.
+#
+# The products used by all digests of the batch are summed up, with the
+# number of packs to buy, so that bulk purchases can be planned.
+import sys, csv, math, operator, itertools
+
+from . import incubation, enzymes
+
+# Default time grid for the cost (in minutes)
+min_minutes = 15
+max_minutes = 16 * 60
+step_minutes = 15
+
+# Costs that differ by less than this are the same (see CostModel.plan_cost())
+cost_tolerance = 0.01
+
+# Read the price table: {enzyme (see enzymes.product_name()): [(price per
+# unit, concentration, sku, units per pack, price per pack)]}, cheapest
+# first
+def read_prices(filename):
+    table = {}
+    try:
+        with open(filename, newline='', encoding='utf-8') as f:
+            for line_number, row in enumerate(csv.DictReader(f), 2):
+                try:
+                    enzyme = enzymes.product_name(row['enzyme'])
+                    concentration = float(row['concentration'])
+                    units = float(row['units'])
+                    price = float(row['price'])
+                except (KeyError, TypeError, ValueError, AttributeError):
+                    sys.exit("Line " + str(line_number) + " of the price table " + filename + " needs enzyme, concentration, units and price!")
+                if concentration <= 0 or units <= 0:
+                    sys.exit("Line " + str(line_number) + " of the price table " + filename + ": concentration and units must be positive!")
+                table.setdefault(enzyme, []).append((price / units, concentration, (row.get('sku') or '').strip() or enzyme + ' ' + row['concentration'], units, price))
+    except OSError as err:
+        sys.exit("Error reading the price table " + filename + ". Error: " + str(err))
+    for products in table.values():
+        products.sort()
+    return table
+
+# The lowest price per unit of every enzyme (for the cost objective of
+# ranking.py, which doesn't limit the volume)
+def unit_prices(table):
+    return {enzyme: products[0][0] for enzyme, products in table.items()}
+
+class CostModel:
+    def __init__(self, table, times=None, max_volume=incubation.max_volume):
+        self.table = table
+        self.times = times if times is not None else incubation.time_grid(min_minutes, max_minutes, step_minutes)
+        self.max_volume = max_volume
+        # Units curves by the unit parameters of the enzymes
+        self.curves = {}
+        # Units of every product used so far: {sku: [enzyme, concentration,
+        # units per pack, price per pack, units]}
+        self.purchases = {}
+
+    def curve(self, parameters):
+        curve = self.curves.get(parameters)
+        if curve is None:
+            curve = self.curves[parameters] = incubation.usable_curve(parameters, self.times)
+        return curve
+
+    # Cost of an enzyme for every time of the grid (the units are
+    # multiplied by factor for the buffer), with the cheapest product that
+    # stays within the volume (any product if limited is False)
+    def enzyme_costs(self, products, curve, factor, limited=True):
+        costs = []
+        for units in map(operator.mul, curve, itertools.repeat(factor)):
+            for price_per_unit, concentration, sku, pack_units, pack_price in products:
+                if not limited or units <= concentration * self.max_volume:
+                    costs.append(units * price_per_unit)
+                    break
+            else:
+                costs.append(math.inf)
+        return costs
+
+    # The cheapest (buffer, time) of a digest (plan of
+    # reoptimize.plan_digest()), the shortest time of those within
+    # cost_tolerance. Returns a dictionary with 'id' (label),
+    # 'buffer' (None for sequential digests), 'hours', 'minutes', 'cost',
+    # 'within_volume' and for every enzyme its 'sku', 'concentration',
+    # 'units', 'microliter' and 'cost'. The products are added to the
+    # purchases. Raises ValueError if an enzyme has no price.
+    def plan_cost(self, label, plan, fixed_time=False):
+        names = sorted(plan.enzymes)
+        products = {name: self.table.get(enzymes.product_name(name)) for name in names}
+        missing = [name for name in names if products[name] is None]
+        if missing:
+            raise ValueError("There is no price for " + ', '.join(missing) + "!")
+        if fixed_time:
+            times = [plan.time]
+            curves = [incubation.usable_curve(plan.enzymes[name].unit_parameters, times) for name in names]
+        else:
+            times = self.times
+            curves = [self.curve(plan.enzymes[name].unit_parameters) for name in names]
+        if plan.possible_buffers:
+            options = [(buffer, [100 / plan.enzymes[name].activity(buffer) for name in names]) for buffer, cumulative in plan.possible_buffers]
+        else:
+            options = [(None, [incubation.buffer_factor(plan, plan.enzymes[name])[0] for name in names])]
+        for limited in (True, False):
+            option_totals = []
+            for buffer, factors in options:
+                totals = [0.0] * len(times)
+                for name, curve, factor in zip(names, curves, factors):
+                    totals = list(map(operator.add, totals, self.enzyme_costs(products[name], curve, factor, limited)))
+                option_totals.append(totals)
+            lowest = min(min(totals) for totals in option_totals)
+            if lowest < math.inf:
+                break
+        # The shortest time (then the first buffer) within cost_tolerance of
+        # the lowest cost (the times are in ascending order)
+        total, index, number = lowest, 0, 0
+        if lowest < math.inf:
+            index, number = min((index, number) for number, totals in enumerate(option_totals) for index in range(len(times))
+                                if totals[index] < lowest + cost_tolerance)
+            total = option_totals[number][index]
+        buffer, factors = options[number]
+        hours = times[index]
+        result = {'id': label,
+                  'buffer': buffer,
+                  'hours': hours,
+                  'minutes': round(hours * 60),
+                  'cost': total,
+                  'within_volume': limited,
+                  'enzymes': {}}
+        if total == math.inf:
+            result['cost'] = None
+            return result
+        for name, curve, factor in zip(names, curves, factors):
+            units = curve[index] * factor
+            for price_per_unit, concentration, sku, pack_units, pack_price in products[name]:
+                if not limited or units <= concentration * self.max_volume:
+                    break
+            result['enzymes'][name] = {'sku': sku,
+                                       'concentration': concentration,
+                                       'units': units,
+                                       'microliter': units / concentration,
+                                       'cost': units * price_per_unit}
+            purchase = self.purchases.setdefault(sku, [name, concentration, pack_units, pack_price, 0])
+            purchase[4] += units
+        return result
+
+    # The products to buy for all digests costed so far: list of
+    # dictionaries with 'sku', 'enzyme', 'concentration', 'units' (needed),
+    # 'packs' and 'price' (of the packs), and the total price
+    def purchase_list(self):
+        products = []
+        for sku, (enzyme, concentration, pack_units, pack_price, units) in sorted(self.purchases.items(), key=lambda item: (item[1][0], item[0])):
+            packs = math.ceil(units / pack_units)
+            products.append({'sku': sku, 'enzyme': enzyme, 'concentration': concentration, 'units': units, 'packs': packs, 'price': packs * pack_price})
+        return products, sum(product['price'] for product in products)
+
+def format_cost(value):
+    return "%.2f" % value
+
+def print_cost(result):
+    if result['cost'] is None:
+        print(str(result['id']) + ": no usable incubation time")
+        return
+    where = result['buffer'] if result['buffer'] else "sequential digest"
+    line = str(result['id']) + " (" + where + ", " + incubation.format_minutes(result['minutes']) + "): " + format_cost(result['cost'])
+    if not result['within_volume']:
+        line += " (needs more than the maximum volume)"
+    print(line)
+    for name, value in result['enzymes'].items():
+        print("  %-14s %-12s %8.2f units %7.3f µl %10s" % (name, value['sku'], value['units'], value['microliter'], format_cost(value['cost'])))
+
+def run(argv=None):
+    import argparse, json
+    from . import batch
+    parser = argparse.ArgumentParser(prog='reoptimize cost', description='Choose the buffer, incubation time and products with the lowest enzyme cost for every digest of a batch, and sum up the products to buy.')
+    parser.add_argument('input', help='JSON lines file with the digests, as for reoptimize batch (default: stdin)', nargs='?')
+    parser.add_argument('-p','--prices', help='Price table (CSV with the columns enzyme (NEB product name, e.g. EcoRI-HF), sku, concentration, units, price)', required=True)
+    parser.add_argument('--max-volume', help='Maximum volume of every enzyme (default: %s µl)' % incubation.max_volume, default=incubation.max_volume, type=float)
+    parser.add_argument('--min-time', help='Shortest incubation time (default: %d min)' % min_minutes, default=min_minutes, type=int)
+    parser.add_argument('--max-time', help='Longest incubation time (default: %d min)' % max_minutes, default=max_minutes, type=int)
+    parser.add_argument('--step', help='Step of the time grid (default: %d min)' % step_minutes, default=step_minutes, type=int)
+    parser.add_argument('--fixed-time', help='Use the incubation time of every digest ("time") instead of choosing one', action='store_true')
+    parser.add_argument('--database', help='Enzyme database file (default: $REOPTIMIZE_DATABASE or REsqlite3.db in the package directory)')
+    parser.add_argument('--json', help='Write one JSON object per digest and one with the products to buy', action='store_true')
+    args = parser.parse_args(argv)
+
+    model = CostModel(read_prices(args.prices), incubation.time_grid(args.min_time, args.max_time, args.step), args.max_volume)
+    infile = open(args.input, encoding='utf-8') if args.input else sys.stdin
+    try:
+        for request, plan, error in batch.plan_batch(batch.read_requests(infile), args.database):
+            if error is None:
+                try:
+                    result = model.plan_cost(request['id'], plan, args.fixed_time)
+                except ValueError as err:
+                    error = str(err)
+            if error is not None:
+                result = {'id': request.get('id'), 'error': error}
+                if not args.json:
+                    print(str(request.get('id')) + ": " + error)
+                    continue
+            if args.json:
+                print(json.dumps(result, ensure_ascii=False))
+            else:
+                print_cost(result)
+    finally:
+        if args.input:
+            infile.close()
+    products, total = model.purchase_list()
+    if args.json:
+        print(json.dumps({'purchase': products, 'total': total}, ensure_ascii=False))
+        return
+    print("")
+    print("Products to buy:")
+    for product in products:
+        print("  %-14s %-12s %8.0f units needed: %d pack(s) %10s" % (product['enzyme'], product['sku'], product['units'], product['packs'], format_cost(product['price'])))
+    print("Total: " + format_cost(total))
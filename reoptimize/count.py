@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+#
+# Count the sites of enzymes in large sequences (bacterial genomes, BAC
+# libraries), with constant memory.
+#
+# Example: reoptimize count genome.fasta.gz -e EcoRI NotI BsaI --circular
+#
+# The sequences are read piece by piece (sequence.stream_sequences()) and
+# searched window by window (scan.Scanner.scan_stream()), so no sequence is
+# ever held in memory as a whole. Without -e, the sites of all
+# commercially available enzymes are counted (slower: the windows are
+# then searched with the automaton instead of regular expressions).
+import sys, itertools
+
+from . import enzymes, scan
+
+# Count the sites of the enzymes (names in Restriction_Dictionary) in all
+# sequences of a file. circular overrides the topology of the file (None:
+# from the LOCUS line of GenBank files, otherwise linear). Yields
+# {'name', 'length', 'circular', 'counts': {enzyme: number of sites}} for
+# every sequence.
+def count_sites(filename, names, circular=None, window=scan.window_size):
+    from . import sequence
+    rest_dict = enzymes.rest_dict()
+    scanner = scan.scanner_for(rest_dict[name]['site'] for name in names)
+    position = {site: index for index, site in enumerate(scanner.sites)}
+    for number, pieces in itertools.groupby(sequence.stream_sequences(filename), key=lambda item: item[0]):
+        first = next(pieces)
+        topology = bool(first[2]) if circular is None else circular
+        counts, length = scanner.count_stream(itertools.chain([first[3]], (item[3] for item in pieces)), topology, window)
+        yield {'name': first[1],
+               'length': length,
+               'circular': topology,
+               'counts': {name: counts[position[rest_dict[name]['site'].upper()]] for name in names}}
+
+# Names of the enzymes in Restriction_Dictionary (NEB names like
+# EcoRI-HF are accepted)
+def enzyme_names(requested):
+    names = []
+    for name in requested:
+        key = enzymes.dictionary_name(name)
+        if key is None:
+            sys.exit("Unknown enzyme " + name + "!")
+        if '|' in enzymes.rest_dict()[key]['site']:
+            sys.exit("The sites of " + name + " can't be counted (two-part site).")
+        names.append(key)
+    return list(dict.fromkeys(names))
+
+def print_counts(result):
+    topology = "circular" if result['circular'] else "linear"
+    print(result['name'] + " (" + str(result['length']) + " bp, " + topology + ")")
+    rest_dict = enzymes.rest_dict()
+    for name, count in sorted(result['counts'].items()):
+        print("  %-12s %-14s %d" % (name, rest_dict[name]['site'], count))
+
+def run(argv=None):
+    import argparse, json
+    parser = argparse.ArgumentParser(prog='reoptimize count', description='Count the sites of enzymes in large sequences (e.g. bacterial genomes), reading them piece by piece.')
+    parser.add_argument('sequences', help='Sequence files (FASTA, GenBank or plain sequence, may be gzipped)', nargs='+')
+    parser.add_argument('-e','--enzyme', help='Enzymes (default: all commercially available enzymes)', nargs='+')
+    topology = parser.add_mutually_exclusive_group()
+    topology.add_argument('--circular', help='The sequences are circular (default for GenBank files: from the LOCUS line, otherwise linear)', action='store_true')
+    topology.add_argument('--linear', help='The sequences are linear', action='store_true')
+    parser.add_argument('--window', help='Bases searched at once (default: %d)' % scan.window_size, default=scan.window_size, type=int)
+    parser.add_argument('--json', help='Write the results as JSON (one line per sequence)', action='store_true')
+    args = parser.parse_args(argv)
+
+    if args.enzyme:
+        names = enzyme_names(args.enzyme)
+    else:
+        from . import sites
+        names = list(sites.select_enzymes())
+    circular = True if args.circular else False if args.linear else None
+    for filename in args.sequences:
+        for result in count_sites(filename, names, circular, args.window):
+            if args.json:
+                print(json.dumps(result, ensure_ascii=False))
+            else:
+                print_counts(result)
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+#
+# Access to the enzyme database file (REsqlite3.db).
+#
+# The planner only ever reads the database. It opens it read-only
+# (URI mode=ro, immutable=1, PRAGMA query_only), so that many planner
+# processes can use the same file without taking locks, with memory
+# mapped I/O, so that they share the pages of the file in the page cache
+# of the operating system instead of each keeping its own copy.
+#
+# immutable=1 tells sqlite that the file never changes while it is open.
+# This is true, because make_sqlite_database.py never writes into a
+# published database file: it builds a new file and renames it over the
+# old one (see publish()). Connections that are already open keep
+# reading the old file, new connections get the new one.
+import os, threading
+
+try:
+    from . import metrics
+except ImportError:
+    # Imported by make_sqlite_database.py run as a script
+    import metrics
+
+# Memory map up to this many bytes of the database file
+mmap_size = 256 * 1024 * 1024
+# Page cache per connection (in KiB)
+cache_size = 8 * 1024
+# Number of prepared statements kept per connection
+cached_statements = 256
+
+# The database file: $REOPTIMIZE_DATABASE or REsqlite3.db in the package directory
+def default_database():
+    return os.environ.get('REOPTIMIZE_DATABASE') or os.path.join(os.path.dirname(os.path.realpath(__file__)), 'REsqlite3.db')
+
+# Open the database file. Read-only unless read_only is False.
+def connect(sqlite_file, read_only=True, immutable=True, check_same_thread=True):
+    import sqlite3
+    if not read_only:
+        return sqlite3.connect(sqlite_file, check_same_thread=check_same_thread)
+    from urllib.parse import quote
+    uri = 'file:' + quote(os.path.abspath(sqlite_file)) + '?mode=ro'
+    if immutable:
+        uri += '&immutable=1'
+    sqlcon = sqlite3.connect(uri, uri=True, check_same_thread=check_same_thread, cached_statements=cached_statements)
+    sqlcon.execute('PRAGMA query_only = ON')
+    sqlcon.execute('PRAGMA mmap_size = ' + str(int(mmap_size)))
+    sqlcon.execute('PRAGMA cache_size = -' + str(int(cache_size)))
+    return sqlcon
+
+# Version of the catalogue in a database file: a hash of the content of
+# the file, so that two files with the same data have the same version and
+# a rebuilt database with other data gets a new one. The file is only read
+# again when its (inode, modification time, size) changes.
+catalogue_versions = {}
+
+def catalogue_version(sqlite_file):
+    import hashlib
+    try:
+        stat = os.stat(sqlite_file)
+    except OSError:
+        return None
+    stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    cached = catalogue_versions.get(sqlite_file)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    digest = hashlib.sha256()
+    with open(sqlite_file, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    version = digest.hexdigest()[:16]
+    catalogue_versions[sqlite_file] = (stamp, version)
+    return version
+
+# Publish a newly built database file: flush it to disk and rename it to
+# its final name. The rename is atomic, so that readers either see the
+# complete old or the complete new file, never a partially written one.
+def publish(temporary_file, sqlite_file):
+    with open(temporary_file, 'rb+') as f:
+        os.fsync(f.fileno())
+    os.replace(temporary_file, sqlite_file)
+    # Make the rename itself durable
+    directory = os.path.dirname(os.path.abspath(sqlite_file))
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+# Name of the file a new database is built in before it is published
+def temporary_name(sqlite_file):
+    directory, name = os.path.split(os.path.abspath(sqlite_file))
+    return os.path.join(directory, '.' + name + '.tmp-' + str(os.getpid()))
+
+#
+# CONNECTION POOL
+#
+# sqlite3 connections can't be shared between threads. Instead of opening
+# a new connection for every digest, every thread keeps one read-only
+# connection per database file and reuses it. sqlite3 keeps the prepared
+# statements of a connection in a cache (keyed by the SQL text), so the
+# queries of the planner (which always have the same text and take their
+# values as parameters) are only compiled once per thread.
+#
+# If the database file is replaced (by make_sqlite_database.py), the
+# connections are opened again the next time they are used.
+
+# Set to False to open a new connection for every digest (for benchmarks)
+pooling = True
+
+class ConnectionPool:
+    def __init__(self, sqlite_file):
+        self.sqlite_file = sqlite_file
+        self.local = threading.local()
+
+    # Identity of the database file: a replaced file has a new inode
+    def file_stamp(self):
+        try:
+            stat = os.stat(self.sqlite_file)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    # The connection of the calling thread
+    def connection(self):
+        sqlcon = getattr(self.local, 'sqlcon', None)
+        stamp = self.file_stamp()
+        if sqlcon is not None and self.local.stamp == stamp:
+            return sqlcon
+        if sqlcon is not None:
+            self.close()
+        sqlcon = connect(self.sqlite_file)
+        self.local.sqlcon = sqlcon
+        self.local.stamp = stamp
+        metrics.increment('reoptimize_connections_opened_total')
+        return sqlcon
+
+    # Close the connection of the calling thread
+    def close(self):
+        sqlcon = getattr(self.local, 'sqlcon', None)
+        if sqlcon is not None:
+            sqlcon.close()
+            self.local.sqlcon = None
+
+pools = {}
+pools_lock = threading.Lock()
+
+# Return the (pooled) read-only connection of the calling thread to the
+# database file. The connection must not be closed by the caller.
+def connection(sqlite_file):
+    pool = pools.get(sqlite_file)
+    if pool is None:
+        with pools_lock:
+            pool = pools.setdefault(sqlite_file, ConnectionPool(sqlite_file))
+    return pool.connection()
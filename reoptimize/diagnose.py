@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+#
+# Diagnostic digests: find the enzyme (or pair of enzymes) whose fragment
+# patterns best distinguish candidate clones on an agarose gel.
+#
+# Example: reoptimize diagnose construct.gb vector.gb misassembly.fasta
+#
+# Every sequence in the files is a candidate (e.g. the expected construct,
+# the empty vector and common mis-assemblies). For every NEB enzyme in the
+# enzyme database and every pair of them that can be used together in one
+# buffer (at least 50% activity and no star activity in the buffer
+# tables), the fragments of all candidates are calculated and compared as
+# bands on a gel: fragments smaller than min_size or larger than max_size
+# are not seen, fragments whose sizes differ by less than resolution
+# (relative) run as one band. Two candidates are told apart by the bands
+# that one of them has and the other doesn't. The best digests have the
+# most such bands for the two candidates that are the most similar.
+#
+# The sites of all enzymes are searched once per sequence, and enzymes with
+# the same cut positions in all candidates (isoschizomers, HF versions) are
+# only tried once.
+import sys
+
+from . import enzymes, reoptimize
+
+# Fragments that can be seen on the gel (in bp)
+min_size = 250
+max_size = 20000
+# Fragments whose sizes differ by less than this (relative) run as one band
+resolution = 0.07
+# Digests with more bands than this are not used
+max_bands = 10
+# Minimum % activity of an enzyme in a buffer
+minimum_activity = 50
+
+# Bands on the gel for the fragment sizes (sorted, largest first)
+def bands(sizes):
+    result = []
+    for size in sorted(sizes, reverse=True):
+        if size < min_size or size > max_size:
+            continue
+        if result and result[-1] - size < resolution * result[-1]:
+            continue
+        result.append(size)
+    return result
+
+# Number of bands that only one of two gels has (bands are matched if
+# their sizes differ by less than resolution)
+def band_difference(a, b):
+    i = j = matched = 0
+    while i < len(a) and j < len(b):
+        if abs(a[i] - b[j]) < resolution * max(a[i], b[j]):
+            matched += 1
+            i += 1
+            j += 1
+        elif a[i] > b[j]:
+            i += 1
+        else:
+            j += 1
+    return len(a) + len(b) - 2 * matched
+
+# Score of the band patterns of all candidates: (difference of the two
+# most similar candidates, sum of the differences of all pairs)
+def separability(patterns):
+    smallest = None
+    total = 0
+    for i in range(len(patterns)):
+        for j in range(i + 1, len(patterns)):
+            difference = band_difference(patterns[i], patterns[j])
+            total += difference
+            if smallest is None or difference < smallest:
+                smallest = difference
+    return (smallest or 0, total)
+
+# The NEB enzymes that can be used: {dictionary name: [(product, buffer
+# bitmask, {buffer: % activity})]}, and the list of buffers (the bits of
+# the bitmasks)
+def neb_enzymes(sqlite_file=None):
+    activities = reoptimize.buffer_activities(sqlite_file)
+    buffers = sorted(set(buffer for values in activities.values() for buffer in values))
+    result = {}
+    rest_dict = enzymes.rest_dict()
+    for product, values in sorted(activities.items()):
+        name = enzymes.dictionary_name(product)
+        if name is None or rest_dict[name]['fst5'] is None or '|' in rest_dict[name]['site']:
+            continue
+        mask = 0
+        compatible = {}
+        for bit, buffer in enumerate(buffers):
+            activity, star_activity = values.get(buffer, (None, None))
+            if activity is not None and activity >= minimum_activity and star_activity == 0:
+                mask |= 1 << bit
+                compatible[buffer] = activity
+        if mask:
+            result.setdefault(name, []).append((product, mask, compatible))
+    return result, buffers
+
+# Search the best diagnostic digests for the candidates (records of
+# sequence.py). Returns the best results, best first: dictionaries with
+# 'enzymes' (NEB products), 'buffer', 'score' (see separability()) and
+# 'bands' (bands of every candidate).
+def search(records, sqlite_file=None, pairs=True, top=10):
+    from . import scan, fragments
+    if len(records) < 2:
+        sys.exit("At least two sequences are needed to find a diagnostic digest!")
+    products, buffers = neb_enzymes(sqlite_file)
+    rest_dict = enzymes.rest_dict()
+    names = sorted(products)
+    scanner = scan.scanner_for(rest_dict[name]['site'] for name in names)
+    # Cut positions of every enzyme in every candidate, calculated once
+    cuts = {name: [] for name in names}
+    for record in records:
+        by_site = dict(zip(scanner.sites, scanner.scan(record['sequence'], bool(record['circular']))))
+        for name in names:
+            cuts[name].append(fragments.cut_positions(rest_dict[name], by_site[rest_dict[name]['site'].upper()], len(record['sequence']), bool(record['circular'])))
+    # Enzymes with the same cuts in all candidates are tried only once.
+    # Enzymes that cut none of the candidates can't help, and enzymes that
+    # give too many bands alone give even more in a pair.
+    representatives = {}
+    for name in names:
+        key = tuple(tuple(positions) for positions in cuts[name])
+        if not any(key):
+            continue
+        patterns = [bands(fragments.fragment_sizes(positions, len(record['sequence']), bool(record['circular']))) for positions, record in zip(cuts[name], records)]
+        if max(len(pattern) for pattern in patterns) > max_bands:
+            continue
+        if key in representatives:
+            representatives[key].append(name)
+        else:
+            representatives[key] = [name]
+    groups = list(representatives.values())
+    # Buffers that all products of a group can be used in (any of them)
+    group_mask = [0] * len(groups)
+    for index, group in enumerate(groups):
+        for name in group:
+            for product, mask, compatible in products[name]:
+                group_mask[index] |= mask
+
+    candidates = []
+    def score(members):
+        patterns = []
+        for position, record in enumerate(records):
+            merged = fragments.merge_cuts(cuts[groups[member][0]][position] for member in members)
+            pattern = bands(fragments.fragment_sizes(merged, len(record['sequence']), bool(record['circular'])))
+            if len(pattern) > max_bands:
+                return None, None
+            patterns.append(pattern)
+        return separability(patterns), patterns
+
+    for first in range(len(groups)):
+        value, patterns = score([first])
+        if value is not None:
+            candidates.append((value[0], value[1], -1, (first,), patterns))
+        if not pairs:
+            continue
+        for second in range(first + 1, len(groups)):
+            # Only pairs that can be used together in one buffer
+            if group_mask[first] & group_mask[second] == 0:
+                continue
+            value, patterns = score([first, second])
+            if value is not None:
+                candidates.append((value[0], value[1], -2, (first, second), patterns))
+    # Best first: the two most similar candidates are the most different,
+    # then the sum of all differences, then single enzymes before pairs
+    candidates.sort(key=lambda candidate: (-candidate[0], -candidate[1], -candidate[2]))
+
+    results = []
+    for smallest, total, size, members, patterns in candidates[:top]:
+        results.append(describe(members, groups, products, buffers, smallest, total, patterns, records))
+    return results
+
+# Choose the NEB products and the buffer for a digest
+def describe(members, groups, products, buffers, smallest, total, patterns, records):
+    # The products and the buffer with the highest lowest activity
+    best = None
+    for bit, buffer in enumerate(buffers):
+        chosen = []
+        for member in members:
+            options = [(compatible[buffer], product) for name in groups[member] for product, product_mask, compatible in products[name] if buffer in compatible]
+            if not options:
+                break
+            chosen.append(max(options))
+        else:
+            lowest = min(activity for activity, product in chosen)
+            if best is None or lowest > best[0]:
+                best = (lowest, buffer, [product for activity, product in chosen])
+    return {'enzymes': best[2],
+            'isoschizomers': [groups[member][1:] for member in members],
+            'buffer': best[1],
+            'score': [smallest, total],
+            'bands': {record['name']: pattern for record, pattern in zip(records, patterns)}}
+
+def print_results(results):
+    if not results:
+        print("No diagnostic digest found.")
+        return
+    for rank, result in enumerate(results, 1):
+        print(str(rank) + ". " + ' + '.join(result['enzymes']) + " in " + result['buffer'] + " (" + str(result['score'][0]) + " different bands between the two most similar sequences)")
+        for name, pattern in result['bands'].items():
+            print("   %-20s %s" % (name, ', '.join(str(size) for size in pattern) if pattern else "(no bands)"))
+
+def run(argv=None):
+    import argparse, json
+    global min_size, max_size, resolution, max_bands
+    parser = argparse.ArgumentParser(prog='reoptimize diagnose', description='Find the enzymes (single or pairs) whose fragments best tell apart the sequences on a gel, e.g. the expected construct, the empty vector and mis-assemblies.')
+    parser.add_argument('sequences', help='Sequence files (FASTA, GenBank or plain sequence); every sequence is a candidate', nargs='+')
+    parser.add_argument('--top', help='Number of digests to show (default: 10)', default=10, type=int)
+    parser.add_argument('--single', help='Only single enzymes, no pairs', action='store_true')
+    parser.add_argument('--min-size', help='Smallest fragment seen on the gel (default: %d bp)' % min_size, default=min_size, type=int)
+    parser.add_argument('--max-size', help='Largest fragment resolved on the gel (default: %d bp)' % max_size, default=max_size, type=int)
+    parser.add_argument('--resolution', help='Fragments whose sizes differ by less than this fraction run as one band (default: %s)' % resolution, default=resolution, type=float)
+    parser.add_argument('--max-bands', help='Maximum number of bands per lane (default: %d)' % max_bands, default=max_bands, type=int)
+    topology = parser.add_mutually_exclusive_group()
+    topology.add_argument('--circular', help='The sequences are circular (default for GenBank files: from the LOCUS line, otherwise linear)', action='store_true')
+    topology.add_argument('--linear', help='The sequences are linear', action='store_true')
+    parser.add_argument('--database', help='Enzyme database file (default: $REOPTIMIZE_DATABASE or REsqlite3.db in the package directory)')
+    parser.add_argument('--json', help='Write the results as JSON', action='store_true')
+    args = parser.parse_args(argv)
+
+    from . import sequence
+    min_size, max_size, resolution, max_bands = args.min_size, args.max_size, args.resolution, args.max_bands
+    records = []
+    for filename in args.sequences:
+        for record in sequence.read_sequences(filename):
+            if args.circular or args.linear:
+                record['circular'] = args.circular
+            records.append(record)
+    results = search(records, args.database, not args.single, args.top)
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+    else:
+        print_results(results)
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+#
+# Access to the bundled Restriction_Dictionary (the REBASE data compiled
+# for Biopython). The dictionary module is more than 100000 lines long and
+# importing it is by far the most expensive thing reoptimize can do, so it
+# is only imported the first time one of the functions below is called.
+
+_dictionary = None
+
+# Return the Restriction_Dictionary module (rest_dict, suppliers, typedict)
+def restriction_dictionary():
+    global _dictionary
+    if _dictionary is None:
+        try:
+            from . import Restriction_Dictionary as dictionary
+        except ImportError:
+            # make_sqlite_database.py is run as a script from within the
+            # package directory
+            import Restriction_Dictionary as dictionary
+        _dictionary = dictionary
+    return _dictionary
+
+# Return the REBASE data (site, cut positions, temperatures, ...) for all enzymes
+def rest_dict():
+    return restriction_dictionary().rest_dict
+
+_upper_names = None
+
+# Name of an NEB product without the registered trademark (the database
+# has e.g. "EcoRI-HF (reg)", price lists and users write EcoRI-HF or
+# EcoRI-HF®)
+def product_name(name):
+    return name.replace(' (reg)', '').replace('®', '').strip()
+
+# Name of an enzyme in Restriction_Dictionary. NEB sells engineered
+# versions of some enzymes (EcoRI-HF®, BsaI-HFv2, BsmBI-v2), their data
+# is stored under the name of the original enzyme. Nicking and homing
+# enzymes are written with "_" instead of "." or "-" (Nt_BstNBI, I_SceI).
+# Returns None if the enzyme is not in the dictionary.
+def dictionary_name(name):
+    global _upper_names
+    import re
+    name = product_name(name)
+    name = re.sub(r'-(HF(v\d+)?|v\d+)$', '', name)
+    name = name.replace('.', '_').replace('-', '_')
+    dictionary = rest_dict()
+    if name in dictionary:
+        return name
+    if _upper_names is None:
+        _upper_names = {key.upper(): key for key in dictionary}
+    return _upper_names.get(name.upper())
+
+# Heat inactivation temperature (°C) of an enzyme, None if it is unknown
+def inactivation_temperature(name):
+    key = dictionary_name(name)
+    if key is None:
+        return None
+    return rest_dict()[key]['inact_temp']
+
+# Inverted indexes over Restriction_Dictionary, built the first time they
+# are needed. Every enzyme has a bit (its position in the sorted list of
+# names), a set of enzymes is an int with their bits set, so a query like
+# "sold by NEB, blunt, 6 bp site, not methylation sensitive" is an
+# intersection of a few ints instead of walking the supplier and type lists.
+# - 'names': enzyme names, the bit of names[i] is 1 << i
+# - 'bits': {name: bit}
+# - 'suppliers': {supplier code: enzymes sold by the supplier}
+# - 'properties': {type (Blunt, Ov5, Palindromic, Meth_Dep, ...): enzymes}
+# - 'lengths': {length of the site: enzymes}
+# - 'sites': {site (see canonical_site()): enzymes that recognize it}
+# - 'types': {name: tuple of the types of the enzyme}
+_index = None
+
+def enzyme_index():
+    global _index
+    if _index is None:
+        dictionary = restriction_dictionary()
+        names = sorted(dictionary.rest_dict)
+        bits = {name: 1 << position for position, name in enumerate(names)}
+        suppliers = {}
+        for code, (supplier, supplied) in dictionary.suppliers.items():
+            mask = 0
+            for name in supplied:
+                mask |= bits.get(name, 0)
+            suppliers[code] = mask
+        properties = {}
+        types = {}
+        for type_names, members in dictionary.typedict.values():
+            mask = 0
+            for name in members:
+                mask |= bits.get(name, 0)
+                types[name] = type_names
+            for type_name in type_names:
+                properties[type_name] = properties.get(type_name, 0) | mask
+        lengths = {}
+        sites = {}
+        for name in names:
+            site = dictionary.rest_dict[name]['site']
+            lengths[len(site)] = lengths.get(len(site), 0) | bits[name]
+            site = canonical_site(site)
+            sites[site] = sites.get(site, 0) | bits[name]
+        _index = {'names': names,
+                  'bits': bits,
+                  'suppliers': suppliers,
+                  'properties': properties,
+                  'lengths': lengths,
+                  'sites': sites,
+                  'types': types}
+    return _index
+
+# Types of an enzyme (e.g. ('Palindromic', 'OneCut', 'Ov5', ...)), an empty
+# tuple if it is not in the dictionary
+def enzyme_types(name):
+    return enzyme_index()['types'].get(name, ())
+
+# Enzymes (as a bitset) that are sold by any of the suppliers (all enzymes
+# if suppliers is None), have all of the properties, none of the excluded
+# properties and, if site_lengths is given, a site of one of these lengths.
+# Unknown supplier codes and properties raise KeyError.
+def query_bits(suppliers=None, properties=(), excluded=(), site_lengths=None):
+    index = enzyme_index()
+    mask = (1 << len(index['names'])) - 1
+    if suppliers is not None:
+        sold = 0
+        for supplier in suppliers:
+            sold |= index['suppliers'][supplier]
+        mask &= sold
+    for prop in properties:
+        mask &= index['properties'][prop]
+    for prop in excluded:
+        mask &= ~index['properties'][prop]
+    if site_lengths is not None:
+        lengths = 0
+        for length in site_lengths:
+            lengths |= index['lengths'].get(length, 0)
+        mask &= lengths
+    return mask
+
+# Names of the enzymes in a bitset (sorted)
+def bits_to_names(mask):
+    names = enzyme_index()['names']
+    result = []
+    while mask:
+        low = mask & -mask
+        result.append(names[low.bit_length() - 1])
+        mask ^= low
+    return result
+
+# Names of the enzymes that match a query (see query_bits())
+def query(suppliers=None, properties=(), excluded=(), site_lengths=None):
+    return bits_to_names(query_bits(suppliers, properties, excluded, site_lengths))
+
+# REBASE may write the site of a non-palindromic enzyme on either strand,
+# so enzymes are compared by their canonical site: the site or its reverse
+# complement, whichever comes first alphabetically.
+def canonical_site(site):
+    try:
+        from . import scan
+    except ImportError:
+        import scan
+    site = site.upper()
+    if '|' in site:
+        return site
+    return min(site, scan.reverse_complement(site))
+
+# Cut positions of an enzyme relative to its canonical site: a sorted tuple
+# of (top strand cut, bottom strand cut) pairs, both counted from the start
+# of the site on the top strand (see fragments.py). None if the cut
+# positions are unknown.
+def cut_signature(name):
+    data = rest_dict()[name]
+    site = data['site'].upper()
+    if data['fst5'] is None or data['fst3'] is None or '|' in site:
+        return None
+    reverse = canonical_site(site) != site
+    pairs = []
+    for top, bottom in [(data['fst5'], data['fst3']), (data['scd5'], data['scd3'])]:
+        if top is None or bottom is None:
+            continue
+        if reverse:
+            # The enzyme's top strand is the bottom strand of the canonical site
+            pairs.append((-bottom, len(site) - top))
+        else:
+            pairs.append((top, len(site) + bottom))
+    return tuple(sorted(pairs))
+
+# Enzymes that recognize the same site as an enzyme (a name in
+# Restriction_Dictionary): (isoschizomers, which also cut at the same
+# positions, neoschizomers, which cut elsewhere or whose cut positions
+# are unknown). Both lists are sorted and don't contain the enzyme itself.
+def schizomers(name):
+    index = enzyme_index()
+    mask = index['sites'][canonical_site(rest_dict()[name]['site'])] & ~index['bits'][name]
+    signature = cut_signature(name)
+    isoschizomers = []
+    neoschizomers = []
+    for other in bits_to_names(mask):
+        if signature is not None and cut_signature(other) == signature:
+            isoschizomers.append(other)
+        else:
+            neoschizomers.append(other)
+    return isoschizomers, neoschizomers
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+#
+# Regions of a sequence from the features of a GenBank record.
+#
+# Example: regions = features.find_regions(record, ['MCS', '396..454'])
+#          index = features.FeatureIndex([(start, end, 'MCS') for start, end in regions['MCS']], length, circular)
+#          index.cut(400)   # the labels of the intervals the cut after base 400 is in
+#
+# A region is given as the type of features (e.g. CDS, rep_origin), the
+# name of a feature (its label, gene, product, ... see
+# sequence.name_qualifiers), compared without case, or as coordinates
+# (START..END, 1-based and inclusive; START > END wraps around the origin
+# of a circular sequence).
+#
+# FeatureIndex is an interval index: the boundaries of all intervals cut
+# the sequence into elementary segments, and every segment has the labels
+# of the intervals that cover it. A position is looked up with one binary
+# search over the boundaries, so the cut positions of all enzymes are
+# tested in O(log n) each, however many (nested or overlapping) features
+# there are.
+import sys, bisect
+
+# Coordinates (START..END) of a region, None if it isn't given as
+# coordinates
+def parse_range(region):
+    bounds = region.split('..')
+    if len(bounds) != 2 or not all(bound.strip().isdigit() for bound in bounds):
+        return None
+    return int(bounds[0]), int(bounds[1])
+
+# The intervals of regions in a record (see sequence.read_sequences()):
+# {region: [(start, end)]}. Regions without any feature have no
+# intervals. START > END only for circular records.
+def find_regions(record, regions):
+    length = len(record['sequence'])
+    result = {}
+    for region in regions:
+        coordinates = parse_range(region)
+        if coordinates is not None:
+            if min(coordinates) < 1 or max(coordinates) > length:
+                sys.exit("Region " + region + " is outside of " + record['name'] + " (" + str(length) + " bp)!")
+            if coordinates[0] > coordinates[1] and not record.get('circular'):
+                sys.exit("Region " + region + " wraps around the origin, but " + record['name'] + " is linear!")
+            result[region] = [coordinates]
+            continue
+        key = region.lower()
+        result[region] = [part for feature in record.get('features', ())
+                          if key in (feature['type'].lower(), feature['name'].lower())
+                          for part in feature['parts']]
+    return result
+
+class FeatureIndex:
+    # intervals: (start, end, label), 1-based and inclusive
+    def __init__(self, intervals, length, circular=False):
+        self.length = length
+        self.circular = circular
+        split = []
+        for start, end, label in intervals:
+            if start > end and circular:
+                # Across the origin
+                split.append((start, length, label))
+                split.append((1, end, label))
+            elif start <= end:
+                split.append((start, end, label))
+        # Segment i goes from boundaries[i] to boundaries[i + 1] - 1
+        self.boundaries = sorted(set(start for start, end, label in split) | set(end + 1 for start, end, label in split))
+        covering = [[] for boundary in self.boundaries]
+        for start, end, label in split:
+            for segment in range(bisect.bisect_left(self.boundaries, start), bisect.bisect_left(self.boundaries, end + 1)):
+                if label not in covering[segment]:
+                    covering[segment].append(label)
+        self.covering = [tuple(labels) for labels in covering]
+
+    # The labels of the intervals that contain a base (1-based)
+    def at(self, position):
+        segment = bisect.bisect_right(self.boundaries, position) - 1
+        if segment < 0:
+            return ()
+        return self.covering[segment]
+
+    # The labels of the intervals that contain a cut after base position
+    # (as in fragments.py): both bases next to the cut are in the interval
+    def cut(self, position):
+        after = position + 1
+        if after > self.length:
+            if not self.circular:
+                return ()
+            after = 1
+        following = self.at(after)
+        return tuple(label for label in self.at(position) if label in following)
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+#
+# Fragment sizes of a digest.
+#
+# Example: fragments.digest_fragments(sequence, ['EcoRI', 'HindIII'], circular=True)
+#
+# The sites of the enzymes are found with scan.py, the cut positions are
+# calculated from the cut positions of the enzymes in Restriction_Dictionary
+# (fst5: cut in the top strand, counted from the start of the site; fst3:
+# cut in the bottom strand, counted from the end of the site; scd5/scd3:
+# second cut of enzymes that cut on both sides of their site). A cut
+# position c means that the top strand is cut after base c (1-based), i.e.
+# between the bases c and c + 1. The fragment sizes are calculated from the
+# cuts in the top strand.
+#
+# The cut positions of every enzyme are sorted, so the cut positions of a
+# multiple digest are combined by merging the sorted lists (heapq.merge),
+# in linear time.
+import heapq
+
+from . import enzymes
+
+# Top strand cut positions of an enzyme (its entry in rest_dict) for a site
+# found at position (0-based start on the top strand) on strand 1 or -1
+def site_cuts(data, position, strand):
+    cuts = []
+    for top, bottom in [(data['fst5'], data['fst3']), (data['scd5'], data['scd3'])]:
+        if top is None or bottom is None:
+            continue
+        if strand == 1:
+            cuts.append(position + top)
+        else:
+            # The enzyme sits on the bottom strand: its bottom strand cut
+            # is in the top strand
+            cuts.append(position - bottom)
+    return cuts
+
+# Sorted cut positions of an enzyme in a sequence of the given length.
+# hits are the sites found by scan.py. Cuts outside of a linear sequence
+# are left out, cuts in a circular sequence are counted across the origin.
+def cut_positions(data, hits, length, circular):
+    positions = set()
+    for position, strand in hits:
+        for cut in site_cuts(data, position, strand):
+            if circular:
+                # A cut between the last and the first base is after base length
+                positions.add((cut - 1) % length + 1)
+            elif 0 < cut < length:
+                positions.add(cut)
+    return sorted(positions)
+
+# Merge sorted lists of cut positions (without duplicates)
+def merge_cuts(cut_lists):
+    merged = []
+    for cut in heapq.merge(*cut_lists):
+        if not merged or merged[-1] != cut:
+            merged.append(cut)
+    return merged
+
+# Fragment sizes (in the order of the fragments in the sequence) for sorted
+# cut positions. A circular sequence without cuts stays one (circular)
+# molecule; the first fragment of a cut circular sequence is the one that
+# starts at the first cut.
+def fragment_sizes(cuts, length, circular):
+    if not cuts:
+        return [length]
+    sizes = [cuts[i + 1] - cuts[i] for i in range(len(cuts) - 1)]
+    if circular:
+        sizes.append(length - cuts[-1] + cuts[0])
+    else:
+        sizes = [cuts[0]] + sizes + [length - cuts[-1]]
+    return sizes
+
+# Cut a sequence with the enzymes. The enzyme names may be NEB names (e.g.
+# EcoRI-HF (reg)). host is the host the DNA was isolated from (see
+# methylation.py); sites blocked by its methylation are not cut. Returns
+# a dictionary with the keys
+# - 'length', 'circular', 'host'
+# - 'cuts': {enzyme: sorted cut positions}
+# - 'sites': {enzyme: number of sites that can be cut}
+# - 'blocked': {enzyme: number of sites blocked by methylation}
+# - 'fragments': fragment sizes in the order of the fragments
+# - 'unknown': enzymes that are not in Restriction_Dictionary (they are
+#   left out)
+# If index is the file name of a scan index (see scanindex.py) that has
+# the sequence, the sites are taken from it instead of searching them.
+def digest_fragments(sequence, enzyme_names, circular=False, host=None, index=None):
+    from . import scan, methylation
+    rest_dict = enzymes.rest_dict()
+    found = {}
+    unknown = []
+    for name in enzyme_names:
+        key = enzymes.dictionary_name(name)
+        if key is None or rest_dict[key]['fst5'] is None or '|' in rest_dict[key]['site']:
+            unknown.append(name)
+        else:
+            found[name] = key
+    # The methylation motifs are searched in the same pass as the sites
+    motifs = methylation.host_motifs(host)
+    sites = [rest_dict[key]['site'] for key in found.values()] + motifs
+    indexed = None
+    if index is not None:
+        from . import scanindex
+        indexed = scanindex.lookup(index, sequence, circular, sites)
+    if indexed is not None:
+        by_site, max_length = indexed
+    else:
+        scanner = scan.scanner_for(sites)
+        by_site = dict(zip(scanner.sites, scanner.scan(sequence, circular)))
+        max_length = scanner.max_length
+    length = len(sequence)
+    methylated = methylation.methylated_bases(host, by_site, length, circular, max_length)
+    cuts = {}
+    sites = {}
+    blocked = {}
+    for name, key in found.items():
+        site = rest_dict[key]['site'].upper()
+        open_sites, blocked_sites = methylation.split_blocked(key, len(site), by_site[site], methylated)
+        cuts[name] = cut_positions(rest_dict[key], open_sites, length, circular)
+        sites[name] = len(open_sites)
+        blocked[name] = len(blocked_sites)
+    return {'length': length,
+            'circular': circular,
+            'host': host,
+            'cuts': cuts,
+            'sites': sites,
+            'blocked': blocked,
+            'fragments': fragment_sizes(merge_cuts(cuts.values()), length, circular),
+            'unknown': unknown}
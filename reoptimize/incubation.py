@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+#
+# Incubation time versus enzyme amount.
+#
+# Example: reoptimize incubation plate.jsonl --minimize time --max-volume 1
+#          reoptimize incubation -e 'EcoRI 2' 'HindIII 1' --minimize enzyme
+#
+# The longer a digest runs, the fewer units it needs (see
+# reoptimize.enzyme_units(): the survival regressions above 1 hour and the
+# time-saver interpolation below 1 hour). The digests of a plate are
+# incubated together, so they share the incubation time. For every enzyme
+# of every digest, the units are calculated for a grid of incubation times
+# in one pass over the grid, and summed up over the plate. Then the time
+# with the fewest units of all enzymes together (--minimize enzyme) or the
+# shortest time (--minimize time) is chosen, at which no enzyme needs more
+# than --max-volume µl. The volumes are calculated for the most
+# concentrated product that NEB sells (enzyme_concentration in the
+# database). At the chosen time, the least concentrated product that
+# stays within the volume is used.
+#
+# The units are those needed in the best possible buffer of a digest (or,
+# for sequential digests, in the buffer in which the enzyme is most
+# active). Below 1 hour, times at which the time-saver interpolation gives
+# fewer units than a 1-hour digest (it does for large amounts of DNA) are
+# outside the range of the regression and are never chosen. The digests are read one by one and
+# only the sums for every time of the grid are kept, so plates of any
+# size can be swept.
+import sys, math, operator
+
+from . import reoptimize
+
+# Default time grid (in minutes)
+min_minutes = 5
+max_minutes = 16 * 60
+step_minutes = 1
+# Default maximum volume of an enzyme (in µl)
+max_volume = 1
+
+# The incubation times of the grid (in hours)
+def time_grid(start=min_minutes, stop=max_minutes, step=step_minutes):
+    if start <= 0 or stop < start or step <= 0:
+        sys.exit("The time grid must start above 0 and end after its start!")
+    return [minutes / 60 for minutes in range(start, stop + 1, step)]
+
+# Units of an enzyme (unit_parameters of a records.EnzymeRecord) for all
+# incubation times: the same calculation as reoptimize.enzyme_units(),
+# with the part that doesn't depend on the time done once
+def unit_curve(parameters, times):
+    microgram, number_of_restriction_sites, length, assay_DNA, assay_DNA_cuts, survival, timesaver, enzyme_concentration = parameters
+    units = microgram * int(number_of_restriction_sites) * reoptimize.assay_DNA_length[assay_DNA] / (length * assay_DNA_cuts)
+    regression = reoptimize.survival_regression.get(survival)
+    if timesaver != '':
+        timesaver = timesaver / 60
+        mm = (enzyme_concentration - units) / (timesaver - 1)
+        bb = units - mm
+    curve = []
+    for time in times:
+        if time >= 1:
+            if regression is None:
+                curve.append(units)
+            else:
+                a, b, c = regression
+                curve.append(units * ((a * time + b) / (time + c)))
+        elif timesaver != '':
+            curve.append(mm * time + bb)
+        else:
+            curve.append(units / time)
+    return curve
+
+# unit_curve() with infinite units at the times outside the range of the
+# regression (see above)
+def usable_curve(parameters, times):
+    one_hour = unit_curve(parameters, [1])[0]
+    return [units if units > 0 and (time >= 1 or units >= one_hour) else math.inf for time, units in zip(times, unit_curve(parameters, times))]
+
+# Factor for the units of an enzyme in the buffer of a digest (100 / %
+# activity), and the buffer (None for sequential digests)
+def buffer_factor(plan, record):
+    if plan.possible_buffers:
+        buffer = plan.possible_buffers[0][0]
+        return 100 / record.activity(buffer), buffer
+    best = max((activity for activity in record.activities if activity is not None), default=0)
+    return (100 / best if best > 0 else 1), None
+
+# The least concentrated product that needs at most max_volume µl
+# (the most concentrated one if none does)
+def choose_concentration(units, concentrations, max_volume=max_volume):
+    for concentration in concentrations:
+        if units / concentration <= max_volume:
+            return concentration
+    return concentrations[-1]
+
+# Sweep the incubation times for the digests of a plate (candidates:
+# (label, plan) pairs, plans of reoptimize.plan_digest()). minimize is
+# 'enzyme' (fewest units of all enzymes together) or 'time'. Returns a
+# dictionary with 'minimize', 'max_volume', 'feasible', 'hours',
+# 'minutes', 'total_units', 'enzymes' (units of every enzyme on the whole
+# plate) and 'digests': for every digest its 'id', 'buffer' and for every
+# enzyme the 'units', the 'concentration' (units/µl) and the
+# 'microliter'. If no time of the grid keeps all volumes within
+# max_volume, 'feasible' is False and the time with the smallest excess
+# is given (the digests show which enzymes need more).
+def sweep(candidates, times=None, max_volume=max_volume, minimize='enzyme'):
+    if minimize not in ('enzyme', 'time'):
+        sys.exit("Unknown objective " + str(minimize) + ", use enzyme or time")
+    if times is None:
+        times = time_grid()
+    totals = [0.0] * len(times)
+    # For every time the largest volume of an enzyme, relative to max_volume
+    worst = [0.0] * len(times)
+    digests = []
+    for label, plan in candidates:
+        enzymes = []
+        buffer = None
+        for name, record in sorted(plan.enzymes.items()):
+            factor, buffer = buffer_factor(plan, record)
+            curve = [units * factor for units in usable_curve(record.unit_parameters, times)]
+            totals = list(map(operator.add, totals, curve))
+            limit = record.concentrations[-1] * max_volume
+            worst = list(map(max, worst, (units / limit for units in curve)))
+            enzymes.append((name, factor, record.unit_parameters, record.concentrations))
+        digests.append((label, buffer, enzymes))
+    result = {'minimize': minimize, 'max_volume': max_volume, 'feasible': False}
+    if not digests or min(worst) == math.inf:
+        return result
+    allowed = [index for index in range(len(times)) if worst[index] <= 1]
+    if not allowed:
+        chosen = min(range(len(times)), key=lambda index: (worst[index], index))
+    elif minimize == 'time':
+        chosen = allowed[0]
+    else:
+        chosen = min(allowed, key=lambda index: (totals[index], index))
+    hours = times[chosen]
+    result.update({'feasible': bool(allowed),
+                   'hours': hours,
+                   'minutes': round(hours * 60),
+                   'total_units': totals[chosen],
+                   'enzymes': {},
+                   'digests': []})
+    for label, buffer, enzymes in digests:
+        digest = {'id': label, 'buffer': buffer, 'enzymes': {}}
+        for name, factor, parameters, concentrations in enzymes:
+            units = unit_curve(parameters, [hours])[0] * factor
+            concentration = choose_concentration(units, concentrations, max_volume)
+            digest['enzymes'][name] = {'units': units, 'concentration': concentration, 'microliter': units / concentration}
+            result['enzymes'][name] = result['enzymes'].get(name, 0) + units
+        result['digests'].append(digest)
+    return result
+
+def format_minutes(minutes):
+    if minutes < 60:
+        return str(minutes) + " min"
+    return str(minutes // 60) + " h" + (" " + str(minutes % 60) + " min" if minutes % 60 else "")
+
+def print_sweep(result):
+    if 'hours' not in result:
+        print("No digest to sweep.")
+        return
+    if result['feasible']:
+        what = "fewest units" if result['minimize'] == 'enzyme' else "shortest time"
+        print("Incubation time (" + what + " with at most " + str(result['max_volume']) + " µl of every enzyme): " + format_minutes(result['minutes']))
+    else:
+        print("No incubation time of the grid keeps every enzyme within " + str(result['max_volume']) + " µl. Closest: " + format_minutes(result['minutes']))
+    print("Units of all enzymes: " + str(round(result['total_units'], 2)))
+    for name, units in sorted(result['enzymes'].items()):
+        print("  %-14s %10.2f units" % (name, units))
+    for digest in result['digests']:
+        over = [name for name, value in digest['enzymes'].items() if value['microliter'] > result['max_volume']]
+        if not result['feasible'] and not over:
+            continue
+        print(str(digest['id']) + (" (" + digest['buffer'] + "): " if digest['buffer'] else " (sequential digest): ") + ' '.join(name + ": " + str(round(value['units'], 2)) + " units = " + str(round(value['microliter'], 3)) + " µl of " + str(value['concentration']) + " units/µl" for name, value in digest['enzymes'].items()))
+
+def run(argv=None):
+    import argparse, json, contextlib
+    from . import batch
+    parser = argparse.ArgumentParser(prog='reoptimize incubation', description='Find the incubation time with the fewest units of enzyme (or the shortest time) for a digest or a plate of digests, at which no enzyme needs more than --max-volume µl.')
+    parser.add_argument('input', help='JSON lines file with the digests of the plate, as for reoptimize batch (default: stdin, unless -e is given)', nargs='?')
+    parser.add_argument('-e','--enzyme', help='Restriction enzymes of a single digest', nargs='+')
+    parser.add_argument('-m','--microgram', help='DNA amount of the single digest (in µg)', default=1, type=float)
+    parser.add_argument('-l','--length', help='Length of the target DNA of the single digest (in bp)', default=5000, type=int)
+    parser.add_argument('--minimize', help='Fewest units of all enzymes (default) or the shortest time', choices=['enzyme', 'time'], default='enzyme')
+    parser.add_argument('--max-volume', help='Maximum volume of every enzyme (default: %s µl)' % max_volume, default=max_volume, type=float)
+    parser.add_argument('--min-time', help='Shortest incubation time (default: %d min)' % min_minutes, default=min_minutes, type=int)
+    parser.add_argument('--max-time', help='Longest incubation time (default: %d min)' % max_minutes, default=max_minutes, type=int)
+    parser.add_argument('--step', help='Step of the time grid (default: %d min)' % step_minutes, default=step_minutes, type=int)
+    parser.add_argument('--database', help='Enzyme database file (default: $REOPTIMIZE_DATABASE or REsqlite3.db in the package directory)')
+    parser.add_argument('--json', help='Write the result as JSON', action='store_true')
+    args = parser.parse_args(argv)
+
+    times = time_grid(args.min_time, args.max_time, args.step)
+    if args.enzyme:
+        with contextlib.redirect_stdout(sys.stderr):
+            candidates = [('digest', reoptimize.plan_digest(args.enzyme, args.microgram, args.length, 1, args.database))]
+    else:
+        infile = open(args.input, encoding='utf-8') if args.input else sys.stdin
+        def planned():
+            for request, plan, error in batch.plan_batch(batch.read_requests(infile), args.database):
+                if error is not None:
+                    print("Digest " + str(request.get('id')) + " is left out: " + str(error), file=sys.stderr)
+                    continue
+                yield request['id'], plan
+        candidates = planned()
+    result = sweep(candidates, times, args.max_volume, args.minimize)
+    if not args.enzyme and args.input:
+        infile.close()
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+    else:
+        print_sweep(result)
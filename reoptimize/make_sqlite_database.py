@@ -1,26 +1,28 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*-
 #
-# Example: restriction.py digest -e EcoRI -e HindIII
+# Example: make_sqlite_database.py
+#
+# Fetches the data for all NEB restriction enzymes from the NEB web pages
+# and writes it into the sqlite database file REsqlite3.db. The work is
+# done in four stages (fetch, parse, FASTA scan, write), each of which is
+# a separate function, so that they can be run and benchmarked on their
+# own (see benchmarks/).
 #
 # glob => needed to specify filepattern *.gb when reading assay DNA sequences
-import os, urllib3, shutil, re, glob
+import os, shutil, re, glob, argparse
 # sqlite3 module to store the enzyme data in  local sqlite database file
 import sqlite3
 # Click module to implement the command line functionality
 
-# Use Biopython to calculate restriction enzyme frequencies
-# for the assay DNAs
-
-from Bio.Seq import Seq
-from Bio.Alphabet.IUPAC import IUPACAmbiguousDNA
-from Bio import Restriction
-from Bio import SeqIO
-from Bio.Restriction import *
-amb = IUPACAmbiguousDNA()
+try:
+    from . import profiling, metrics, database, snapshot
+except ImportError:
+    # Run as a script from within the package directory
+    import profiling, metrics, database, snapshot
 
-# To switch off warning due to unverified https request
-urllib3.disable_warnings()
+# urllib3 is only imported in the fetch stage (see http_pool()), so that
+# the parse, FASTA scan and write stages can be used without it
 
 DEBUG = True
 
@@ -28,12 +30,15 @@ DEBUG = True
 #limit = '10'
 #offset = '270'
 
+# All pages are fetched from here
+NEB_URL = 'https://www.neb.com'
+
 def debug_print(string):
     if DEBUG == False:
         print(string)
 
 # Test whether an enzyme is already in the database
-def is_duplicate(vendor, enzyme_name, enzyme_url):
+def is_duplicate(c, sqlcon, vendor, enzyme_name, enzyme_url):
     query = "SELECT COUNT(*) FROM restriction_enzyme WHERE vendor = '" + vendor + "' AND enzyme_name = '" + enzyme_name + "' AND enzyme_url = '" + enzyme_url + "'"
     try:
         c.execute(query)
@@ -112,6 +117,9 @@ def strip_HF_designation(string):
 # This is the name of the sqlite database file, that contains all the enzyme information
 sqlite_file='REsqlite3.db'
 
+# This is the FASTA file with the sequences of all assay DNAs
+assay_DNA_file = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'assay_DNAs.fasta')
+
 # Define survival classes (0 = unknown) for enzymes
 # NEB uses the +++/++/+/- designation which is not good
 # for mathematical operations
@@ -127,6 +135,11 @@ survival_list = {'+++': 8, '++': 4, '+': 2, '-': 1, '': 0}
 # activity: 0 to 100%
 # star activity: 1 = yes, 0 = no
 #
+# equivalent_enzyme: for every enzyme of Restriction_Dictionary (name in
+# upper case), the NEB enzymes that recognize the same site
+# relation: isoschizomer (same cut positions) or neoschizomer (different cut)
+# score: how well the NEB enzyme is characterized (number of known data fields)
+#
 textstring = '''DROP TABLE IF EXISTS `restriction_enzyme`\n
 CREATE TABLE `restriction_enzyme` (\
 `enzyme_id` mediumint(9) NOT NULL,\
@@ -178,94 +191,15 @@ CREATE TABLE `FastDigest buffer` (\
 `enzyme_id` mediumint(3) NOT NULL,\
 `activity` int(3),\
 `star_activity` BOOLEAN,\
- PRIMARY KEY (`enzyme_id`))\n'''
-
-sqlcon = sqlite3.connect(sqlite_file)
-c = sqlcon.cursor()
-for line in textstring.splitlines():
-    #print(text)
-    c.execute(line)
-    sqlcon.commit()
-
-# Get html page of complete list of NEB restriction enzymes
-http = urllib3.PoolManager()
-url = "https://www.neb.com/products/restriction-endonucleases"
-vendor = 'NEB'
-textstring = http.request('GET', url).data.decode('utf-8')
-
-# Count how many enzymes are inserted into the database
-count = 0
-# Flag to start/stop parsing the html file
-start = 0
-for line in textstring.splitlines():
-    # Start here to search
-    if line == "\t\t\t\tRestriction Endonucleases: A":
-        start = 1
-    # End the search here
-    elif line[-47:] == "Restriction Endonuclease Buffers &amp; Diluents":
-        start = 0
-    #If the first 70 characters of a line match
-    if (start == 1) and (line[:70] == "\t\t\t\t\t<span class=\"decorate order open\">Order</span><a href=\"/products/"):
-        enzyme_url = line[70:].split('">')
-        print('\n')
-        enzyme_name = enzyme_url[1][:-4]
-        enzyme_name = fix_enzyme_name(enzyme_name)
-        enzyme_url = "https://www.neb.com/products/" + enzyme_url[0]
-        # Test whether the enzyme is already in the database
-        if is_duplicate(vendor, enzyme_name, enzyme_url)[0] == True:
-            print(enzyme_url + ", " + enzyme_name + " is already in the database.")
-        # If the enzyme is not a duplicate, enter it into the database
-        else:
-            query = "INSERT INTO restriction_enzyme (enzyme_id, vendor, enzyme_name, enzyme_url) VALUES (" + str(count) + ", '" + vendor + "', '" + enzyme_name + "', '" + enzyme_url + "')"
-            try:
-                c.execute(query)
-                sqlcon.commit()
-                count += 1
-                print(str(count) + ". " + enzyme_url + ", " + enzyme_name)
-            except sqlcon.Error as err:
-                print("Error inserting enzyme " + enzyme_name + " to database. Error: " + str(err) + "\nQuery was: " + query)
-
-print(str(count) + " enzymes inserted into the database.")
-
-#
-# PART 3: Getting enzyme data for NEB restriction enzymes
-#
-# DATA SOURCES
-# Survival data: https://www.neb.com/tools-and-resources/usage-guidelines/restriction-endonucleases-survival-in-a-reaction
-# Frequency of restriction sites in assay DNA: https://www.neb.com/tools-and-resources/selection-charts/frequencies-of-restriction-sites
-# All other data: The specific enzyme page by NEB as listed in the sqlite "restriction_enzyme" table
-#
-# Uncomment if you don't want to download the whole data set
-#limit = '10'
-#offset = '0'
-#
-# Connect to database and retrieve all enzymes, for which we need to get the data
-try:
-    limit, offset
-except NameError:
-    query = "SELECT enzyme_id, enzyme_name, enzyme_url FROM restriction_enzyme"
-else:
-    query = "SELECT enzyme_id, enzyme_name, enzyme_url FROM restriction_enzyme LIMIT " + limit + " OFFSET " + offset
-try:
-    c.execute(query)
-    result = c.fetchall()
-except sqlcon.Error as err:
-    print("Error connecting to database. Error: " + str(err))
-
-# Count for how many enzymes data is retrieved and inserted into the database
-count_enzymes = 0
-count_buffer_entries = 0
-
-# Set all enzyme activities and star activity to 'unknown' (= -1)
-enzyme_activity = {'NEBuffer 1.1': [-1,-1], 'NEBuffer 2.1': [-1, -1], 'NEBuffer 3.1': [-1, -1], 'CutSmart® Buffer': [-1, -1], 'FastDigest buffer': [-1, -1], 'NEBuffer EcoRI': [-1, -1]}
-
-# Get the survival table from NEB
-url1 = 'https://www.neb.com/tools-and-resources/usage-guidelines/restriction-endonucleases-survival-in-a-reaction'
-survivaltext = http.request('GET', url1).data.decode('utf-8')
+ PRIMARY KEY (`enzyme_id`))\n
+DROP TABLE IF EXISTS `equivalent_enzyme`\n
+CREATE TABLE `equivalent_enzyme` (\
+`name` varchar(32) NOT NULL,\
+`enzyme_id` mediumint(9) NOT NULL,\
+`relation` varchar(12) NOT NULL,\
+`score` int(3),\
+ PRIMARY KEY (`name`, `enzyme_id`))\n'''
 
-# Get the timesaver table from NEB
-url1 = 'https://www.neb.com/tools-and-resources/selection-charts/time-saver-qualified-restriction-enzymes'
-timesavertext = http.request('GET', url1).data.decode('utf-8')
 
 # For these enzymes, do not attempt to retrieve assay DNA
 enzyme_blacklist_assay = ['McrBC']
@@ -279,14 +213,65 @@ enzyme_blacklist_frequency = []
 # For these enzymes, do not attempt to timesaver data
 enzyme_blacklist_timesaver = []
 
-for enzyme in result:
-    # Get html page for the specific enzyme
-    url = enzyme[2]
-    print("\n" + str(enzyme[0]) + ". " + enzyme[1] + ":")
-    textstring = http.request('GET', url).data.decode('utf-8')
-    #debug_print(textstring)
+# Create (or empty) all tables of the database
+def create_tables(c, sqlcon):
+    for line in textstring.splitlines():
+        #print(text)
+        c.execute(line)
+        sqlcon.commit()
+
+#
+# STAGE 1: FETCH
+#
+# Make the connection pool used for all requests
+def http_pool():
+    import urllib3
+    # To switch off warning due to unverified https request
+    urllib3.disable_warnings()
+    return urllib3.PoolManager()
+
+# Get a html page from the NEB web site
+def fetch_page(http, url):
+    data = http.request('GET', url).data
+    metrics.increment('reoptimize_builder_pages_fetched_total')
+    metrics.increment('reoptimize_builder_bytes_downloaded_total', len(data))
+    return data.decode('utf-8')
+
+#
+# STAGE 2: PARSE
+#
+# Get the names and urls of all enzymes from the html page of the complete
+# list of NEB restriction enzymes. Returns a list of (enzyme_name, enzyme_url).
+def parse_enzyme_list(textstring, base_url=NEB_URL):
+    enzymes = []
+    # Flag to start/stop parsing the html file
+    start = 0
+    for line in textstring.splitlines():
+        # Start here to search
+        if line == "\t\t\t\tRestriction Endonucleases: A":
+            start = 1
+        # End the search here
+        elif line[-47:] == "Restriction Endonuclease Buffers &amp; Diluents":
+            start = 0
+        #If the first 70 characters of a line match
+        if (start == 1) and (line[:70] == "\t\t\t\t\t<span class=\"decorate order open\">Order</span><a href=\"/products/"):
+            enzyme_url = line[70:].split('">')
+            enzyme_name = enzyme_url[1][:-4]
+            enzyme_name = fix_enzyme_name(enzyme_name)
+            enzyme_url = base_url + "/products/" + enzyme_url[0]
+            enzymes.append((enzyme_name, enzyme_url))
+    return enzymes
+
+# Get all data for one enzyme from its html page. enzyme is a row
+# (enzyme_id, enzyme_name, enzyme_url) of the restriction_enzyme table.
+def parse_enzyme_page(textstring, enzyme):
     previousline = ''
+    enzyme_buffer = ''
+    reaction_temperature = ''
     reaction_supplement = ''
+    assay_DNA = 'unknown'
+    # Set all enzyme activities and star activity to 'unknown' (= -1)
+    enzyme_activity = {'NEBuffer 1.1': [-1,-1], 'NEBuffer 2.1': [-1, -1], 'NEBuffer 3.1': [-1, -1], 'CutSmart® Buffer': [-1, -1], 'FastDigest buffer': [-1, -1], 'NEBuffer EcoRI': [-1, -1]}
     # If no notes are found ("\t\t<li id=\"note-", used below in code), assume that there is no star activity
     # except for special buffers
     enzyme_activity['NEBuffer 1.1'][1] = 0
@@ -400,105 +385,336 @@ for enzyme in result:
                 enzyme_concentration.append(int(m.group(2).split(',')[0]))
 
         previousline = line
-    #
-    # RETRIEVE SURVIVAL AFTER THE MAIN ENZYME PAGE HAS BEEN SCRAPED
-    #
+    return {'enzyme_buffer': enzyme_buffer,
+            'reaction_temperature': reaction_temperature,
+            'reaction_supplement': reaction_supplement,
+            'assay_DNA': assay_DNA,
+            'enzyme_activity': enzyme_activity,
+            'enzyme_concentration': enzyme_concentration}
+
+# Get the survival class (+++/++/+/-) of an enzyme from the NEB survival table
+def parse_survival(survivaltext, enzyme):
     if enzyme[1] in enzyme_blacklist_survival:
-        survival = ''
-    else:
-        matchline = "\t\t\t\t<td><a href=\"/products/" + enzyme[2].split("/")[-1] + "\">" + enzyme[1] + "</a></td><td>"
-        debug_print(matchline)
-        survival = ''
-        for line in survivaltext.splitlines():
-            # If the first 87 characters of the line match
-            if line[:len(matchline)] == matchline:
-                debug_print("survival matchline found:\n" + line)
-                re_result = re.search("(<td>)(\+*|-)(</td>)", line)
-                survival = re_result.group(2)
-    #
-    # RETRIVE TIME-SAVER STATUS AFTER THE MAIN ENZYME PAGE HAS BEEN SCRAPED
-    # https://www.neb.com/tools-and-resources/selection-charts/time-saver-qualified-restriction-enzymes
-    #
+        return ''
+    matchline = "\t\t\t\t<td><a href=\"/products/" + enzyme[2].split("/")[-1] + "\">" + enzyme[1] + "</a></td><td>"
+    debug_print(matchline)
+    survival = ''
+    for line in survivaltext.splitlines():
+        # If the first 87 characters of the line match
+        if line[:len(matchline)] == matchline:
+            debug_print("survival matchline found:\n" + line)
+            re_result = re.search("(<td>)(\+*|-)(</td>)", line)
+            survival = re_result.group(2)
+    return survival
+
+# Get the time-saver status (5 or 15 minutes) of an enzyme from the NEB table
+# https://www.neb.com/tools-and-resources/selection-charts/time-saver-qualified-restriction-enzymes
+def parse_timesaver(timesavertext, enzyme):
     if enzyme[1] in enzyme_blacklist_timesaver:
-        timesaver = ''
-    else:
-        matchline = "\t\t\t\t<td><a href=\"/products/" + enzyme[2].split("/")[-1] + "\">" + enzyme[1] + "</a></td><td>"
-        timesaver = ''
-        for line in timesavertext.splitlines():
-            # If the first 87 characters of the line match
-            if line[:len(matchline)] == matchline:
-                debug_print("timesaver matchline found:\n" + line)
-                re_result = re.search("(.gif\" alt=\"Digest in )(1*5)( minutes\" Title=\")", line)
-                timesaver = re_result.group(2)
+        return ''
+    matchline = "\t\t\t\t<td><a href=\"/products/" + enzyme[2].split("/")[-1] + "\">" + enzyme[1] + "</a></td><td>"
+    timesaver = ''
+    for line in timesavertext.splitlines():
+        # If the first 87 characters of the line match
+        if line[:len(matchline)] == matchline:
+            debug_print("timesaver matchline found:\n" + line)
+            re_result = re.search("(.gif\" alt=\"Digest in )(1*5)( minutes\" Title=\")", line)
+            timesaver = re_result.group(2)
+    return timesaver
 
-    #
-    # CALCULATE FREQUENCY DATA AFTER THE MAIN ENZYME PAGE HAS BEEN SCRAPED
-    # This function depends on biopython
-    #
+#
+# STAGE 3: FASTA SCAN
+#
+# Count the sites of all enzymes in Restriction_Dictionary in the assay
+# DNAs. This is done only once, since the same sequences are searched for
+# every enzyme. The sequences are read and searched piece by piece (see
+# sequence.stream_sequences() and scan.Scanner.scan_stream()), and all
+# sites are found in one pass. Like the NEB frequency tables, every
+# sequence is searched as circular. Returns {assay DNA: {site: number of
+# sites}}.
+def read_assay_DNAs(fasta_file=assay_DNA_file):
+    import itertools
+    try:
+        from . import enzymes, scan, sequence
+    except ImportError:
+        import enzymes, scan, sequence
+    sites = sorted(set(data['site'].upper() for data in enzymes.rest_dict().values() if '|' not in data['site']))
+    scanner = scan.scanner_for(sites)
+    assay_DNAs = {}
+    for number, pieces in itertools.groupby(sequence.stream_sequences(fasta_file), key=lambda item: item[0]):
+        first = next(pieces)
+        counts, length = scanner.count_stream(itertools.chain([first[3]], (item[3] for item in pieces)), True)
+        assay_DNAs[first[1]] = dict(zip(scanner.sites, counts))
+    return assay_DNAs
+
+# Calculate the number of sites of an enzyme in its assay DNA
+def count_sites(enzyme_name, assay_DNA, assay_DNAs):
+    try:
+        from . import enzymes
+    except ImportError:
+        import enzymes
+    frequency = ''
+    if enzyme_name in enzyme_blacklist_frequency:
+        return frequency
+    if assay_DNA in assay_DNAs:
+        stripped_enzyme = strip_HF_designation(enzyme_name)
+        print(stripped_enzyme)
+        name = enzymes.dictionary_name(stripped_enzyme)
+        if name is not None:
+            frequency = assay_DNAs[assay_DNA].get(enzymes.rest_dict()[name]['site'].upper(), '')
+    return frequency
 
-    # Read assay DNA sequences
-    assayDNA_list = enumerate(SeqIO.parse("assay_DNAs.fasta", "fasta"))
-    for index, seq_record in assayDNA_list:
-        #print(seq_record.id)
-        if seq_record.description.split()[1] == "circ.":
-            not_circular = True
-        else:
-            not_circular = False
-        if enzyme[1] in enzyme_blacklist_frequency:
-            frequency = ''
+#
+# STAGE 4: WRITE
+#
+# Insert the enzymes from the enzyme list into the restriction_enzyme table.
+# Returns how many enzymes were inserted.
+def insert_enzymes(c, sqlcon, enzymes, vendor='NEB'):
+    # Count how many enzymes are inserted into the database
+    count = 0
+    for enzyme_name, enzyme_url in enzymes:
+        print('\n')
+        # Test whether the enzyme is already in the database
+        if is_duplicate(c, sqlcon, vendor, enzyme_name, enzyme_url)[0] == True:
+            print(enzyme_url + ", " + enzyme_name + " is already in the database.")
+        # If the enzyme is not a duplicate, enter it into the database
         else:
-            if seq_record.id == assay_DNA:
-                my_seq = seq_record.seq
-                stripped_enzyme = strip_HF_designation(enzyme[1])
-                print(stripped_enzyme)
-                rb = RestrictionBatch([stripped_enzyme])
-                reldict = rb.search(my_seq, linear=False)
-                frequency = len(reldict[next(iter(reldict))])
-
-    # Print all enzyme data
-    print("number of " + enzyme[1]+ "-sites in " + assay_DNA + ": " + str(frequency))
-    print("buffer: " + enzyme_buffer + "\nreaction temperature: " + reaction_temperature, end="\n")
-    print("url: " + url)
-    print("assay DNA: " + assay_DNA)
-    print("other: " + reaction_supplement + "\n" if reaction_supplement != '' else '', end="")
-    print("enzyme activity: " + str(enzyme_activity))
-    print("survival: " + survival)
-    print("reaction temperature: " + reaction_temperature)
-    print("reaction supplement: " + reaction_supplement)
+            query = "INSERT INTO restriction_enzyme (enzyme_id, vendor, enzyme_name, enzyme_url) VALUES (" + str(count) + ", '" + vendor + "', '" + enzyme_name + "', '" + enzyme_url + "')"
+            try:
+                c.execute(query)
+                sqlcon.commit()
+                count += 1
+                metrics.increment('reoptimize_builder_rows_written_total')
+                print(str(count) + ". " + enzyme_url + ", " + enzyme_name)
+            except sqlcon.Error as err:
+                print("Error inserting enzyme " + enzyme_name + " to database. Error: " + str(err) + "\nQuery was: " + query)
+    return count
+
+# Write all data of one enzyme into the restriction_enzyme table and the
+# buffer tables. Returns the number of enzymes and buffer entries written.
+def write_enzyme_data(c, sqlcon, enzyme, data, survival, timesaver, frequency):
+    count_enzymes = 0
+    count_buffer_entries = 0
     conc = ''
-    enzyme_concentration.sort()
+    enzyme_concentration = sorted(data['enzyme_concentration'])
     for value in enzyme_concentration:
         conc += ',' + str(value)
-    print("enzyme concentration: " + conc)
-    print("timesaver: " + timesaver)
-
     # Update enzyme database with default buffer, assay DNA, survival after the whole text has been analyzed
-    query = "UPDATE restriction_enzyme SET default_buffer = '" + enzyme_buffer + "', assay_DNA = '" + assay_DNA + "', survival = " + str(survival_list[survival]) + ", assay_DNA_cuts = " + str(frequency) + ", reaction_temperature = " + reaction_temperature[:-2] + ", reaction_supplement = '" + reaction_supplement + "', enzyme_concentration = '" + conc + "', timesaver = '" + timesaver + "' WHERE enzyme_id = " + str(enzyme[0])
+    query = "UPDATE restriction_enzyme SET default_buffer = '" + data['enzyme_buffer'] + "', assay_DNA = '" + data['assay_DNA'] + "', survival = " + str(survival_list[survival]) + ", assay_DNA_cuts = " + str(frequency) + ", reaction_temperature = " + data['reaction_temperature'][:-2] + ", reaction_supplement = '" + data['reaction_supplement'] + "', enzyme_concentration = '" + conc + "', timesaver = '" + timesaver + "' WHERE enzyme_id = " + str(enzyme[0])
     try:
         c.execute(query)
         sqlcon.commit()
         count_enzymes += 1
+        metrics.increment('reoptimize_builder_rows_written_total')
     except sqlcon.Error as err:
         print("Error inserting enzyme " + enzyme[1] + " to database. Error: " + str(err) + "\nQuery was: " + query)
 
     # Loop through buffers to add all activity data to the individual buffer tables
-    for key, value in enzyme_activity.items():
+    for key, value in data['enzyme_activity'].items():
             debug_print(key + ": " + str(value))
             query = "INSERT INTO `" + key + "` (enzyme_id, activity, star_activity) VALUES (" + str(enzyme[0]) + ", " + str(value[0]) + ", " + str(value[1]) + ")"
             try:
                 c.execute(query)
                 sqlcon.commit()
                 count_buffer_entries += 1
+                metrics.increment('reoptimize_builder_rows_written_total')
             except sqlcon.Error as err:
                 print("Error inserting enzyme " + enzyme[1] + " into buffer list. Error: " + str(err) + "\nQuery was: " + query)
+    return count_enzymes, count_buffer_entries
+
+# Write the isoschizomers and neoschizomers of every enzyme in
+# Restriction_Dictionary that are in the database into the
+# equivalent_enzyme table, so that an enzyme NEB doesn't sell can be
+# replaced by an equivalent NEB enzyme with one lookup. Returns the number
+# of rows written.
+def write_equivalent_enzymes(c, sqlcon):
+    try:
+        from . import enzymes
+    except ImportError:
+        import enzymes
+    # How well every NEB enzyme is characterized: the number of data
+    # fields that are known and of buffers with activity data
+    c.execute("SELECT enzyme_id, enzyme_name, default_buffer, assay_DNA_cuts, survival, reaction_temperature, enzyme_concentration, timesaver FROM restriction_enzyme")
+    score = {}
+    names = {}
+    for row in c.fetchall():
+        score[row[0]] = sum(1 for value in row[2:] if value not in (None, '', 0))
+        names[row[0]] = row[1]
+    c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE '%uffer%'")
+    for buffer in [row[0] for row in c.fetchall()]:
+        c.execute("SELECT enzyme_id FROM `" + buffer + "` WHERE activity IS NOT NULL")
+        for row in c.fetchall():
+            if row[0] in score:
+                score[row[0]] += 1
+    # NEB enzymes by their name in Restriction_Dictionary
+    products = {}
+    for enzyme_id, enzyme_name in names.items():
+        name = enzymes.dictionary_name(enzyme_name)
+        if name is not None:
+            products.setdefault(name, []).append(enzyme_id)
+    rows = []
+    for name in sorted(enzymes.rest_dict()):
+        isoschizomers, neoschizomers = enzymes.schizomers(name)
+        for relation, equivalents in [('isoschizomer', [name] + isoschizomers), ('neoschizomer', neoschizomers)]:
+            for equivalent in equivalents:
+                for enzyme_id in products.get(equivalent, []):
+                    rows.append((name.upper(), enzyme_id, relation, score[enzyme_id]))
+    try:
+        c.executemany("INSERT INTO equivalent_enzyme (name, enzyme_id, relation, score) VALUES (?, ?, ?, ?)", rows)
+        sqlcon.commit()
+    except sqlcon.Error as err:
+        print("Error inserting equivalent enzymes into the database. Error: " + str(err))
+        return 0
+    metrics.increment('reoptimize_builder_rows_written_total', len(rows))
+    return len(rows)
 
-    # Reset enzyme activities to "unknown" for new enzyme in the next iteration
-    enzyme_activity = {'NEBuffer 1.1': [-1,-1], 'NEBuffer 2.1': [-1, -1], 'NEBuffer 3.1': [-1, -1], 'CutSmart® Buffer': [-1, -1], 'FastDigest buffer': [-1, -1], 'NEBuffer EcoRI': [-1, -1]}
+# Print all enzyme data
+def print_enzyme_data(enzyme, url, data, survival, timesaver, frequency):
+    conc = ''
+    for value in sorted(data['enzyme_concentration']):
+        conc += ',' + str(value)
+    print("number of " + enzyme[1]+ "-sites in " + data['assay_DNA'] + ": " + str(frequency))
+    print("buffer: " + data['enzyme_buffer'] + "\nreaction temperature: " + data['reaction_temperature'], end="\n")
+    print("url: " + url)
+    print("assay DNA: " + data['assay_DNA'])
+    print("other: " + data['reaction_supplement'] + "\n" if data['reaction_supplement'] != '' else '', end="")
+    print("enzyme activity: " + str(data['enzyme_activity']))
+    print("survival: " + survival)
+    print("reaction temperature: " + data['reaction_temperature'])
+    print("reaction supplement: " + data['reaction_supplement'])
+    print("enzyme concentration: " + conc)
+    print("timesaver: " + timesaver)
 
-print("Data for " + str(count_enzymes) + "/" + str(count_buffer_entries) + " enzymes inserted into db_ddcut database.")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fetch the data for all NEB restriction enzymes and write it into the sqlite database file.')
+    parser.add_argument('-o','--output', help='Database file (default: REsqlite3.db)', default=sqlite_file)
+    parser.add_argument('-u','--url', help='Fetch all pages from this web site (default: ' + NEB_URL + ')', default=NEB_URL)
+    parser.add_argument('-f','--fasta', help='FASTA file with the assay DNA sequences', default=assay_DNA_file)
+    parser.add_argument('--profile', help='Print the time spent in the fetch, parse, FASTA scan and write stages', action='store_true')
+    parser.add_argument('--profile-output', help='Write cProfile data (for pstats) to this file', metavar='FILE')
+    parser.add_argument('--metrics', help='Write metrics (pages fetched, bytes downloaded, parse failures, rows written, stage times) to this file', metavar='FILE')
+    args = parser.parse_args(argv)
+
+    if args.metrics:
+        metrics.enable()
+    timer = profiling.StageTimer(args.profile or args.metrics, args.profile_output, 'reoptimize_builder_stage_seconds')
+    timer.start()
+
+    # The database is built in a temporary file, which replaces the
+    # database file only when it is complete (see database.publish())
+    temporary_file = database.temporary_name(args.output)
+    if os.path.exists(temporary_file):
+        os.remove(temporary_file)
+    with timer.stage('write'):
+        sqlcon = sqlite3.connect(temporary_file)
+        c = sqlcon.cursor()
+        create_tables(c, sqlcon)
+
+    # Get html page of complete list of NEB restriction enzymes
+    http = http_pool()
+    url = args.url + "/products/restriction-endonucleases"
+    vendor = 'NEB'
+    with timer.stage('fetch'):
+        textstring = fetch_page(http, url)
+    with timer.stage('parse'):
+        enzymes = parse_enzyme_list(textstring, args.url)
+    with timer.stage('write'):
+        count = insert_enzymes(c, sqlcon, enzymes, vendor)
+
+    print(str(count) + " enzymes inserted into the database.")
 
+    #
+    # PART 3: Getting enzyme data for NEB restriction enzymes
+    #
+    # DATA SOURCES
+    # Survival data: https://www.neb.com/tools-and-resources/usage-guidelines/restriction-endonucleases-survival-in-a-reaction
+    # Frequency of restriction sites in assay DNA: https://www.neb.com/tools-and-resources/selection-charts/frequencies-of-restriction-sites
+    # All other data: The specific enzyme page by NEB as listed in the sqlite "restriction_enzyme" table
+    #
+    # Uncomment if you don't want to download the whole data set
+    #limit = '10'
+    #offset = '0'
+    #
+    # Connect to database and retrieve all enzymes, for which we need to get the data
+    try:
+        query = "SELECT enzyme_id, enzyme_name, enzyme_url FROM restriction_enzyme LIMIT " + limit + " OFFSET " + offset
+    except NameError:
+        query = "SELECT enzyme_id, enzyme_name, enzyme_url FROM restriction_enzyme"
+    result = []
+    try:
+        c.execute(query)
+        result = c.fetchall()
+    except sqlcon.Error as err:
+        print("Error connecting to database. Error: " + str(err))
 
+    # Count for how many enzymes data is retrieved and inserted into the database
+    count_enzymes = 0
+    count_buffer_entries = 0
 
+    with timer.stage('fetch'):
+        # Get the survival table from NEB
+        url1 = args.url + '/tools-and-resources/usage-guidelines/restriction-endonucleases-survival-in-a-reaction'
+        survivaltext = fetch_page(http, url1)
 
+        # Get the timesaver table from NEB
+        url1 = args.url + '/tools-and-resources/selection-charts/time-saver-qualified-restriction-enzymes'
+        timesavertext = fetch_page(http, url1)
 
-sqlcon.close()
+    # Read assay DNA sequences
+    with timer.stage('fasta_scan'):
+        assay_DNAs = read_assay_DNAs(args.fasta)
+
+    for enzyme in result:
+        # Get html page for the specific enzyme
+        url = enzyme[2]
+        print("\n" + str(enzyme[0]) + ". " + enzyme[1] + ":")
+        with timer.stage('fetch'):
+            textstring = fetch_page(http, url)
+        with timer.stage('parse'):
+            try:
+                data = parse_enzyme_page(textstring, enzyme)
+                #
+                # RETRIEVE SURVIVAL AND TIME-SAVER STATUS AFTER THE MAIN ENZYME PAGE HAS BEEN SCRAPED
+                #
+                survival = parse_survival(survivaltext, enzyme)
+                timesaver = parse_timesaver(timesavertext, enzyme)
+            except (IndexError, AttributeError, ValueError) as err:
+                # The page doesn't look like expected, skip this enzyme
+                metrics.increment('reoptimize_builder_parse_failures_total')
+                print("Error parsing the page of enzyme " + enzyme[1] + " (" + url + "). Error: " + repr(err))
+                continue
+        #
+        # CALCULATE FREQUENCY DATA AFTER THE MAIN ENZYME PAGE HAS BEEN SCRAPED
+        #
+        with timer.stage('fasta_scan'):
+            frequency = count_sites(enzyme[1], data['assay_DNA'], assay_DNAs)
+
+        print_enzyme_data(enzyme, url, data, survival, timesaver, frequency)
+        with timer.stage('write'):
+            written = write_enzyme_data(c, sqlcon, enzyme, data, survival, timesaver, frequency)
+        count_enzymes += written[0]
+        count_buffer_entries += written[1]
+
+    print("Data for " + str(count_enzymes) + "/" + str(count_buffer_entries) + " enzymes inserted into db_ddcut database.")
+
+    # Isoschizomers and neoschizomers, from the sites in Restriction_Dictionary
+    with timer.stage('write'):
+        count_equivalents = write_equivalent_enzymes(c, sqlcon)
+    print(str(count_equivalents) + " isoschizomers/neoschizomers inserted into the database.")
+
+    sqlcon.close()
+    with timer.stage('write'):
+        database.publish(temporary_file, args.output)
+    print("Database written to " + args.output)
+    # The snapshot that the planner reads instead of the database
+    with timer.stage('write'):
+        snapshot_file = snapshot.write(args.output)
+    print("Snapshot written to " + snapshot_file)
+    timer.stop()
+    if args.profile or args.profile_output:
+        timer.report()
+    if args.metrics:
+        metrics.write(args.metrics)
+
+if __name__ == '__main__':
+    main()
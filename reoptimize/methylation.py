@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+#
+# Sites blocked by methylation.
+#
+# DNA from most E. coli strains is methylated by Dam (the A in GATC) and
+# Dcm (the second C in CCWGG), DNA from mammalian cells at CpG. A site of
+# an enzyme is blocked if it contains a base methylated by one of the
+# methylations the enzyme is sensitive to (see sensitivity). Enzymes
+# that are typed Meth_Dep in Restriction_Dictionary (their site can be
+# methylated) but are not in sensitivity are not blocked: a warning is
+# printed (once per enzyme) when one of their sites contains a methylated
+# base.
+#
+# The methylation motifs are searched together with the recognition sites
+# of the enzymes, in the same pass over the sequence (see scan.py).
+import sys
+
+# Methylation motifs: (site, positions of the methylated bases on both
+# strands, counted on the top strand from the start of the site)
+motifs = {'dam': ('GATC', (1, 2)),
+          'dcm': ('CCWGG', (1, 3)),
+          'cpg': ('CG', (0, 1))}
+
+# Bit of every methylation in methylated_bases()
+motif_bits = {'dam': 1, 'dcm': 2, 'cpg': 4}
+
+# Methylations that block the enzymes (when the methylated base is in
+# their site), after NEB's table of methylation sensitivity. Enzymes that
+# are only impaired are not blocked.
+sensitivity = {'AatII': ('cpg',), 'Acc65I': ('dcm', 'cpg'), 'AciI': ('cpg',),
+               'AclI': ('cpg',), 'AgeI': ('cpg',), 'AlwI': ('dam',),
+               'ApaI': ('dcm', 'cpg'), 'AscI': ('cpg',), 'AsiSI': ('cpg',),
+               'AvaI': ('cpg',), 'AvaII': ('dcm', 'cpg'), 'BamHI': (),
+               'BanI': ('dcm', 'cpg'), 'BclI': ('dam',), 'BglII': (),
+               'BsaAI': ('cpg',), 'BsaHI': ('cpg',), 'BsiWI': ('cpg',),
+               'BspHI': ('dam',), 'BsrFI': ('cpg',), 'BssHII': ('cpg',),
+               'BstUI': ('cpg',), 'ClaI': ('dam', 'cpg'), 'DpnII': ('dam',),
+               'EaeI': ('dcm', 'cpg'), 'EagI': ('cpg',), 'EcoO109I': ('dcm',),
+               'EcoRI': (), 'FseI': ('cpg',), 'HaeII': ('cpg',),
+               'HhaI': ('cpg',), 'HinP1I': ('cpg',), 'HindIII': (),
+               'HpaII': ('cpg',), 'HphI': ('dam', 'dcm'), 'Hpy188I': ('dam', 'cpg'),
+               'HpyCH4IV': ('cpg',), 'KasI': ('cpg',), 'KpnI': (),
+               'MboI': ('dam',), 'MboII': ('dam',), 'MluI': ('cpg',),
+               'MscI': ('dcm',), 'MspI': (), 'NaeI': ('cpg',), 'NcoI': (),
+               'NdeI': (), 'NgoMIV': ('cpg',), 'NlaIV': ('dcm', 'cpg'),
+               'NotI': ('cpg',), 'NruI': ('dam', 'cpg'), 'PaeR7I': ('cpg',),
+               'PmlI': ('cpg',), 'PpuMI': ('dcm',), 'PspGI': ('dcm',),
+               'PstI': (), 'PvuI': ('cpg',), 'RsrII': ('cpg',), 'SacI': (),
+               'SacII': ('cpg',), 'SalI': ('cpg',), 'Sau3AI': ('cpg',),
+               'Sau96I': ('dcm', 'cpg'), 'ScrFI': ('dcm',), 'SexAI': ('dcm',),
+               'SfoI': ('dcm', 'cpg'), 'SmaI': ('cpg',), 'SnaBI': ('cpg',),
+               'StyD4I': ('dcm',), 'TaqI': ('dam',), 'XbaI': ('dam',),
+               'XhoI': ('cpg',)}
+
+# Methylation of the DNA of a host
+hosts = {'none': (),
+         'ecoli': ('dam', 'dcm'),
+         'dam-dcm-': (),
+         'dam-': ('dcm',),
+         'dcm-': ('dam',),
+         'mammalian': ('cpg',)}
+
+_sensitive = None
+# Enzymes of unknown sensitivity that were warned about
+warned = set()
+
+# Enzymes whose sites can be methylated (Meth_Dep in typedict)
+def sensitive_enzymes():
+    global _sensitive
+    if _sensitive is None:
+        from . import enzymes
+        _sensitive = set(enzymes.query(properties=['Meth_Dep']))
+    return _sensitive
+
+# Sites of the methylation motifs of a host
+def host_motifs(host):
+    if host is None:
+        return []
+    if host not in hosts:
+        sys.exit("Unknown host " + str(host) + ". Hosts are: " + ', '.join(sorted(hosts)))
+    return [motifs[motif][0] for motif in hosts[host]]
+
+# Mark the methylated bases: returns a bytearray (the motif_bits of the
+# methylations of every base) of the
+# length of the sequence plus extra, so that sites across the origin of a
+# circular sequence can be looked up without wrapping around. by_site are
+# the hits of all sites found by scan.py ({site: [(position, strand)]}).
+def methylated_bases(host, by_site, length, circular, extra):
+    methylated = bytearray(length + extra)
+    if host is None:
+        return methylated
+    for motif in hosts[host]:
+        site, offsets = motifs[motif]
+        for position, strand in by_site[site]:
+            for offset in offsets:
+                base = position + offset
+                if circular:
+                    # Motifs across the origin methylate its first bases
+                    methylated[base % length] |= motif_bits[motif]
+                elif base < length:
+                    methylated[base] |= motif_bits[motif]
+    if circular and length > 0:
+        for base in range(extra):
+            methylated[length + base] = methylated[base % length]
+    return methylated
+
+# Split the hits of an enzyme into the sites that can be cut and the ones
+# blocked by methylation (see sensitivity)
+def split_blocked(name, site_length, hits, methylated):
+    if name not in sensitive_enzymes() and name not in sensitivity:
+        return hits, []
+    if name not in sensitivity:
+        if name not in warned and any(any(methylated[position:position + site_length]) for position, strand in hits):
+            warned.add(name)
+            print("Warning: it is not known which methylation blocks " + name + ", its methylated sites are counted as not blocked.", file=sys.stderr)
+        return hits, []
+    mask = sum(motif_bits[motif] for motif in sensitivity[name])
+    if not mask:
+        return hits, []
+    open_sites = []
+    blocked = []
+    for position, strand in hits:
+        if any(base & mask for base in methylated[position:position + site_length]):
+            blocked.append((position, strand))
+        else:
+            open_sites.append((position, strand))
+    return open_sites, blocked
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+#
+# Operational metrics (counters and latency histograms) for the planner
+# and the database builder.
+#
+# Metrics are collected only after enable() has been called. Until then,
+# increment() and observe() return immediately, so that the instrumented
+# code paths cost (almost) nothing when metrics aren't needed.
+#
+# The collected metrics can be exported in the Prometheus text format
+# (prometheus_text()) or as a JSON-serializable snapshot (snapshot()).
+#
+# Metric names used by reoptimize:
+#
+# Planner
+#   reoptimize_plans_total                    plans calculated
+#   reoptimize_digest_not_recommended_total   plans without a possible buffer
+#   reoptimize_enzyme_lookups_total           enzymes looked up in the database
+#   reoptimize_cache_hits_total{cache}        cache hits
+#   reoptimize_cache_misses_total{cache}      cache misses
+#   reoptimize_cache_hit_ratio{cache}         hits / (hits + misses) (gauge)
+#   reoptimize_plan_cache_errors_total        errors of the plan cache file
+#   reoptimize_snapshot_loads_total           catalogue snapshots loaded
+#   reoptimize_database_reloads_total         database file changed on disk
+#   reoptimize_connections_opened_total       connections opened by the pool
+#   reoptimize_plan_errors_total              plans that failed (e.g. unknown enzyme)
+#   reoptimize_stage_seconds{stage}           time per stage of a plan (histogram)
+#
+# Builder (make_sqlite_database.py)
+#   reoptimize_builder_pages_fetched_total
+#   reoptimize_builder_bytes_downloaded_total
+#   reoptimize_builder_parse_failures_total
+#   reoptimize_builder_rows_written_total
+#   reoptimize_builder_stage_seconds{stage}   time per stage (histogram)
+import threading
+
+enabled = False
+
+# Upper bounds of the histogram buckets (in seconds)
+latency_buckets = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# (name, labels) => value, where labels is a sorted tuple of (label, value)
+counters = {}
+# (name, labels) => [bucket counts (+ one for +Inf), sum, count]
+histograms = {}
+
+lock = threading.Lock()
+
+def enable():
+    global enabled
+    enabled = True
+
+def disable():
+    global enabled
+    enabled = False
+
+def reset():
+    with lock:
+        counters.clear()
+        histograms.clear()
+
+def increment(name, value=1, **labels):
+    if not enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with lock:
+        counters[key] = counters.get(key, 0) + value
+
+# Record a latency (in seconds)
+def observe(name, seconds, **labels):
+    if not enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with lock:
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = [[0] * (len(latency_buckets) + 1), 0.0, 0]
+        for i, bound in enumerate(latency_buckets):
+            if seconds <= bound:
+                histogram[0][i] += 1
+                break
+        else:
+            histogram[0][-1] += 1
+        histogram[1] += seconds
+        histogram[2] += 1
+
+# Value of a counter (0 if it was never incremented)
+def value(name, **labels):
+    return counters.get((name, tuple(sorted(labels.items()))), 0)
+
+# Hit ratio of every cache with hits or misses: {cache: ratio} (the
+# caller holds the lock)
+def hit_ratios():
+    totals = {}
+    for (name, labels), count in counters.items():
+        if name in ('reoptimize_cache_hits_total', 'reoptimize_cache_misses_total'):
+            total = totals.setdefault(dict(labels).get('cache', ''), [0, 0])
+            total[name == 'reoptimize_cache_misses_total'] += count
+    return {cache: hits / (hits + misses) for cache, (hits, misses) in sorted(totals.items()) if hits + misses}
+
+# All metrics as a dictionary that can be written as JSON
+def snapshot():
+    with lock:
+        result = {'counters': [], 'gauges': [], 'histograms': []}
+        for (name, labels), count in sorted(counters.items()):
+            result['counters'].append({'name': name, 'labels': dict(labels), 'value': count})
+        for cache, ratio in hit_ratios().items():
+            result['gauges'].append({'name': 'reoptimize_cache_hit_ratio', 'labels': {'cache': cache}, 'value': ratio})
+        for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+            result['histograms'].append({'name': name, 'labels': dict(labels),
+                                         'buckets': dict(zip([str(bound) for bound in latency_buckets] + ['+Inf'], cumulative(buckets))),
+                                         'sum': total, 'count': count})
+        return result
+
+def cumulative(buckets):
+    result = []
+    total = 0
+    for count in buckets:
+        total += count
+        result.append(total)
+    return result
+
+def format_labels(labels, extra=()):
+    labels = list(labels) + list(extra)
+    if not labels:
+        return ''
+    return '{' + ','.join(label + '="' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"' for label, value in labels) + '}'
+
+# All metrics in the Prometheus text exposition format
+def prometheus_text():
+    lines = []
+    with lock:
+        typed = set()
+        for (name, labels), count in sorted(counters.items()):
+            if name not in typed:
+                lines.append('# TYPE ' + name + ' counter')
+                typed.add(name)
+            lines.append(name + format_labels(labels) + ' ' + str(count))
+        ratios = hit_ratios()
+        if ratios:
+            lines.append('# TYPE reoptimize_cache_hit_ratio gauge')
+            for cache, ratio in ratios.items():
+                lines.append('reoptimize_cache_hit_ratio' + format_labels([('cache', cache)]) + ' ' + repr(ratio))
+        for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+            if name not in typed:
+                lines.append('# TYPE ' + name + ' histogram')
+                typed.add(name)
+            for bound, bucket_count in zip([str(bound) for bound in latency_buckets] + ['+Inf'], cumulative(buckets)):
+                lines.append(name + '_bucket' + format_labels(labels, [('le', bound)]) + ' ' + str(bucket_count))
+            lines.append(name + '_sum' + format_labels(labels) + ' ' + repr(total))
+            lines.append(name + '_count' + format_labels(labels) + ' ' + str(count))
+    return '\n'.join(lines) + '\n'
+
+# Write the metrics to a file. format is 'json' or 'prometheus'; if it
+# isn't given, it is guessed from the file name (.json => json).
+def write(filename, format=None):
+    import json
+    if format is None:
+        format = 'json' if filename.endswith('.json') else 'prometheus'
+    with open(filename, 'w', encoding='utf-8') as f:
+        if format == 'json':
+            json.dump(snapshot(), f, indent=2)
+            f.write('\n')
+        else:
+            f.write(prometheus_text())
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+#
+# Plan cache shared by the planner processes of a host.
+#
+# Example: reoptimize batch digests.jsonl --plan-cache ~/.cache/reoptimize-plans.db
+#          REOPTIMIZE_PLAN_CACHE=~/.cache/reoptimize-plans.db reoptimize -e 'EcoRI 2' 'HindIII 1'
+#
+# Plans of digests without a sequence only depend on the enzymes and
+# their numbers of sites, the DNA amount, the length, the time, whether
+# isoschizomers may be substituted, the objective (and the prices for the
+# cost objective) and the data in the database. These are hashed into a
+# key (see plan_key()); the database is represented by its catalogue
+# version (a hash of its content, see database.catalogue_version()). The
+# enzymes are sorted for the key, so 'EcoRI 2' 'HindIII 1' and 'HindIII 1'
+# 'EcoRI 2' share a plan (its enzymes are put into the requested order
+# when it is read).
+#
+# The plans are stored as JSON (only their data, see encode_plan(); the
+# records are made again when a plan is read) in an SQLite file in WAL
+# mode, so that
+# any number of processes can read it while one of them writes. Every
+# thread has its own connection. Plans older than ttl seconds are not
+# used, and when there are more than max_entries plans, the oldest are
+# removed. When a process sees a new catalogue version, it removes the
+# plans of all other versions, so use one cache file per database.
+# Errors of the cache (e.g. a locked or read-only file) are counted
+# (reoptimize_plan_cache_errors_total) and the plan is calculated as if
+# there was no cache.
+#
+# The hits and misses are counted as reoptimize_cache_hits_total and
+# reoptimize_cache_misses_total with cache="plans" (see metrics.py, which
+# also exports the hit ratio).
+#
+# Only use cache files that nobody else can write to: whoever can write
+# the file can change the plans that are used. Plans that can't be
+# decoded are counted as errors and calculated again.
+import os, threading
+
+from . import metrics, ranking, records
+
+# Plans are used for a week
+ttl = 7 * 24 * 3600
+max_entries = 100000
+# Remove old plans after this many new ones
+evict_every = 256
+# Seconds to wait for a lock on the cache file
+busy_timeout = 5
+
+# Cache file set with configure() (otherwise $REOPTIMIZE_PLAN_CACHE)
+cache_file = None
+caches = {}
+caches_lock = threading.Lock()
+
+def configure(filename):
+    global cache_file
+    cache_file = filename
+
+# The cache to use (None if there is none)
+def current():
+    filename = cache_file or os.environ.get('REOPTIMIZE_PLAN_CACHE')
+    if not filename:
+        return None
+    cache = caches.get(filename)
+    if cache is None:
+        with caches_lock:
+            cache = caches.setdefault(filename, PlanCache(filename))
+    return cache
+
+# Key of a plan. Returns None for requests that aren't cached (invalid
+# numbers of sites or objectives: the planner reports them).
+def plan_key(enzyme, microgram, length, time, version, substitute=False, objective=None, prices=None):
+    import json, hashlib
+    if version is None:
+        return None
+    if objective is None:
+        objective = ranking.default_objective
+    if objective not in ranking.objectives:
+        return None
+    items = []
+    for enzyme_item in enzyme:
+        enzyme_item = enzyme_item.split(' ')
+        if len(enzyme_item) < 2:
+            sites = 1
+        else:
+            try:
+                sites = int(enzyme_item[1])
+            except ValueError:
+                return None
+        items.append((enzyme_item[0][:32].upper(), sites))
+    canonical = [sorted(items), len(enzyme), microgram, length, time, version, bool(substitute), objective]
+    if objective == 'cost':
+        canonical.append(sorted((prices or {}).items()))
+    return hashlib.sha256(json.dumps(canonical).encode('utf-8')).hexdigest()
+
+# Put the enzymes of a plan into the order of the request (enzyme)
+def reorder(plan, enzyme):
+    names = {name.upper(): name for name in plan.enzymes}
+    for requested, used in plan.substitutions.items():
+        names.setdefault(requested.upper(), used)
+    order = [names.get(enzyme_item.split(' ')[0][:32].upper()) for enzyme_item in enzyme]
+    if None not in order and len(set(order)) == len(plan.enzymes) and order != list(plan.enzymes):
+        plan.enzymes = {name: plan.enzymes[name] for name in order}
+    return plan
+
+# The data of a plan (records.Plan, without a sequence) for JSON
+def encode_plan(plan):
+    enzyme_records = list(plan.enzymes.values())
+    sequential = None
+    if plan.sequential is not None:
+        sequential = dict(plan.sequential)
+        sequential['steps'] = [[step.action, step.enzymes, step.minutes, step.buffer, step.temperature, step.units] for step in plan.sequential['steps']]
+    return {'buffers': list(enzyme_records[0].buffers.names) if enzyme_records else [],
+            'enzymes': [[record.name, record.activities, record.star_activities, record.units, record.reaction_temperature, record.reaction_supplement, record.unit_parameters, record.concentrations] for record in enzyme_records],
+            'possible_buffers': plan.possible_buffers,
+            'how_many_enzymes': plan.how_many_enzymes,
+            'time': plan.time,
+            'sequential': sequential,
+            'fragments': plan.fragments,
+            'substitutions': plan.substitutions,
+            'profile': plan.profile}
+
+# The plan of the data of encode_plan()
+def decode_plan(data):
+    buffers = records.buffer_table(data['buffers'])
+    enzymes = {}
+    for name, activities, star_activities, units, temperature, supplement, parameters, concentrations in data['enzymes']:
+        record = enzymes[name] = records.EnzymeRecord(name, buffers)
+        if len(activities) != len(buffers) or len(star_activities) != len(buffers):
+            raise ValueError("Activities of " + name + " don't match the buffers")
+        record.activities = activities
+        record.star_activities = star_activities
+        record.units = units
+        record.reaction_temperature = temperature
+        record.reaction_supplement = supplement
+        record.unit_parameters = tuple(parameters) if parameters is not None else None
+        record.concentrations = tuple(concentrations)
+    sequential = data['sequential']
+    if sequential is not None:
+        sequential['steps'] = [records.Step(action, step_enzymes, minutes, buffer=buffer, temperature=temperature, units=units)
+                               for action, step_enzymes, minutes, buffer, temperature, units in sequential['steps']]
+    plan = records.Plan(enzymes, [(buffer, cumulative) for buffer, cumulative in data['possible_buffers']], data['how_many_enzymes'], data['time'],
+                        sequential=sequential, fragments=data['fragments'], substitutions=data['substitutions'])
+    plan.profile = data['profile']
+    return plan
+
+class PlanCache:
+    def __init__(self, filename, ttl=ttl, max_entries=max_entries):
+        self.filename = filename
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.local = threading.local()
+        self.stored = 0
+
+    # The connection of the calling thread
+    def connection(self):
+        sqlcon = getattr(self.local, 'sqlcon', None)
+        if sqlcon is None:
+            import sqlite3
+            sqlcon = sqlite3.connect(self.filename, timeout=busy_timeout)
+            sqlcon.execute('PRAGMA journal_mode = WAL')
+            sqlcon.execute('PRAGMA synchronous = NORMAL')
+            sqlcon.execute('CREATE TABLE IF NOT EXISTS plans (key TEXT PRIMARY KEY, version TEXT, created REAL, plan BLOB)')
+            sqlcon.execute('CREATE INDEX IF NOT EXISTS plans_created ON plans (created)')
+            sqlcon.commit()
+            self.local.sqlcon = sqlcon
+            self.local.version = None
+        return sqlcon
+
+    # Remove the plans of other catalogue versions the first time a
+    # version is seen
+    def check_version(self, sqlcon, version):
+        if self.local.version != version:
+            with sqlcon:
+                sqlcon.execute('DELETE FROM plans WHERE version != ?', (version,))
+            self.local.version = version
+
+    def error(self, err):
+        metrics.increment('reoptimize_plan_cache_errors_total')
+
+    # The plan stored under key (None if there is none or it is too old)
+    def get(self, key, version):
+        import sqlite3, json, time
+        try:
+            sqlcon = self.connection()
+            self.check_version(sqlcon, version)
+            row = sqlcon.execute('SELECT plan, created FROM plans WHERE key = ?', (key,)).fetchone()
+            if row is not None and time.time() - row[1] > self.ttl:
+                with sqlcon:
+                    sqlcon.execute('DELETE FROM plans WHERE key = ?', (key,))
+                row = None
+        except sqlite3.Error as err:
+            self.error(err)
+            return None
+        if row is None:
+            return None
+        try:
+            return decode_plan(json.loads(row[0]))
+        except (ValueError, TypeError, KeyError, AttributeError) as err:
+            self.error(err)
+            return None
+
+    def put(self, key, version, plan):
+        import sqlite3, json, time
+        try:
+            sqlcon = self.connection()
+            with sqlcon:
+                sqlcon.execute('INSERT OR REPLACE INTO plans (key, version, created, plan) VALUES (?, ?, ?, ?)', (key, version, time.time(), json.dumps(encode_plan(plan), ensure_ascii=False)))
+            self.stored += 1
+            if self.stored % evict_every == 0:
+                self.evict()
+        except sqlite3.Error as err:
+            self.error(err)
+
+    # Remove the plans that are too old, then the oldest plans above
+    # max_entries
+    def evict(self):
+        import time
+        sqlcon = self.connection()
+        with sqlcon:
+            sqlcon.execute('DELETE FROM plans WHERE created < ?', (time.time() - self.ttl,))
+            count = sqlcon.execute('SELECT COUNT(*) FROM plans').fetchone()[0]
+            if count > self.max_entries:
+                sqlcon.execute('DELETE FROM plans WHERE key IN (SELECT key FROM plans ORDER BY created LIMIT ?)', (count - self.max_entries,))
+
+    # The plan for a digest from the cache, or calculated by calculate()
+    # and stored
+    def plan(self, key, version, enzyme, calculate):
+        plan = self.get(key, version)
+        if plan is not None:
+            metrics.increment('reoptimize_cache_hits_total', cache='plans')
+            return reorder(plan, enzyme)
+        metrics.increment('reoptimize_cache_misses_total', cache='plans')
+        plan = calculate()
+        self.put(key, version, plan)
+        return plan
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+#
+# Plate mode: master mixes for a plate of digests.
+#
+# Example: reoptimize plate plate.jsonl --volume 50 --overage 10
+#
+# The plate map is the input of batch mode (one digest per line) with the
+# well ("well", default: the "id") and, for runs of several plates, the
+# plate ("plate", default: 1). The DNA of a well is added separately; its
+# volume is "microgram" / "dna_concentration" (ng/µl, default:
+# --dna-concentration).
+#
+# The wells are planned one by one and grouped by plate, buffer (the best
+# possible buffer of the digest), reaction temperatures and enzymes (the
+# enzymes of a digest can share a buffer but need different temperatures;
+# such wells are incubated at one temperature after the other, lowest
+# first, see sequential.py). Every group gets a master mix with, per well:
+# - the 10x buffer (a tenth of the reaction volume)
+# - every enzyme, as much as the well of the group that needs the most
+#   units (in the least concentrated product that needs at most
+#   --max-volume µl, see incubation.choose_concentration())
+# - water, so that the well with the most DNA is filled up to the reaction
+#   volume by its DNA
+# The recipe is for the wells of the group plus the overage. Every well
+# then gets the master mix, its DNA and the rest of the water. Digests
+# that need a sequential digest (or could not be planned) get no master
+# mix and are listed separately.
+#
+# Only the master mixes (sums and maxima) and a few numbers per well are
+# kept while the plate map is read, so plates of 384 wells and runs of
+# many plates are planned in one pass.
+import sys
+
+from . import incubation
+
+# Default reaction volume (µl), overage (%) and DNA concentration (ng/µl)
+reaction_volume = 50
+overage = 10
+dna_concentration = 100
+# Enzymes should not be more than 10% of the reaction volume (glycerol)
+max_enzyme_fraction = 0.1
+
+# The wells of a plate that share the buffer, the temperatures and the
+# enzymes
+class MasterMix:
+    __slots__ = ('plate', 'buffer', 'temperatures', 'enzymes', 'concentrations', 'supplements', 'units', 'wells', 'max_dna')
+
+    def __init__(self, plate, buffer, temperatures, enzymes, concentrations, supplements):
+        self.plate = plate
+        self.buffer = buffer
+        self.temperatures = temperatures
+        self.enzymes = enzymes
+        self.concentrations = concentrations
+        self.supplements = supplements
+        # The most units of every enzyme needed by a well of the mix
+        self.units = [0.0] * len(enzymes)
+        # (well, DNA volume) of every well
+        self.wells = []
+        self.max_dna = 0.0
+
+    def add(self, well, units, dna):
+        self.units = [max(a, b) for a, b in zip(self.units, units)]
+        self.wells.append((well, dna))
+        self.max_dna = max(self.max_dna, dna)
+
+# Collects the wells of a run (one or several plates)
+class PlateRun:
+    def __init__(self, volume=reaction_volume, overage=overage, dna_concentration=dna_concentration, max_volume=incubation.max_volume):
+        self.volume = volume
+        self.overage = overage
+        self.dna_concentration = dna_concentration
+        self.max_volume = max_volume
+        # Master mixes by (plate, buffer, temperatures, enzymes), in the
+        # order of their first well
+        self.mixes = {}
+        # Wells without a master mix: (plate, well, reason)
+        self.unassigned = []
+        self.wells = 0
+
+    # Add a planned digest (request and plan as yielded by
+    # batch.plan_batch(); plan is None and error the reason if it could
+    # not be planned)
+    def add(self, request, plan, error=None):
+        self.wells += 1
+        plate = str(request.get('plate', 1))
+        well = str(request.get('well', request.get('id')))
+        if error is not None:
+            self.unassigned.append((plate, well, str(error)))
+            return
+        if not plan.possible_buffers:
+            self.unassigned.append((plate, well, "needs a sequential digest"))
+            return
+        buffer = plan.possible_buffers[0][0]
+        names = tuple(sorted(plan.enzymes))
+        records = [plan.enzymes[name] for name in names]
+        temperatures = tuple(sorted(set(record.reaction_temperature for record in records)))
+        try:
+            dna = float(request.get('microgram', 1)) * 1000 / float(request.get('dna_concentration', self.dna_concentration))
+        except (TypeError, ValueError, ZeroDivisionError):
+            self.unassigned.append((plate, well, "invalid DNA amount or concentration"))
+            return
+        key = (plate, buffer, temperatures, names)
+        mix = self.mixes.get(key)
+        if mix is None:
+            supplements = sorted(set(record.reaction_supplement for record in records if record.reaction_supplement != ''))
+            mix = self.mixes[key] = MasterMix(plate, buffer, temperatures, names, [record.concentrations for record in records], supplements)
+        mix.add(well, [record.units * 100 / record.activity(buffer) for record in records], dna)
+
+    # The recipe of a master mix: dictionary with 'number', 'plate',
+    # 'buffer', 'temperatures', 'supplements', 'wells' (number), 'reactions'
+    # (with the overage), 'components' (name, µl per well, µl in the mix;
+    # enzymes also with 'units' per well and 'concentration'),
+    # 'microliter_per_well' (of the mix), 'enzyme_fraction' and 'fits'
+    # (False if the well with the most DNA doesn't fit into the volume)
+    def recipe(self, number, mix):
+        reactions = len(mix.wells) * (1 + self.overage / 100)
+        components = [{'name': '10x ' + mix.buffer, 'per_well': self.volume / 10}]
+        enzyme_volume = 0
+        for name, units, concentrations in zip(mix.enzymes, mix.units, mix.concentrations):
+            concentration = incubation.choose_concentration(units, concentrations, self.max_volume) if concentrations else None
+            microliter = units / concentration if concentration else None
+            components.append({'name': name, 'units': units, 'concentration': concentration, 'per_well': microliter})
+            enzyme_volume += microliter or 0
+        water = self.volume - self.volume / 10 - enzyme_volume - mix.max_dna
+        components.append({'name': 'water', 'per_well': max(water, 0)})
+        for component in components:
+            component['total'] = None if component['per_well'] is None else component['per_well'] * reactions
+        return {'number': number,
+                'plate': mix.plate,
+                'buffer': mix.buffer,
+                'temperatures': list(mix.temperatures),
+                'enzymes': list(mix.enzymes),
+                'supplements': mix.supplements,
+                'wells': len(mix.wells),
+                'reactions': reactions,
+                'components': components,
+                'microliter_per_well': sum(component['per_well'] or 0 for component in components),
+                'enzyme_fraction': enzyme_volume / self.volume,
+                'fits': water >= 0}
+
+    # The result of the run: dictionary with 'volume', 'overage', 'wells',
+    # 'mixes' (recipes, see recipe()), 'enzymes' (for every enzyme and
+    # concentration the units and µl of all mixes, with the overage),
+    # 'well_volumes' (for every well the 'plate', 'well', 'mix' number and
+    # the µl of 'master_mix', 'dna' and 'water') and 'unassigned'
+    def result(self):
+        mixes = []
+        totals = {}
+        well_volumes = []
+        for number, mix in enumerate(self.mixes.values(), 1):
+            recipe = self.recipe(number, mix)
+            mixes.append(recipe)
+            for component in recipe['components'][1:-1]:
+                if component['concentration'] is None:
+                    continue
+                total = totals.setdefault((component['name'], component['concentration']), {'enzyme': component['name'], 'concentration': component['concentration'], 'units': 0.0, 'microliter': 0.0})
+                total['units'] += component['units'] * recipe['reactions']
+                total['microliter'] += component['total']
+            for well, dna in mix.wells:
+                well_volumes.append({'plate': mix.plate,
+                                     'well': well,
+                                     'mix': number,
+                                     'master_mix': recipe['microliter_per_well'],
+                                     'dna': dna,
+                                     'water': self.volume - recipe['microliter_per_well'] - dna})
+        return {'volume': self.volume,
+                'overage': self.overage,
+                'wells': self.wells,
+                'mixes': mixes,
+                'enzymes': [totals[key] for key in sorted(totals)],
+                'well_volumes': well_volumes,
+                'unassigned': [{'plate': plate, 'well': well, 'reason': reason} for plate, well, reason in self.unassigned]}
+
+def format_microliter(value):
+    return "-" if value is None else "%.2f µl" % value
+
+def print_result(result):
+    print(str(result['wells']) + " wells, " + str(len(result['mixes'])) + " master mixes (" + format_microliter(result['volume']) + " reactions, " + str(result['overage']) + "% overage)")
+    for recipe in result['mixes']:
+        print("")
+        print("Master mix " + str(recipe['number']) + " (plate " + recipe['plate'] + ", " + recipe['buffer'] + ", " + ' and '.join(str(temperature) for temperature in recipe['temperatures']) + " °C): " + str(recipe['wells']) + " wells, mix for " + str(round(recipe['reactions'], 1)) + " reactions")
+        for component in recipe['components']:
+            name = component['name']
+            if 'units' in component:
+                name += " (%.2f units" % component['units'] + (", " + str(component['concentration']) + " units/µl)" if component['concentration'] else ", no concentration known)")
+            print("  %-40s %10s %12s" % (name, format_microliter(component['per_well']), format_microliter(component['total'])))
+        print("  Add " + format_microliter(recipe['microliter_per_well']) + " to every well.")
+        for supplement in recipe['supplements']:
+            print("  " + supplement)
+        if not recipe['fits']:
+            print("  The well with the most DNA does not fit into " + format_microliter(result['volume']) + "!")
+        if recipe['enzyme_fraction'] > max_enzyme_fraction:
+            print("  The enzymes are " + str(round(recipe['enzyme_fraction'] * 100)) + "% of the reaction volume (more than 10% glycerol may cause star activity)!")
+    print("")
+    print("Enzymes for all master mixes:")
+    for total in result['enzymes']:
+        print("  %-14s %6s units/µl %10.1f units %10s" % (total['enzyme'], total['concentration'], total['units'], format_microliter(total['microliter'])))
+    print("")
+    print("Wells:")
+    for well in result['well_volumes']:
+        print("  %-4s %-6s mix %-4d %10s mix %10s DNA %10s water" % (well['plate'], well['well'], well['mix'], format_microliter(well['master_mix']), format_microliter(well['dna']), format_microliter(max(well['water'], 0))))
+    if result['unassigned']:
+        print("")
+        print("Wells without a master mix:")
+        for well in result['unassigned']:
+            print("  %-4s %-6s %s" % (well['plate'], well['well'], well['reason']))
+
+def run(argv=None):
+    import argparse, json
+    from . import batch
+    parser = argparse.ArgumentParser(prog='reoptimize plate', description='Plan a plate (or several plates) of digests and calculate master mixes for the wells that share the buffer, the temperatures and the enzymes.')
+    parser.add_argument('input', help='JSON lines file with the digests (with "well" and "plate"), as for reoptimize batch (default: stdin)', nargs='?')
+    parser.add_argument('--volume', help='Reaction volume (default: %s µl)' % reaction_volume, default=reaction_volume, type=float)
+    parser.add_argument('--overage', help='Extra master mix (default: %s%%)' % overage, default=overage, type=float)
+    parser.add_argument('--dna-concentration', help='DNA concentration of the wells without "dna_concentration" (default: %s ng/µl)' % dna_concentration, default=dna_concentration, type=float)
+    parser.add_argument('--max-volume', help='Use the least concentrated product of which a well needs at most this volume (default: %s µl)' % incubation.max_volume, default=incubation.max_volume, type=float)
+    parser.add_argument('--database', help='Enzyme database file (default: $REOPTIMIZE_DATABASE or REsqlite3.db in the package directory)')
+    parser.add_argument('--json', help='Write the result as JSON', action='store_true')
+    args = parser.parse_args(argv)
+    if args.volume <= 0 or args.overage < 0 or args.dna_concentration <= 0:
+        parser.error("The volume and the DNA concentration must be positive, the overage must not be negative")
+
+    plate_run = PlateRun(args.volume, args.overage, args.dna_concentration, args.max_volume)
+    infile = open(args.input, encoding='utf-8') if args.input else sys.stdin
+    try:
+        for request, plan, error in batch.plan_batch(batch.read_requests(infile), args.database):
+            plate_run.add(request, plan, error)
+    finally:
+        if args.input:
+            infile.close()
+    result = plate_run.result()
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+    else:
+        print_result(result)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+#
+# Wall time per stage of a calculation (digest() in reoptimize.py, the
+# fetch/parse/FASTA scan/write stages of make_sqlite_database.py) and,
+# optionally, cProfile data of the whole calculation.
+#
+# Usage:
+#
+# timer = StageTimer(True, 'digest.pstats')
+# timer.start()
+# with timer.stage('lookup'):
+#     ...
+# timer.stop()
+# timer.report()
+#
+# A stage can be entered many times (e.g. once per enzyme), the times
+# are added up. If the timer is not enabled, stage() returns a context
+# manager that does nothing, so that timing costs (almost) nothing when
+# it isn't needed.
+#
+# If a metric name is given, the time of every stage is also recorded in
+# that latency histogram of the metrics module when the timer is stopped.
+import sys, time
+
+try:
+    from . import metrics
+except ImportError:
+    # Imported by make_sqlite_database.py run as a script
+    import metrics
+
+class NullStage:
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+
+null_stage = NullStage()
+
+class Stage:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        self.timer.stages[self.name] = self.timer.stages.get(self.name, 0) + elapsed
+        return False
+
+class StageTimer:
+    # enabled: record the wall time of every stage
+    # profile_output: file name for cProfile data (enables the timer, too)
+    # metric: name of the metrics histogram for the stage times
+    def __init__(self, enabled=False, profile_output=None, metric=None):
+        self.enabled = bool(enabled) or profile_output is not None
+        self.profile_output = profile_output
+        self.metric = metric
+        # Stage name => wall time in seconds, in the order the stages were entered
+        self.stages = {}
+        self.profiler = None
+        self.total = 0
+        self.started = None
+
+    def stage(self, name):
+        if not self.enabled:
+            return null_stage
+        return Stage(self, name)
+
+    def start(self):
+        if not self.enabled:
+            return
+        if self.profile_output is not None:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.started = time.perf_counter()
+
+    def stop(self):
+        if not self.enabled or self.started is None:
+            return
+        self.total += time.perf_counter() - self.started
+        self.started = None
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile_output)
+            self.profiler = None
+        if self.metric is not None:
+            for name, elapsed in self.stages.items():
+                metrics.observe(self.metric, elapsed, stage=name)
+
+    # Print a table of all stages (time in ms and % of the total time)
+    def report(self, file=None):
+        if file is None:
+            file = sys.stderr
+        total = self.total if self.total > 0 else sum(self.stages.values())
+        print("%-20s %12s %7s" % ("Stage", "Time (ms)", "%"), file=file)
+        for name, elapsed in self.stages.items():
+            print("%-20s %12.3f %7.1f" % (name, elapsed * 1000, elapsed * 100 / total if total > 0 else 0), file=file)
+        untimed = total - sum(self.stages.values())
+        if untimed > 0:
+            print("%-20s %12.3f %7.1f" % ("(other)", untimed * 1000, untimed * 100 / total), file=file)
+        print("%-20s %12.3f" % ("total", total * 1000), file=file)
+        if self.profile_output is not None:
+            print("cProfile data written to " + self.profile_output, file=file)
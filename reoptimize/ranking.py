@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#
+# Ranking of the buffers of a digest.
+#
+# A buffer can be used for a digest if all enzymes have at least 50%
+# activity and no star activity in it (see records.BufferScores). The
+# possible buffers are ranked by one of the objectives:
+# - activity: highest mean % activity of the enzymes (the default)
+# - minimum: highest % activity of the least active enzyme
+# - units: fewest units of all enzymes together (an enzyme with 50%
+#   activity in a buffer needs twice the units)
+# - cost: lowest price of the enzymes, from the units and the price of a
+#   unit of every enzyme
+# - supplements: fewest enzymes that need a supplement (e.g. SAM). The
+#   supplements don't depend on the buffer, so this objective only ranks
+#   the candidates of different plans (see top_candidates()); the buffers
+#   of one plan are then ranked by their mean activity.
+# Ties are broken by the mean activity and then by the order of the
+# buffers in the database.
+#
+# The % activities of the enzymes of a digest form a matrix (enzymes x
+# buffers, see records.EnzymeRecord). An objective is calculated for all
+# buffers in one pass over the columns of the matrix, and only the best k
+# buffers (or candidates) are sorted (heapq), so that the buffers of many
+# plans can be ranked quickly.
+import sys, heapq, operator
+
+default_objective = 'activity'
+
+# The objectives get the columns of the matrix (the % activities of the
+# enzymes in one buffer), the enzyme records (for the units) and the
+# prices ({enzyme: price of a unit}) and return a score for every column.
+# Lower scores are better.
+def mean_activity(columns, enzyme_records, prices):
+    return [-sum(column) / len(column) for column in columns]
+
+def minimum_activity(columns, enzyme_records, prices):
+    return [-min(column) for column in columns]
+
+# The units needed in a buffer are the units (at 100% activity) * 100 /
+# % activity
+def total_units(columns, enzyme_records, prices):
+    units = [record.units * 100 for record in enzyme_records]
+    return [sum(map(operator.truediv, units, column)) for column in columns]
+
+def total_cost(columns, enzyme_records, prices):
+    if prices is None:
+        raise ValueError("The cost objective needs the prices of the enzymes!")
+    from . import enzymes
+    missing = [record.name for record in enzyme_records if enzymes.product_name(record.name) not in prices]
+    if missing:
+        raise ValueError("There is no price for " + ', '.join(missing) + "!")
+    costs = [record.units * 100 * prices[enzymes.product_name(record.name)] for record in enzyme_records]
+    return [sum(map(operator.truediv, costs, column)) for column in columns]
+
+def supplements(columns, enzyme_records, prices):
+    count = sum(1 for record in enzyme_records if record.reaction_supplement != '')
+    return [count] * len(columns)
+
+objectives = {'activity': mean_activity,
+              'minimum': minimum_activity,
+              'units': total_units,
+              'cost': total_cost,
+              'supplements': supplements}
+
+# The objectives that can be used without prices
+def objectives_without_prices():
+    return sorted(name for name in objectives if name != 'cost')
+
+def check_objective(objective):
+    if objective is None:
+        return default_objective
+    if objective not in objectives:
+        sys.exit("Unknown objective " + str(objective) + ". Objectives are: " + ', '.join(sorted(objectives)))
+    return objective
+
+# Sort keys of the buffers at the positions (in the buffer table) for the
+# enzymes: (score, -mean activity, position)
+def buffer_keys(enzyme_records, positions, objective, prices=None):
+    matrix_columns = list(zip(*(record.activities for record in enzyme_records)))
+    columns = [matrix_columns[position] for position in positions]
+    scores = objectives[objective](columns, enzyme_records, prices)
+    means = mean_activity(columns, enzyme_records, prices)
+    return list(zip(scores, means, positions))
+
+# The k best (all if k is None) of the possible buffers of a digest
+# (buffer_scores: records.BufferScores), best first: [(buffer, cumulative
+# % activity)]
+def rank_buffers(enzyme_records, buffer_scores, objective=None, k=None, prices=None):
+    objective = check_objective(objective)
+    enzyme_records = list(enzyme_records)
+    names = buffer_scores.buffers.names
+    positions = [position for position, allowed in enumerate(buffer_scores.allowed) if allowed]
+    if enzyme_records and positions:
+        keys = buffer_keys(enzyme_records, positions, objective, prices)
+        positions = [key[-1] for key in (sorted(keys) if k is None else heapq.nsmallest(k, keys))]
+    elif k is not None:
+        positions = positions[:k]
+    return [(names[position], buffer_scores.cumulative[position]) for position in positions]
+
+# The k best (plan, buffer) combinations of many plans, e.g. of a batch or
+# of the enzyme combinations for a cloning project. candidates are
+# (label, plan) pairs (plans of reoptimize.plan_digest()); they are read
+# one by one, only the k best combinations are kept. Returns [(label,
+# buffer, score)], best first (score: see objectives, lower is better).
+def top_candidates(candidates, objective=None, k=10, prices=None):
+    objective = check_objective(objective)
+    def keyed():
+        for number, (label, plan) in enumerate(candidates):
+            enzyme_records = list(plan.enzymes.values())
+            if not enzyme_records or not plan.possible_buffers:
+                continue
+            buffers = enzyme_records[0].buffers
+            positions = [buffers.index[buffer] for buffer, cumulative in plan.possible_buffers]
+            try:
+                keys = buffer_keys(enzyme_records, positions, objective, prices)
+            except ValueError:
+                # Plans that can't be scored (no price for an enzyme)
+                continue
+            for score, mean, position in keys:
+                yield (score, mean, number, position), label, buffers.names[position]
+    best = heapq.nsmallest(k, keyed(), key=operator.itemgetter(0))
+    return [(label, buffer, key[0]) for key, label, buffer in best]
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+#
+# Compact records for the data of a digest plan (see
+# reoptimize.plan_digest()).
+#
+# The planner used to keep everything in nested dictionaries (a dictionary
+# per enzyme with a dictionary of activities per buffer, a [allowed,
+# cumulative activity] list per buffer and a dictionary for the plan).
+# Batch mode and a server plan thousands of digests, so the records here
+# use __slots__ (no dictionary per object) and keep the values of the
+# buffers in lists indexed by the position of the buffer in a
+# BufferTable, which is shared by all plans made with the same database.
+#
+# For code written for the dictionaries, the records can still be read
+# like them: record['units'], record['reaction_buffers'][buffer],
+# plan['enzymes'], plan.get('sequential') work as before. The
+# dictionaries of the activities are only made when they are asked for.
+
+# The buffers of a database, in a fixed order
+class BufferTable:
+    __slots__ = ('names', 'index')
+
+    def __init__(self, names):
+        self.names = tuple(names)
+        self.index = {name: position for position, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+# Buffer tables by the names of their buffers (one per database)
+buffer_tables = {}
+
+def buffer_table(names):
+    names = tuple(names)
+    table = buffer_tables.get(names)
+    if table is None:
+        table = buffer_tables[names] = BufferTable(names)
+    return table
+
+# Gives read access like a dictionary to the fields of a record
+class MappingAccess:
+    __slots__ = ()
+    fields = ()
+
+    def __getitem__(self, key):
+        if key not in self.fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        if key not in self.fields:
+            return default
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.fields
+
+    def keys(self):
+        return list(self.fields)
+
+# An enzyme of a digest: its % activity and star activity in every buffer
+# (in the order of the buffer table), the units needed, the reaction
+# temperature and supplement. unit_parameters are the arguments of
+# reoptimize.enzyme_units() except the time (to calculate the units for
+# other incubation times), concentrations the concentrations NEB sells
+# (units/µl, lowest first).
+class EnzymeRecord(MappingAccess):
+    __slots__ = ('name', 'buffers', 'activities', 'star_activities', 'units', 'reaction_temperature', 'reaction_supplement', 'unit_parameters', 'concentrations')
+    fields = ('reaction_buffers', 'star_activity', 'units', 'reaction_temperature', 'reaction_supplement')
+
+    def __init__(self, name, buffers):
+        self.name = name
+        self.buffers = buffers
+        self.activities = [None] * len(buffers)
+        self.star_activities = [None] * len(buffers)
+        self.units = None
+        self.reaction_temperature = None
+        self.reaction_supplement = ''
+        self.unit_parameters = None
+        self.concentrations = ()
+
+    # % activity in a buffer, None if the buffer is unknown
+    def activity(self, buffer):
+        position = self.buffers.index.get(buffer)
+        if position is None:
+            return None
+        return self.activities[position]
+
+    # {buffer: % activity}
+    @property
+    def reaction_buffers(self):
+        return dict(zip(self.buffers.names, self.activities))
+
+    # {buffer: star activity (1 = yes, 0 = no)}
+    @property
+    def star_activity(self):
+        return dict(zip(self.buffers.names, self.star_activities))
+
+    def __setitem__(self, key, value):
+        if key not in ('units', 'reaction_temperature', 'reaction_supplement'):
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __repr__(self):
+        return 'EnzymeRecord(' + repr(self.name) + ', units=' + repr(self.units) + ', reaction_temperature=' + repr(self.reaction_temperature) + ')'
+
+# Which buffers can be used for a digest (at least 50% activity and no
+# star activity for all enzymes) and the sum of the % activities of the
+# enzymes in every buffer (to rank the buffers)
+class BufferScores:
+    __slots__ = ('buffers', 'allowed', 'cumulative')
+
+    def __init__(self, buffers):
+        self.buffers = buffers
+        self.allowed = bytearray(b'\x01') * len(buffers)
+        self.cumulative = [0] * len(buffers)
+
+    def add(self, position, activity, star_activity, minimum_activity=50):
+        if activity < minimum_activity or star_activity != 0:
+            self.allowed[position] = 0
+        self.cumulative[position] += activity
+
+    # [(buffer, cumulative % activity)] of the buffers that can be used
+    def possible(self):
+        return [(name, self.cumulative[position]) for position, name in enumerate(self.buffers.names) if self.allowed[position]]
+
+# A step of a sequential digest (see sequential.plan_sequential()). Only
+# digest steps have a buffer and units, only digest and heat inactivation
+# steps a temperature; the fields a step doesn't have are None and are
+# not keys of the step.
+class Step(MappingAccess):
+    __slots__ = ('action', 'buffer', 'temperature', 'enzymes', 'units', 'minutes')
+    fields = __slots__
+
+    def __init__(self, action, enzymes, minutes, buffer=None, temperature=None, units=None):
+        self.action = action
+        self.buffer = buffer
+        self.temperature = temperature
+        self.enzymes = enzymes
+        self.units = units
+        self.minutes = minutes
+
+    def __getitem__(self, key):
+        value = MappingAccess.__getitem__(self, key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = MappingAccess.get(self, key)
+        return default if value is None else value
+
+    def __contains__(self, key):
+        return key in self.fields and getattr(self, key) is not None
+
+    def keys(self):
+        return [key for key in self.fields if getattr(self, key) is not None]
+
+# A digest plan (see reoptimize.plan_digest() for the fields)
+class Plan(MappingAccess):
+    __slots__ = ('enzymes', 'possible_buffers', 'how_many_enzymes', 'time', 'sequential', 'fragments', 'substitutions', 'profile')
+    fields = __slots__
+
+    def __init__(self, enzymes, possible_buffers, how_many_enzymes, time, sequential=None, fragments=None, substitutions=None):
+        self.enzymes = enzymes
+        self.possible_buffers = possible_buffers
+        self.how_many_enzymes = how_many_enzymes
+        self.time = time
+        self.sequential = sequential
+        self.fragments = fragments
+        self.substitutions = substitutions if substitutions is not None else {}
+        self.profile = None
+
+    def __setitem__(self, key, value):
+        if key not in self.fields:
+            raise KeyError(key)
+        setattr(self, key, value)
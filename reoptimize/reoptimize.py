@@ -19,10 +19,13 @@
 # Example: reoptimize.py -e 'EcoRI 2' 'HindIII 1'
 # (equivalent to reoptimize.py -e 'EcoRI 2' 'HindIII 1' -l 5000 -t 1 -m 1)
 #
-# argparse to parse the command line arguments and options
-# sqlite3 module to store the enzyme data in  local sqlite database file
-import sys, os, argparse, sqlite3
-from argparse import RawTextHelpFormatter
+# Only light-weight modules are imported here, so that "reoptimize --help"
+# and other simple invocations start fast. Heavy modules (sqlite3,
+# Restriction_Dictionary, Biopython) are imported inside the functions
+# that need them.
+import sys, os
+
+from . import profiling, metrics, database, records, ranking, plancache, snapshot
 
 # If this is set to True, much more info will be printed out during the run
 DEBUG = False
@@ -53,54 +56,257 @@ assay_DNA_length = {  'λ': 48502,
                     'pBR322': 4361,
                     'T4 wild-type phage': 168922 }
 
-# The main digest is done here, receives the list of enzymes from command line
-def digest(enzyme, microgram, length, time):
+# Reduced enzyme amounts for digests longer than 1 hour: the units are
+# multiplied by (a * time + b) / (time + c), depending on how long the
+# enzyme survives in the digest (survival, in hours). The coefficients
+# were obtained empirically with NEB data using Matlab (rational function)
+# regression.
+survival_regression = {8: (0.05461, 1.343, 0.3991),
+                       4: (0.1601, 1.819, 0.9845),
+                       2: (0.4081, 2.61, 2.031)}
+
+# Buffer tables found in the database. For each database file name the
+# (modification time, size) of the file and the list of buffer tables is
+# stored, so that a rebuilt database file is discovered again.
+buffer_table_cache = {}
+
+# Open the sqlite database file (read-only, see database.py). sqlite3 is
+# only imported when a digest is actually calculated.
+def open_database(sqlite_file):
+    import sqlite3
+    try:
+        return database.connect(sqlite_file)
+    except sqlite3.Error as err:
+        sys.exit("Error opening database file " + sqlite_file + ". Error: " + str(err))
+
+# Get the connection of the calling thread to the database file from the
+# connection pool (see database.py). Unlike open_database(), the
+# connection is reused by the next digest and must not be closed.
+def pooled_database(sqlite_file):
+    import sqlite3
+    try:
+        return database.connection(sqlite_file)
+    except sqlite3.Error as err:
+        sys.exit("Error opening database file " + sqlite_file + ". Error: " + str(err))
+
+# (modification time, size) of the database file, None if it doesn't exist
+def database_stamp(sqlite_file):
+    try:
+        stat = os.stat(sqlite_file)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+# Get a list of all tables, that have the string "uffer" in their name.
+# The schema of the database file only changes when the database is
+# rebuilt, so the result is cached for the lifetime of the process.
+def discover_buffers(cursor, sqlite_file):
+    stamp = database_stamp(sqlite_file)
+    cached = buffer_table_cache.get(sqlite_file)
+    if stamp is not None and cached is not None:
+        if cached[0] == stamp:
+            metrics.increment('reoptimize_cache_hits_total', cache='buffer_tables')
+            return list(cached[1])
+        # The database file has been replaced since it was last read
+        metrics.increment('reoptimize_database_reloads_total')
+    metrics.increment('reoptimize_cache_misses_total', cache='buffer_tables')
+    query = "SELECT name FROM sqlite_master WHERE type='table'"
+    cursor.execute(query)
+    result = cursor.fetchall()
+    debug_print(result)
+    buffer_tables = []
+    for sql_table in result:
+        debug_print(sql_table[0])
+        if 'buffer' in sql_table or 'Buffer' in sql_table[0]:
+            buffer_tables.append(sql_table[0])
+    if stamp is not None:
+        buffer_table_cache[sqlite_file] = (stamp, tuple(buffer_tables))
+    return buffer_tables
+
+# Activity data of all enzymes in the database, read at once:
+# {enzyme name: {buffer: (% activity, star activity)}}. Like the buffer
+# tables, it is cached until the database file changes.
+buffer_activity_cache = {}
+
+def buffer_activities(sqlite_file=None):
+    if sqlite_file is None:
+        sqlite_file = database.default_database()
+    stamp = database_stamp(sqlite_file)
+    cached = buffer_activity_cache.get(sqlite_file)
+    if stamp is not None and cached is not None and cached[0] == stamp:
+        metrics.increment('reoptimize_cache_hits_total', cache='buffer_activities')
+        return cached[1]
+    metrics.increment('reoptimize_cache_misses_total', cache='buffer_activities')
+    catalogue = snapshot.load(sqlite_file)
+    if catalogue is not None:
+        activities = {row[6]: dict(zip(catalogue.buffers, zip(activity, star_activity))) for row, activity, star_activity in catalogue.enzymes.values()}
+        buffer_activity_cache[sqlite_file] = (stamp, activities)
+        return activities
+    sqlcon = pooled_database(sqlite_file) if database.pooling else open_database(sqlite_file)
+    cursor = sqlcon.cursor()
+    names = {}
+    for enzyme_id, enzyme_name in cursor.execute("SELECT enzyme_id, enzyme_name FROM restriction_enzyme"):
+        names[enzyme_id] = enzyme_name
+    activities = {name: {} for name in names.values()}
+    for buffer in discover_buffers(cursor, sqlite_file):
+        for enzyme_id, activity, star_activity in cursor.execute("SELECT enzyme_id, activity, star_activity FROM `" + buffer + "`"):
+            if enzyme_id in names:
+                activities[names[enzyme_id]][buffer] = (activity, star_activity)
+    if not database.pooling:
+        sqlcon.close()
+    if stamp is not None:
+        buffer_activity_cache[sqlite_file] = (stamp, activities)
+    return activities
+
+# NEB enzymes in the database that recognize the same site as an enzyme
+# (see the equivalent_enzyme table in make_sqlite_database.py): a list of
+# (enzyme name, 'isoschizomer' or 'neoschizomer'), isoschizomers first,
+# the best characterized first. Databases built by older versions don't
+# have the table, then the list is empty. With the catalogue of a snapshot
+# (see snapshot.py), the database is not read.
+def find_equivalents(cursor, enzyme_name, catalogue=None):
+    import sqlite3
+    from . import enzymes
+    name = enzymes.dictionary_name(enzyme_name)
+    if name is None:
+        return []
+    if catalogue is not None:
+        return list(catalogue.equivalents(name.upper()))
+    query = "SELECT restriction_enzyme.enzyme_name, equivalent_enzyme.relation FROM equivalent_enzyme INNER JOIN restriction_enzyme ON restriction_enzyme.enzyme_id = equivalent_enzyme.enzyme_id WHERE equivalent_enzyme.name = ? ORDER BY equivalent_enzyme.relation, equivalent_enzyme.score DESC, restriction_enzyme.enzyme_name"
+    try:
+        cursor.execute(query, (name.upper(),))
+        return cursor.fetchall()
+    except sqlite3.Error:
+        return []
+
+# The main digest is done here, receives the list of enzymes from command line.
+# The calculation is done by plan_digest(), the results are printed by
+# print_plan(). Returns the plan (see plan_digest()).
+#
+# If profile is True, the wall time of every stage of the calculation is
+# printed (to stderr) and stored in the plan. If profile_output is a file
+# name, cProfile data (readable with the pstats module) is written to it.
+#
+# If the sequence of the target DNA is given, the fragment sizes are
+# calculated, too (see plan_digest()).
+def digest(enzyme, microgram, length, time, sqlite_file=None, profile=False, profile_output=None, sequence=None, circular=False, host=None, substitute=False, index=None, objective=None, prices=None):
+    timer = profiling.StageTimer(profile or metrics.enabled, profile_output, 'reoptimize_stage_seconds')
+    timer.start()
+    plan = plan_digest(enzyme, microgram, length, time, sqlite_file, timer, sequence, circular, host, substitute, index, objective, prices)
+    with timer.stage('print'):
+        print_plan(plan)
+    timer.stop()
+    if profile or profile_output is not None:
+        plan.profile = timer.stages
+        timer.report()
+    return plan
+
+# Calculate possible buffers and enzyme amounts for a digest. Returns
+# the plan, a records.Plan (which can also be read like a dictionary) with
+# the fields
+# - 'enzymes': {name: records.EnzymeRecord}, for every enzyme the % activity
+#   in every buffer ('reaction_buffers'), 'units', 'reaction_temperature'
+#   and 'reaction_supplement'
+# - 'possible_buffers': list of (buffer, cumulative % activity), best first
+#   by the objective (see ranking.py; prices: {enzyme: price of a unit}
+#   for the cost objective)
+# - 'how_many_enzymes'
+# - 'time': the incubation time (in hours)
+# - 'sequential': the sequential digest (see sequential.py) if the enzymes
+#   need different temperatures or have no buffer in common, else None
+# - 'fragments': if the sequence of the target DNA is given, the cut
+#   positions and fragment sizes (see fragments.digest_fragments()), else
+#   None. circular tells whether the target DNA is circular, host which
+#   host it was isolated from (see methylation.py). The enzyme amounts are
+#   then calculated for the length of the sequence and the sites that are
+#   not blocked by methylation, instead of length and the given numbers.
+#   index is the file name of a scan index (see scanindex.py): if it has
+#   the sequence, the sites are not searched again.
+# - 'substitutions': {requested enzyme: NEB enzyme used instead}. If an
+#   enzyme is not in the database and substitute is True, its best
+#   characterized isoschizomer in the database is used; otherwise the
+#   isoschizomers and neoschizomers are suggested in the error message.
+#
+# timer is a profiling.StageTimer, that records the time spent in each stage.
+# If no timer is given, the stage times are only recorded when metrics are
+# enabled.
+#
+# If a plan cache is configured (see plancache.py), plans without a
+# sequence are taken from it when another process (or an earlier digest)
+# has already calculated them.
+def plan_digest(enzyme, microgram, length, time, sqlite_file=None, timer=None, sequence=None, circular=False, host=None, substitute=False, index=None, objective=None, prices=None):
+    cache = plancache.current() if sequence is None else None
+    if cache is None:
+        return calculate_plan(enzyme, microgram, length, time, sqlite_file, timer, sequence, circular, host, substitute, index, objective, prices)
+    if sqlite_file is None:
+        sqlite_file = database.default_database()
+    version = database.catalogue_version(sqlite_file)
+    key = plancache.plan_key(enzyme, microgram, length, time, version, substitute, objective, prices)
+    if key is None:
+        return calculate_plan(enzyme, microgram, length, time, sqlite_file, timer, sequence, circular, host, substitute, index, objective, prices)
+    return cache.plan(key, version, enzyme, lambda: calculate_plan(enzyme, microgram, length, time, sqlite_file, timer, sequence, circular, host, substitute, index, objective, prices))
+
+# The calculation of plan_digest() (without the plan cache)
+def calculate_plan(enzyme, microgram, length, time, sqlite_file=None, timer=None, sequence=None, circular=False, host=None, substitute=False, index=None, objective=None, prices=None):
+    own_timer = timer is None
+    if own_timer:
+        timer = profiling.StageTimer(metrics.enabled, metric='reoptimize_stage_seconds')
+        timer.start()
 
     # This is the name of the sqlite database file, that contains all the enzyme information
-    sqlite_file= path + '/REsqlite3.db'
-    #  Create sqlite connection
-    sqlcon = sqlite3.connect(sqlite_file)
-    # In the list_of_enzyme_activities everything is stored for later evaluation
-    list_of_enzyme_activities = {}
-    #
-    units = {}
-    # Each key (= buffer) has as value a list, which consists of
-    # 1. whether digestion is allowed in that buffer (1= yes, 0 = no, -1 = unknown),
+    if sqlite_file is None:
+        sqlite_file = database.default_database()
+    # The buffers of the database (a records.BufferTable, shared by all
+    # plans) and for every buffer
+    # 1. whether digestion is allowed in that buffer (1= yes, 0 = no),
     #    set initially to 1 (except FastDigest buffer, which needs to be dealt with separately)
     # 2. The % activity in that buffer (set initially to 0)
-    # It will be updated for every enzyme that is included in the digest
-    # and is evaluated in the end
-    buffer_list = {}
+    # (a records.BufferScores). It will be updated for every enzyme that is
+    # included in the digest and is evaluated in the end
+    buffers = records.buffer_table(())
 
+    # If there is an up-to-date snapshot of the database (see snapshot.py),
+    # all enzyme data is taken from its catalogue and the database is not
+    # read at all
+    with timer.stage('open_database'):
+        catalogue = snapshot.load(sqlite_file)
     # Test whether the sqlite database file is present
     # and get a list of all tables, that have the string "uffer"
     # in their name
-    with sqlcon:
-        cursor = sqlcon.cursor()
-        query = "SELECT COUNT(*) FROM restriction_enzyme"
-        try:
-            cursor.execute(query)
-            result = cursor.fetchone()
-            debug_print("Number of enzymes in restriction_enzyme table: %s " % result)
-        except sqlcon.Error as err:
-            print("Error opening database file " + sqlite_file + ". Error: " + str(err))
-        query = "SELECT name FROM sqlite_master WHERE type='table'"
-        try:
-            cursor.execute(query)
-            result = cursor.fetchall()
-            debug_print(result)
-            for sql_table in result:
-                debug_print(sql_table[0])
-                if 'buffer' in sql_table or 'Buffer' in sql_table[0]:
-                    buffer_list[sql_table[0]] = [1,0]
-            debug_print("buffer_list (from sqlite file): " + str(buffer_list))
-        except sqlcon.Error as err:
-            print("Error opening database file " + sqlite_file + ". Error: " + str(err))
+    if catalogue is not None:
+        buffers = records.buffer_table(catalogue.buffers)
+        # No connection to close
+        pooled = True
+        cursor = None
+    else:
+        with timer.stage('open_database'):
+            #  Create sqlite connection (or reuse the one of this thread)
+            pooled = database.pooling
+            sqlcon = pooled_database(sqlite_file) if pooled else open_database(sqlite_file)
+            cursor = sqlcon.cursor()
+            query = "SELECT COUNT(*) FROM restriction_enzyme"
+            try:
+                cursor.execute(query)
+                result = cursor.fetchone()
+                debug_print("Number of enzymes in restriction_enzyme table: %s " % result)
+            except sqlcon.Error as err:
+                print("Error opening database file " + sqlite_file + ". Error: " + str(err))
+        with timer.stage('discover_buffers'):
+            try:
+                buffers = records.buffer_table(discover_buffers(cursor, sqlite_file))
+                debug_print("buffers (from sqlite file): " + str(buffers.names))
+            except sqlcon.Error as err:
+                print("Error opening database file " + sqlite_file + ". Error: " + str(err))
+    buffer_list = records.BufferScores(buffers)
 
     how_many_enzymes = len(enzyme)
     # Generate the first empty entry into this dictionary, which will be filled
     # during the parsing of the enzyme entry from the sqlite database
     list_of_enzyme_activities = {}
+    # The assay data of every enzyme, to calculate the units again (see below)
+    unit_parameters = {}
+    # Enzymes that are replaced by isoschizomers
+    substitutions = {}
     #
     # Loop through buffers to get all activity data for the enzyme
     #
@@ -108,163 +314,236 @@ def digest(enzyme, microgram, length, time):
     # ENZYME INCLUDED IN THE DIGEST NEEDS TO GO INTO THIS LOOP
     #
     for enzyme_item in enzyme:
-        # Separate enzyme from number of cutting sites
-        # enzyme[1] is name and enzyme[2] is number of cutting sites in assay DNA
-        enzyme_item = enzyme_item.split(' ')
-        # Check whether the user has submitted two values for each enzyme (name + number of cuts in taget site)
-        # and whether the second value is an integer.
-        # If no values were submitted, assume 1 restriction site
-        if len(enzyme_item) < 2:
-            number_of_restriction_sites = 1
-        # Try to convert the second value (= number of restriction sites in taget DNA) into an integer
-        else:
-            try:
-                number_of_restriction_sites = int(enzyme_item[1])
-                #if not isinstance(number_of_restriction_sites, int):
-            except ValueError:
-                sys.exit("Please indicate the number of restriction sites after each enzyme name! Example: reoptimize -e 'AflIII 2' 'HindIII 1'")
-
-        # Truncate too long enzyme names (the database holds only 32 character long enzyme names)
-        enzyme_item[0] = enzyme_item[0][:32]
-        # Make request to table "restriction_enzyme".
-        # Convert all enzyme names to upper case first.
-        query = "SELECT enzyme_id, default_buffer, assay_DNA, assay_DNA_cuts, survival, reaction_temperature, enzyme_name, reaction_supplement, enzyme_concentration, timesaver FROM restriction_enzyme WHERE UPPER(enzyme_name) = '" + enzyme_item[0].upper() + "'"
-        try:
-            cursor.execute(query)
-            result = cursor.fetchone()
-        except sqlcon.Error as err:
-            error_message = "Error getting activity data for enzyme " + enzyme_item[0] + ". Error: " + str(err) + "\nQuery was: " + query
-            sys.exit(error_message)
-        # Check whether the enzyme was found from the database
-        if result is None:
-            sys.exit("There is no data for enzyme " + enzyme_item[0] + " in the database!")
-        # Store all data in specific variables to free the result list variable
-        enzyme_name = result[6]
-        enzyme_id = result[0]
-        default_buffer = result[1]
-        assay_DNA = result[2]
-        assay_DNA_cuts = int(result[3])
-        survival = result[4]
-        reaction_temperature = result[5]
-        reaction_supplement = result[7]
-        debug_print("Result 5: " + str(result[5]))
-        # Take the lowest enzyme concentration
-        enzyme_concentration = int(result[8].split(',')[1])
-        try:
-            timesaver = int(result[9])
-        except:
-            timesaver = ''
-        debug_print("timesaver: " + str(timesaver))
-        # Get all activity data for each standard buffer
-        # Three-dimensional dictionary!
-        list_of_enzyme_activities[enzyme_name] = {}
-        debug_print("list_of_enzyme_activities: " + str(list_of_enzyme_activities))
-        list_of_enzyme_activities[enzyme_name]['reaction_buffers'] = {}
-        for buffer in buffer_list.keys():
-            # The following query gets the following data (list of 2 items):
-            # %-activity in current buffer, star activity in current buffer
-            query = "SELECT `" + buffer + "`.activity, `" + buffer +  "`.star_activity FROM restriction_enzyme INNER JOIN `" + buffer + "` ON restriction_enzyme.enzyme_id = `" + buffer + "`.enzyme_id WHERE restriction_enzyme.enzyme_id = '" + str(enzyme_id) + "'"
-            debug_print(query)
+        with timer.stage('lookup'):
+            # Separate enzyme from number of cutting sites
+            # enzyme[1] is name and enzyme[2] is number of cutting sites in assay DNA
+            enzyme_item = enzyme_item.split(' ')
+            # Check whether the user has submitted two values for each enzyme (name + number of cuts in taget site)
+            # and whether the second value is an integer.
+            # If no values were submitted, assume 1 restriction site
+            if len(enzyme_item) < 2:
+                number_of_restriction_sites = 1
+            # Try to convert the second value (= number of restriction sites in taget DNA) into an integer
+            else:
+                try:
+                    number_of_restriction_sites = int(enzyme_item[1])
+                    #if not isinstance(number_of_restriction_sites, int):
+                except ValueError:
+                    sys.exit("Please indicate the number of restriction sites after each enzyme name! Example: reoptimize -e 'AflIII 2' 'HindIII 1'")
+
+            # Truncate too long enzyme names (the database holds only 32 character long enzyme names)
+            enzyme_item[0] = enzyme_item[0][:32]
+            # Make request to table "restriction_enzyme".
+            # Convert all enzyme names to upper case first.
+            # The values are passed as parameters, so that the text of the
+            # query is always the same and sqlite3 can reuse the prepared
+            # statement.
+            # (From a snapshot: the same row, with the activities.)
+            query = "SELECT enzyme_id, default_buffer, assay_DNA, assay_DNA_cuts, survival, reaction_temperature, enzyme_name, reaction_supplement, enzyme_concentration, timesaver FROM restriction_enzyme WHERE UPPER(enzyme_name) = ?"
+            if catalogue is not None:
+                entry = catalogue.enzymes.get(enzyme_item[0].upper())
+                result = entry[0] if entry is not None else None
+            else:
+                try:
+                    cursor.execute(query, (enzyme_item[0].upper(),))
+                    result = cursor.fetchone()
+                except sqlcon.Error as err:
+                    error_message = "Error getting activity data for enzyme " + enzyme_item[0] + ". Error: " + str(err) + "\nQuery was: " + query
+                    sys.exit(error_message)
+            metrics.increment('reoptimize_enzyme_lookups_total')
+            # Check whether the enzyme was found from the database. If not,
+            # use or suggest an enzyme that recognizes the same site.
+            if result is None:
+                equivalents = find_equivalents(cursor, enzyme_item[0], catalogue)
+                isoschizomers = [name for name, relation in equivalents if relation == 'isoschizomer']
+                neoschizomers = [name for name, relation in equivalents if relation == 'neoschizomer']
+                if not (substitute and isoschizomers):
+                    error_message = "There is no data for enzyme " + enzyme_item[0] + " in the database!"
+                    if isoschizomers:
+                        error_message += "\nIsoschizomers in the database: " + ', '.join(isoschizomers) + " (use --substitute to use " + isoschizomers[0] + " instead)"
+                    if neoschizomers:
+                        error_message += "\nNeoschizomers (same site, different cut) in the database: " + ', '.join(neoschizomers)
+                    sys.exit(error_message)
+                substitutions[enzyme_item[0]] = isoschizomers[0]
+                if catalogue is not None:
+                    entry = catalogue.enzymes[isoschizomers[0].upper()]
+                    result = entry[0]
+                else:
+                    cursor.execute(query, (isoschizomers[0].upper(),))
+                    result = cursor.fetchone()
+            # Store all data in specific variables to free the result list variable
+            enzyme_name = result[6]
+            enzyme_id = result[0]
+            default_buffer = result[1]
+            assay_DNA = result[2]
+            assay_DNA_cuts = int(result[3])
+            survival = result[4]
+            reaction_temperature = result[5]
+            reaction_supplement = result[7]
+            debug_print("Result 5: " + str(result[5]))
+            # Take the lowest enzyme concentration
+            concentrations = tuple(int(value) for value in result[8].split(',')[1:])
+            enzyme_concentration = concentrations[0]
             try:
-                cursor.execute(query)
-                result = cursor.fetchone()
-                # Add % activity
-                list_of_enzyme_activities[enzyme_name]['reaction_buffers'][buffer] = result[0]
-                debug_print(str(list_of_enzyme_activities))
-                # Add star activity
-                #list_of_enzyme_activities[enzyme[0]][buffer].append(result[1])
-                # Only allow digest, if activity equal or greater than 50%
-                if result[0] < 50:
-                    buffer_list[buffer][0] = 0
-                debug_print(enzyme_item[0] + " activity in " + buffer + ": " + str(result[0]) + ", star activity: " + str(result[1]))
-                # Add cumulatively all % activities to be able to select the best buffer
-                # if several are possible
-                buffer_list[buffer][1] += result[0]
-                # If there is star activity (or an unknown situation), disallow digest
-                if result[1] != 0:
-                     buffer_list[buffer][0] = 0
-            except sqlcon.Error as err:
-                error_message = "Error getting activity data for enzyme " + enzyme_item[0] + ". Error: " + str(err) + "\nQuery was: " + query
-                sys.exit(error_message)
+                timesaver = int(result[9])
+            except:
+                timesaver = ''
+            debug_print("timesaver: " + str(timesaver))
+            # Get all activity data for each standard buffer
+            record = list_of_enzyme_activities[enzyme_name] = records.EnzymeRecord(enzyme_name, buffers)
+            debug_print("list_of_enzyme_activities: " + str(list_of_enzyme_activities))
+            if catalogue is not None:
+                for position, (activity, star_activity) in enumerate(zip(entry[1], entry[2])):
+                    record.activities[position] = activity
+                    record.star_activities[position] = star_activity
+                    buffer_list.add(position, activity, star_activity)
+            else:
+                for position, buffer in enumerate(buffers.names):
+                    # The following query gets the following data (list of 2 items):
+                    # %-activity in current buffer, star activity in current buffer
+                    query = "SELECT `" + buffer + "`.activity, `" + buffer +  "`.star_activity FROM restriction_enzyme INNER JOIN `" + buffer + "` ON restriction_enzyme.enzyme_id = `" + buffer + "`.enzyme_id WHERE restriction_enzyme.enzyme_id = ?"
+                    debug_print(query)
+                    try:
+                        cursor.execute(query, (enzyme_id,))
+                        result = cursor.fetchone()
+                        # Add % activity and star activity
+                        record.activities[position] = result[0]
+                        record.star_activities[position] = result[1]
+                        debug_print(enzyme_item[0] + " activity in " + buffer + ": " + str(result[0]) + ", star activity: " + str(result[1]))
+                        # Only allow digest, if activity equal or greater than 50%
+                        # and there is no star activity (or an unknown situation).
+                        # Add cumulatively all % activities to be able to select
+                        # the best buffer if several are possible
+                        buffer_list.add(position, result[0], result[1])
+                    except sqlcon.Error as err:
+                        error_message = "Error getting activity data for enzyme " + enzyme_item[0] + ". Error: " + str(err) + "\nQuery was: " + query
+                        sys.exit(error_message)
 
         #
         # Start calculating enzyme amounts here
         #
-        list_of_enzyme_activities[enzyme_name]['units'] = microgram * int(number_of_restriction_sites) * assay_DNA_length[assay_DNA] / (length * assay_DNA_cuts)
+        with timer.stage('units'):
+            record.units = enzyme_units(microgram, number_of_restriction_sites, length, time, assay_DNA, assay_DNA_cuts, survival, timesaver, enzyme_concentration)
+            unit_parameters[enzyme_name] = (assay_DNA, assay_DNA_cuts, survival, timesaver, enzyme_concentration)
+            record.unit_parameters = (microgram, number_of_restriction_sites, length) + unit_parameters[enzyme_name]
+            record.concentrations = concentrations
 
-        # Calculate the reduced enzyme amounts for digests > 1 hour.
-        # If the enzyme survival is unknown (= 0) or if the enzyme does
-        # not support longer survival times than 1 hour (= 1), don't do
-        # anything for digests longer or equal to 1 hour.
-        #
-        if time >= 1:
-            if survival == 8:
-                # Formulas obtained empirically with NEB data using Matlab (rational function) regression
-                fx = (0.05461*time+1.343)/(time+0.3991)
-                list_of_enzyme_activities[enzyme_name]['units'] = list_of_enzyme_activities[enzyme_name]['units'] * fx
-            elif survival == 4:
-                fx = (0.1601*time+1.819)/(time+0.9845)
-                list_of_enzyme_activities[enzyme_name]['units'] = list_of_enzyme_activities[enzyme_name]['units'] * fx
-            elif survival == 2:
-                fx = (0.4081*time+2.61)/(time+2.031)
-                list_of_enzyme_activities[enzyme_name]['units'] = list_of_enzyme_activities[enzyme_name]['units'] * fx
-        # Linear regression for interval 0-1 hour for all timesaver enzymes using
-        # NEB data (assuming, that no enzyme is consumed during this short period).
-        # For all other enzymes, just assume inverse proportionality
-        # For some enzymes, this leads to paradoxical results, e.g.
-        # for AvrII, where a 1 hour digests needs more enzyme than a 5 minute digest
-        if time < 1:
-            if timesaver != '':
-                # convert timesaver into hours
-                timesaver = timesaver/60
-                debug_print("enzyme_concentration: " + str(enzyme_concentration))
-                debug_print("timesaver: " + str(timesaver))
-                debug_print("list_of_enzyme_activities[enzyme_name]['units']: " + str(list_of_enzyme_activities[enzyme_name]['units']))
-                mm = (enzyme_concentration-list_of_enzyme_activities[enzyme_name]['units'])/(timesaver-1)
-                debug_print("mm: " + str(mm))
-                bb = list_of_enzyme_activities[enzyme_name]['units'] - mm
-                debug_print("bb: " + str(bb))
-                list_of_enzyme_activities[enzyme_name]['units'] = mm*time+bb
-            else:
-                list_of_enzyme_activities[enzyme_name]['units'] = list_of_enzyme_activities[enzyme_name]['units']/time
         # Add reaction temperatures to the list for a later comparison
-        list_of_enzyme_activities[enzyme_name]['reaction_temperature'] = reaction_temperature
+        record.reaction_temperature = reaction_temperature
 
         # Add potential supplements to the list for a later comparison
-        list_of_enzyme_activities[enzyme_name]['reaction_supplement'] = reaction_supplement
+        record.reaction_supplement = reaction_supplement
 
     # END OF "ENZYME IN ENZYMES" LOOP
+    if not pooled:
+        sqlcon.close()
+
+    # If the sequence of the target DNA is given, the fragments are
+    # calculated. The number of sites that can be cut (not blocked by the
+    # methylation of the host) and the length of the target DNA are then
+    # known, so the enzyme amounts are calculated again with them.
+    fragment_data = None
+    if sequence is not None:
+        with timer.stage('fragments'):
+            from . import fragments
+            fragment_data = fragments.digest_fragments(sequence, list(list_of_enzyme_activities), circular, host, index)
+        with timer.stage('units'):
+            for enzyme_name, parameters in unit_parameters.items():
+                if enzyme_name in fragment_data['sites']:
+                    list_of_enzyme_activities[enzyme_name].units = enzyme_units(microgram, fragment_data['sites'][enzyme_name], len(sequence), time, *parameters)
+                    list_of_enzyme_activities[enzyme_name].unit_parameters = (microgram, fragment_data['sites'][enzyme_name], len(sequence)) + parameters
     #
     # Make a list of possible buffers where the digest is allowed
     # Criteria (already cheked above):
     # - No star activity
     # - %-activity at least 50%
     #
-    # Maybe remove this list later and sort the buffer_list dictionary instead
-    # and drop from buffer_list all buffers that are not allowed
+    # The possible buffers are sorted by the objective (the highest mean
+    # activity by default, see ranking.py)
     #
-    possible_buffers = []
-    debug_print("buffer_list: " + str(buffer_list))
-    for buffer, digest_allowed in buffer_list.items():
-        if digest_allowed[0] == 1:
-            possible_buffers.append([buffer, digest_allowed[1]])
+    with timer.stage('rank_buffers'):
+        possible_buffers = ranking.rank_buffers(list_of_enzyme_activities.values(), buffer_list, objective, prices=prices)
+        debug_print("possible_buffers: " + str(possible_buffers))
+
+    plan = records.Plan(list_of_enzyme_activities, possible_buffers, how_many_enzymes, time, fragments=fragment_data, substitutions=substitutions)
+
+    # If the enzymes need different temperatures or have no buffer in
+    # common, plan a sequential digest
+    temperatures = set(value.reaction_temperature for value in list_of_enzyme_activities.values())
+    if len(list_of_enzyme_activities) > 1 and (len(temperatures) > 1 or not possible_buffers):
+        with timer.stage('sequential'):
+            from . import sequential
+            plan.sequential = sequential.plan_sequential(plan)
+
+    metrics.increment('reoptimize_plans_total')
+    if not possible_buffers:
+        metrics.increment('reoptimize_digest_not_recommended_total')
+    if own_timer:
+        timer.stop()
+    return plan
 
-    # Sort the list of possible buffers according to highest cumulative activity
-    # Secondary sort key: name of buffer NOT YET IMPLEMENTED
-    possible_buffers = sorted(possible_buffers, key = lambda number: number[1], reverse = True)
-    debug_print("possible_buffers: " + str(possible_buffers))
+# Units of an enzyme of a plan (records.EnzymeRecord) for another
+# incubation time (in hours)
+def units_at(record, time):
+    microgram, number_of_restriction_sites, length = record.unit_parameters[:3]
+    return enzyme_units(microgram, number_of_restriction_sites, length, time, *record.unit_parameters[3:])
+
+# Calculate the amount of enzyme (in units) needed to cut microgram µg of
+# a target DNA of the given length (bp) with number_of_restriction_sites
+# sites in time hours
+def enzyme_units(microgram, number_of_restriction_sites, length, time, assay_DNA, assay_DNA_cuts, survival, timesaver, enzyme_concentration):
+    units = microgram * int(number_of_restriction_sites) * assay_DNA_length[assay_DNA] / (length * assay_DNA_cuts)
+
+    # Calculate the reduced enzyme amounts for digests > 1 hour.
+    # If the enzyme survival is unknown (= 0) or if the enzyme does
+    # not support longer survival times than 1 hour (= 1), don't do
+    # anything for digests longer or equal to 1 hour.
+    #
+    if time >= 1 and survival in survival_regression:
+        a, b, c = survival_regression[survival]
+        fx = (a*time+b)/(time+c)
+        units = units * fx
+    # Linear regression for interval 0-1 hour for all timesaver enzymes using
+    # NEB data (assuming, that no enzyme is consumed during this short period).
+    # For all other enzymes, just assume inverse proportionality
+    # For some enzymes, this leads to paradoxical results, e.g.
+    # for AvrII, where a 1 hour digests needs more enzyme than a 5 minute digest
+    if time < 1:
+        if timesaver != '':
+            # convert timesaver into hours
+            timesaver = timesaver/60
+            debug_print("enzyme_concentration: " + str(enzyme_concentration))
+            debug_print("timesaver: " + str(timesaver))
+            debug_print("units: " + str(units))
+            mm = (enzyme_concentration-units)/(timesaver-1)
+            debug_print("mm: " + str(mm))
+            bb = units - mm
+            debug_print("bb: " + str(bb))
+            units = mm*time+bb
+        else:
+            units = units/time
+    return units
+
+# Print the possible buffers and enzyme amounts of a plan (see plan_digest())
+def print_plan(plan):
+    list_of_enzyme_activities = plan.enzymes
+    possible_buffers = plan.possible_buffers
+    how_many_enzymes = plan.how_many_enzymes
 
     # Separate the input from the result by a blank line
     print("")
 
+    for requested, used in plan.substitutions.items():
+        print("Note: " + requested + " is not in the database, its isoschizomer " + used + " is used instead!")
+
     # Put all reaction temperatures into a list and check whether
     # they are all the same, print warning if not
     # Print warning if a supplement is needed!
     temperature_list = []
     for restriction_enzyme, value in list_of_enzyme_activities.items():
-        temperature_list.append(value['reaction_temperature'])
-        if value['reaction_supplement'] != '':
-            print("Note: " + value['reaction_supplement'] + "!")
+        temperature_list.append(value.reaction_temperature)
+        if value.reaction_supplement != '':
+            print("Note: " + value.reaction_supplement + "!")
     debug_print("Temperature list: " + str(temperature_list))
     if len(set(temperature_list)) != 1:
         print("The reaction temperatures of the enzymes are dfferent and you should perform a sequential digest!")
@@ -283,11 +562,11 @@ def digest(enzyme, microgram, length, time):
             #
             debug_print(str(list_of_enzyme_activities))
             for restriction_enzyme, value in sorted(list_of_enzyme_activities.items()):
-                percentage = value['reaction_buffers'][buffer[0]]
-                if value['units']*100/percentage < 1:
-                    rounded_units = str(round(value['units']*100/percentage, 2))
+                percentage = value.activity(buffer[0])
+                if value.units*100/percentage < 1:
+                    rounded_units = str(round(value.units*100/percentage, 2))
                 else:
-                    rounded_units = str(round(value['units']*100/percentage, 1))
+                    rounded_units = str(round(value.units*100/percentage, 1))
                 print(restriction_enzyme + ": " + rounded_units + " units", end = ' ')
             print("")
     #
@@ -295,8 +574,6 @@ def digest(enzyme, microgram, length, time):
     #
     elif len(possible_buffers) > 0:
         print("Digest is possible in the following buffer (", end = '')
-        if len(units) > 1:
-            print("averaged ", end='')
         print("% activity in brackets): ", end = "")
         for buffer in possible_buffers:
             print(str(buffer[0]) + " (" + str(round(buffer[1]/how_many_enzymes)) + ")")
@@ -305,11 +582,11 @@ def digest(enzyme, microgram, length, time):
             #
             debug_print(str(list_of_enzyme_activities))
             for restriction_enzyme, value in sorted(list_of_enzyme_activities.items()):
-                percentage = value['reaction_buffers'][buffer[0]]
-                if value['units']*100/percentage < 1:
-                    rounded_units = str(round(value['units']*100/percentage, 2))
+                percentage = value.activity(buffer[0])
+                if value.units*100/percentage < 1:
+                    rounded_units = str(round(value.units*100/percentage, 2))
                 else:
-                    rounded_units = str(round(value['units']*100/percentage, 1))
+                    rounded_units = str(round(value.units*100/percentage, 1))
                 print(restriction_enzyme + ": " + rounded_units + " units", end = ' ')
             print("")
     #
@@ -325,22 +602,95 @@ def digest(enzyme, microgram, length, time):
             print("multiple", end='')
         print(" digest is not recommended.")
 
+    # Print the sequential digest
+    if plan.sequential is not None:
+        from . import sequential
+        sequential.print_sequential(plan.sequential)
+    elif len(list_of_enzyme_activities) > 1 and (len(set(temperature_list)) != 1 or not possible_buffers):
+        print("Too many enzymes to plan a sequential digest.")
+
+    # Print the fragment sizes
+    if plan.fragments is not None:
+        print_fragments(plan.fragments)
+
     debug_print(possible_buffers)
     debug_print(list_of_enzyme_activities)
 
+# Print the cut positions and fragment sizes (see fragments.py)
+def print_fragments(fragments):
+    topology = "circular" if fragments['circular'] else "linear"
+    for restriction_enzyme, cuts in sorted(fragments['cuts'].items()):
+        print(restriction_enzyme + " cuts after " + (', '.join(str(cut) for cut in cuts) if cuts else "(no sites)"))
+        if fragments.get('blocked', {}).get(restriction_enzyme):
+            print("Note: " + str(fragments['blocked'][restriction_enzyme]) + " " + restriction_enzyme + " site(s) blocked by " + fragments['host'] + " methylation!")
+    print("Fragments of the " + str(fragments['length']) + " bp " + topology + " target DNA (bp): " + ', '.join(str(size) for size in sorted(fragments['fragments'], reverse=True)))
+    for restriction_enzyme in fragments['unknown']:
+        print("Note: The cut positions of " + restriction_enzyme + " are unknown, it is not included in the fragment sizes!")
 
-def run():
-    # Set up command line
-    parser = argparse.ArgumentParser(description='reoptimize calculates enzyme amounts and possible buffers for restriction digests of DNA.\n\nUSAGE EXAMPLES:\n\nDigest a plasmid that has two EcoRI sites and one HindIII site with EcoRI and HindIII:\nreoptimize -e \'EcoRI 2\' \'HindIII 1\'\n\nDigest in 4 hours 4 µg of a 3000-bp plasmid that has 3 EcoRI sites and 5 HindIII sites with EcoRI and HindIII:\nreoptimize -e \'EcoRI 3\' \'HindIII 5\' -t 2 -l 3000 -m 4\n\nIf you don\'t specify time, target DNA length, DNA amount and number of restriction sites\ndefault values are assumed as follows:\n1 hour, 5000 bp, 1 µg, 1 restriction site/plasmid for all enzymes used', formatter_class=RawTextHelpFormatter)
+
+# Set up command line. argparse is imported here and not at module level,
+# since importing reoptimize as a library does not need it.
+def build_parser():
+    import argparse
+    from . import methylation
+    from argparse import RawTextHelpFormatter
+    parser = argparse.ArgumentParser(description='reoptimize calculates enzyme amounts and possible buffers for restriction digests of DNA.\n\nUSAGE EXAMPLES:\n\nDigest a plasmid that has two EcoRI sites and one HindIII site with EcoRI and HindIII:\nreoptimize -e \'EcoRI 2\' \'HindIII 1\'\n\nDigest in 4 hours 4 µg of a 3000-bp plasmid that has 3 EcoRI sites and 5 HindIII sites with EcoRI and HindIII:\nreoptimize -e \'EcoRI 3\' \'HindIII 5\' -t 2 -l 3000 -m 4\n\nIf you don\'t specify time, target DNA length, DNA amount and number of restriction sites\ndefault values are assumed as follows:\n1 hour, 5000 bp, 1 µg, 1 restriction site/plasmid for all enzymes used', epilog='Other commands (see reoptimize <command> --help):\n' + '\n'.join(sorted(commands)), formatter_class=RawTextHelpFormatter)
     parser.add_argument('-e','--enzyme', help='Restriction Enzyme', required=True, nargs='+')
     parser.add_argument('-m','--microgram', help='DNA amount (in µg)', default=1, type=float, nargs='?')
     parser.add_argument('-l','--length', help='Length of target DNA (in bp)', default=5000, type=int, nargs='?')
     parser.add_argument('-t','--time', help='Digestion time (in hours)', default=1, type=float, nargs='?')
+    parser.add_argument('--database', help='Enzyme database file (default: $REOPTIMIZE_DATABASE or REsqlite3.db in the package directory)')
+    parser.add_argument('--profile', help='Print the time spent in each stage of the calculation', action='store_true')
+    parser.add_argument('--profile-output', help='Write cProfile data (for pstats) to this file', metavar='FILE')
+    parser.add_argument('--sequence', help='Sequence of the target DNA (FASTA, GenBank or plain sequence file): print the fragment sizes', metavar='FILE')
+    topology = parser.add_mutually_exclusive_group()
+    topology.add_argument('--circular', help='The target DNA is circular (default for GenBank files: from the LOCUS line, otherwise linear)', action='store_true')
+    topology.add_argument('--linear', help='The target DNA is linear', action='store_true')
+    parser.add_argument('--index', help='Scan index of a sequence collection (see reoptimize index --help): the sites of the --sequence are read from it, if it has the sequence', metavar='FILE')
+    parser.add_argument('--substitute', help='Replace enzymes that are not in the database by an isoschizomer that is', action='store_true')
+    parser.add_argument('--objective', help='Rank the possible buffers by the highest mean activity (default), the highest minimum activity, the fewest units, the lowest cost (needs --prices) or the fewest supplements', choices=sorted(ranking.objectives), default=ranking.default_objective)
+    parser.add_argument('--prices', help='Price table for --objective cost (CSV, see reoptimize cost --help)', metavar='FILE')
+    parser.add_argument('--plan-cache', help='Plan cache shared by the planner processes (SQLite file, default: $REOPTIMIZE_PLAN_CACHE, see plancache.py)', metavar='FILE')
+    parser.add_argument('--host', help='Host the target DNA was isolated from: sites blocked by its methylation are not counted (with --sequence).\necoli: dam+ dcm+, dam-/dcm-: E. coli without Dam or Dcm, mammalian: CpG (default: none)', choices=sorted(methylation.hosts))
+    return parser
+
+# Commands other than the digest calculation: "reoptimize <command> ..."
+# runs the run() function of the module
+commands = {'batch': 'batch', 'sites': 'sites', 'diagnose': 'diagnose', 'index': 'scanindex', 'count': 'count', 'incubation': 'incubation', 'cost': 'cost', 'plate': 'plate', 'schedule': 'schedule', 'worklist': 'worklist', 'snapshot': 'snapshot'}
+
+def run():
+    if len(sys.argv) > 1 and sys.argv[1] in commands:
+        import importlib
+        module = importlib.import_module('.' + commands[sys.argv[1]], __package__)
+        module.run(sys.argv[2:])
+        return
+    parser = build_parser()
     # Parse command line arguments
     args = vars(parser.parse_args())
+    prices = None
+    if args['objective'] == 'cost':
+        if not args['prices']:
+            parser.error("--objective cost needs --prices")
+        from . import cost
+        prices = cost.unit_prices(cost.read_prices(args['prices']))
+    if args['plan_cache']:
+        plancache.configure(args['plan_cache'])
     debug_print(args['enzyme'], args['microgram'], args['length'], args['time'])
     # Call the main function
-    digest(args['enzyme'], args['microgram'], args['length'], args['time'])
+    sequence = None
+    circular = False
+    if args['sequence']:
+        from . import sequence as sequence_file
+        record = sequence_file.read_sequence(args['sequence'])
+        sequence = record['sequence']
+        circular = bool(record['circular'])
+        if args['circular'] or args['linear']:
+            circular = args['circular']
+    try:
+        digest(args['enzyme'], args['microgram'], args['length'], args['time'], sqlite_file=args['database'], profile=args['profile'], profile_output=args['profile_output'], sequence=sequence, circular=circular, host=args['host'], substitute=args['substitute'], index=args['index'], objective=args['objective'], prices=prices)
+    except ValueError as err:
+        # e.g. no price of an enzyme for the cost objective
+        sys.exit(str(err))
 
 if __name__ == '__main__':
     run()
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+#
+# Search a DNA sequence for the recognition sites of many enzymes at once.
+#
+# Example: scanner = Scanner(['GAATTC', 'GGTCTC', 'GCCNNNNNGGC'])
+#          hits = scanner.scan(sequence, circular=True)
+#
+# All sites are found in a single pass over the sequence, with an
+# Aho-Corasick automaton (a finite state machine that is in a state for
+# every prefix of every pattern and moves to the next state with every
+# base of the sequence).
+#
+# Recognition sites may contain ambiguous bases (IUPAC codes, e.g.
+# GCCNNNNNGGC for BglI). Expanding all of them would give far too many
+# patterns, so for every site only the "anchor", the part of the site with
+# the most information that can be expanded into at most max_expansions
+# patterns (GCC for BglI, the whole site for GAATTC), goes into the
+# automaton. When an anchor is found, the rest of the site is checked.
+#
+# Both strands are searched: for sites that are not palindromic, the
+# reverse complement of the site is searched, too. Circular sequences are
+# searched across the end (origin) of the sequence.
+#
+# Sequences that don't fit into memory (whole genomes, BAC libraries) are
+# searched piece by piece with Scanner.scan_stream(): the sequence is cut
+# into windows of window_size bases that overlap by the length of the
+# longest site less one, so every site is completely inside a window and
+# is reported by exactly one of them. Only one window is held in memory.
+# For a few sites, the windows are searched with one regular expression
+# per site and strand (the re module searches much faster than the
+# automaton, which runs in Python); for many sites, with the automaton.
+
+# Bases matched by the IUPAC codes
+iupac = {'A': 'A', 'C': 'C', 'G': 'G', 'T': 'T',
+         'R': 'AG', 'Y': 'CT', 'S': 'CG', 'W': 'AT', 'K': 'GT', 'M': 'AC',
+         'B': 'CGT', 'D': 'AGT', 'H': 'ACT', 'V': 'ACG', 'N': 'ACGT'}
+
+complement = {'A': 'T', 'C': 'G', 'G': 'C', 'T': 'A',
+              'R': 'Y', 'Y': 'R', 'S': 'S', 'W': 'W', 'K': 'M', 'M': 'K',
+              'B': 'V', 'D': 'H', 'H': 'D', 'V': 'B', 'N': 'N'}
+
+# Bit of every base (A = 1, C = 2, G = 4, T = 8) and the bits of every IUPAC code
+base_bit = {'A': 1, 'C': 2, 'G': 4, 'T': 8}
+iupac_bits = {code: sum(base_bit[base] for base in bases) for code, bases in iupac.items()}
+
+# Translation tables for sequences: base => symbol of the automaton (0-3,
+# 4 for anything else) and base => bit (0 for anything else)
+symbol_table = bytes([{'A': 0, 'C': 1, 'G': 2, 'T': 3}.get(chr(byte).upper(), 4) for byte in range(256)])
+bit_table = bytes([base_bit.get(chr(byte).upper(), 0) for byte in range(256)])
+symbols = 5
+
+# Maximum number of patterns an anchor may be expanded into
+max_expansions = 16
+
+# Size of the windows of scan_stream() (in bases)
+window_size = 1 << 20
+# scan_stream() uses regular expressions for up to this many sites
+max_regex_sites = 8
+
+def reverse_complement(site):
+    return ''.join(complement[code] for code in reversed(site.upper()))
+
+def is_palindromic(site):
+    return site.upper() == reverse_complement(site)
+
+# Find the anchor of a site: (start, end) of the part without N that can
+# be expanded into at most max_expansions patterns and has the most
+# information (in bits, log2 4 = 2 for a base, 1 for R, Y, ...).
+def find_anchor(site):
+    import math
+    best = None
+    for start in range(len(site)):
+        count = 1
+        information = 0
+        for end in range(start, len(site)):
+            count *= len(iupac[site[end]])
+            if site[end] == 'N' or count > max_expansions:
+                break
+            information += math.log2(4 / len(iupac[site[end]]))
+            if best is None or information > best[0]:
+                best = (information, start, end + 1)
+    if best is None:
+        return None
+    return best[1], best[2]
+
+# All sequences matched by a site without N (e.g. RGC => AGC, GGC)
+def expand(site):
+    result = ['']
+    for code in site:
+        result = [prefix + base for prefix in result for base in iupac[code]]
+    return result
+
+# Whether two copies of a site can overlap (e.g. ATAT at ATATAT)
+def self_overlapping(site):
+    for shift in range(1, len(site)):
+        if all(iupac_bits[site[position + shift]] & iupac_bits[site[position]] for position in range(len(site) - shift)):
+            return True
+    return False
+
+# Compiled regular expression (for upper case bytes) that finds a site. A
+# site that can overlap itself is searched with a lookahead, so that all
+# overlapping copies are found.
+def site_regex(site):
+    import re
+    pattern = ''.join(code if len(iupac[code]) == 1 else '[' + iupac[code] + ']' for code in site)
+    if self_overlapping(site):
+        pattern = '(?=' + pattern + ')'
+    return re.compile(pattern.encode('ascii'))
+
+class Scanner:
+    # sites: the recognition sites (IUPAC codes, upper case)
+    def __init__(self, sites):
+        self.sites = list(dict.fromkeys(site.upper() for site in sites))
+        self.max_length = max([len(site) for site in self.sites] + [1])
+        # Patterns: (pattern, output), output = (site index, strand,
+        # length of the site, end of the anchor in the site, checks of the
+        # rest of the site as (position in the site, bits))
+        patterns = []
+        for index, site in enumerate(self.sites):
+            orientations = [(site, 1)]
+            if not is_palindromic(site):
+                orientations.append((reverse_complement(site), -1))
+            for oriented, strand in orientations:
+                anchor = find_anchor(oriented)
+                if anchor is None:
+                    continue
+                start, end = anchor
+                checks = tuple((position, iupac_bits[code]) for position, code in enumerate(oriented)
+                               if (position < start or position >= end) and code != 'N')
+                for pattern in expand(oriented[start:end]):
+                    patterns.append((pattern, (index, strand, len(oriented), end - 1, checks)))
+        self.build(patterns)
+
+    # Build the automaton. The state numbers are multiplied by the number
+    # of symbols, so that the next state is delta[state + symbol].
+    def build(self, patterns):
+        goto = [{}]
+        outputs = [[]]
+        for pattern, output in patterns:
+            state = 0
+            for base in pattern:
+                symbol = 'ACGT'.index(base)
+                if symbol not in goto[state]:
+                    goto.append({})
+                    outputs.append([])
+                    goto[state][symbol] = len(goto) - 1
+                state = goto[state][symbol]
+            outputs[state].append(output)
+        # Breadth first: failure links and the complete transition table
+        delta = [0] * (len(goto) * symbols)
+        failure = [0] * len(goto)
+        queue = []
+        for symbol in range(4):
+            if symbol in goto[0]:
+                delta[symbol] = goto[0][symbol] * symbols
+                queue.append(goto[0][symbol])
+        for state in queue:
+            outputs[state] = outputs[state] + outputs[failure[state]]
+            for symbol in range(4):
+                if symbol in goto[state]:
+                    child = goto[state][symbol]
+                    failure[child] = delta[failure[state] * symbols + symbol] // symbols
+                    delta[state * symbols + symbol] = child * symbols
+                    queue.append(child)
+                else:
+                    delta[state * symbols + symbol] = delta[failure[state] * symbols + symbol]
+        self.delta = delta
+        # Outputs by (multiplied) state number, None if there are none
+        self.outputs = [None] * (len(goto) * symbols)
+        for state, output in enumerate(outputs):
+            if output:
+                self.outputs[state * symbols] = tuple(output)
+        self.states = len(goto)
+
+    # Find all sites in a sequence. Returns a list with the hits of every
+    # site (in the order of self.sites): [(position, strand), ...], where
+    # position is the 0-based start of the site on the top strand and
+    # strand is 1 or -1 (the reverse complement of the site was found).
+    def scan(self, sequence, circular=False):
+        if isinstance(sequence, str):
+            sequence = sequence.encode('ascii', 'replace')
+        length = len(sequence)
+        if circular and length > 0:
+            # Sites across the origin
+            sequence = sequence + (sequence * (1 + self.max_length // length))[:self.max_length - 1]
+        codes = sequence.translate(symbol_table)
+        bits = sequence.translate(bit_table)
+        scanned = len(sequence)
+        hits = [[] for site in self.sites]
+        delta = self.delta
+        outputs = self.outputs
+        state = 0
+        for i, symbol in enumerate(codes):
+            state = delta[state + symbol]
+            output = outputs[state]
+            if output is None:
+                continue
+            for index, strand, site_length, anchor_end, checks in output:
+                start = i - anchor_end
+                if start < 0 or start >= length or start + site_length > scanned:
+                    continue
+                for position, site_bits in checks:
+                    if not bits[start + position] & site_bits:
+                        break
+                else:
+                    hits[index].append((start, strand))
+        return hits
+
+    # Regular expressions for the windows of scan_stream(): (site index,
+    # strand, regular expression). Sites without an anchor are left out,
+    # like in the automaton.
+    def regexes(self):
+        if getattr(self, '_regexes', None) is None:
+            self._regexes = []
+            for index, site in enumerate(self.sites):
+                orientations = [(site, 1)]
+                if not is_palindromic(site):
+                    orientations.append((reverse_complement(site), -1))
+                for oriented, strand in orientations:
+                    if find_anchor(oriented) is not None:
+                        self._regexes.append((index, strand, site_regex(oriented)))
+        return self._regexes
+
+    # All sites in a linear window: yields (site index, start, strand)
+    def window_hits(self, window):
+        if len(self.sites) <= max_regex_sites:
+            window = window.upper()
+            for index, strand, regex in self.regexes():
+                for match in regex.finditer(window):
+                    yield index, match.start(), strand
+        else:
+            for index, site_hits in enumerate(self.scan(window)):
+                for start, strand in site_hits:
+                    yield index, start, strand
+
+    # Find all sites in a sequence that is given in pieces (bytes or str,
+    # e.g. from sequence.stream_sequences()). Yields (site index, position,
+    # strand) for every hit (in the order of the windows, not sorted).
+    # Memory use doesn't depend on the length of the sequence.
+    def scan_stream(self, pieces, circular=False, window=window_size):
+        overlap = self.max_length - 1
+        window = max(window, 2 * self.max_length)
+        pending = bytearray()
+        # Position of pending[0] in the sequence
+        offset = 0
+        # The first bases, for the sites across the origin
+        head = None
+        for piece in pieces:
+            if isinstance(piece, str):
+                piece = piece.encode('ascii', 'replace')
+            pending += piece
+            while len(pending) >= window + overlap:
+                data = bytes(pending[:window + overlap])
+                if head is None:
+                    head = data[:overlap]
+                # Sites that start in the overlap are reported by the next window
+                for index, start, strand in self.window_hits(data):
+                    if start < window:
+                        yield index, offset + start, strand
+                del pending[:window]
+                offset += window
+        data = bytes(pending)
+        if head is None:
+            # The whole sequence fits into one window
+            for index, site_hits in enumerate(self.scan(data, circular)):
+                for start, strand in site_hits:
+                    yield index, start, strand
+            return
+        end = len(data)
+        if circular:
+            data += head
+        for index, start, strand in self.window_hits(data):
+            if start < end:
+                yield index, offset + start, strand
+
+    # Number of hits of every site (in the order of self.sites) and the
+    # length of a sequence given in pieces (see scan_stream())
+    def count_stream(self, pieces, circular=False, window=window_size):
+        counts = [0] * len(self.sites)
+        length = [0]
+        def measured():
+            for piece in pieces:
+                length[0] += len(piece)
+                yield piece
+        for index, position, strand in self.scan_stream(measured(), circular, window):
+            counts[index] += 1
+        return counts, length[0]
+
+# Scanners for sets of sites (building one takes some ms), by sites
+scanner_cache = {}
+
+def scanner_for(sites):
+    key = tuple(sorted(set(site.upper() for site in sites)))
+    scanner = scanner_cache.get(key)
+    if scanner is None:
+        scanner = scanner_cache[key] = Scanner(key)
+    return scanner
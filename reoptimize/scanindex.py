@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+#
+# Scan index: the sites of all enzymes in all sequences of a collection,
+# found once and stored in a file, so that digests of the same sequences
+# can be planned again and again without searching them.
+#
+# Example: reoptimize index plasmids.gb more_plasmids.fasta -o plasmids.idx
+#          reoptimize -e 'EcoRI' 'HindIII' --sequence pUC19.gb --index plasmids.idx
+#
+# The index holds, for every sequence, the hits of the recognition sites
+# of all enzymes in Restriction_Dictionary and of the methylation motifs
+# (see methylation.py) on both strands, as scan.py finds them.
+# Cut positions, site counts and sites blocked by methylation are
+# calculated from them as from a scan (see fragments.py).
+#
+# File format (all numbers little-endian):
+# - magic (8 bytes), format version (4 bytes), length of the table of
+#   contents (4 bytes)
+# - table of contents: zlib-compressed JSON with the sites (in the order
+#   of the hit lists), the length of the longest site, the catalogue
+#   version (a hash of the sites) and for every sequence its name, content
+#   hash, length, topology and the offset and size of its block
+# - one zlib-compressed block per sequence: the number of hits of every
+#   site (4 bytes each), then the hits of all sites (4 bytes each:
+#   position * 2, plus 1 for hits on the bottom strand; sorted, and stored
+#   as the difference to the previous hit of the site)
+#
+# The file is memory-mapped and only the block of the requested sequence
+# is decompressed. A sequence is found by the hash of its content (and
+# topology), not by its name. When an index is built again, the blocks of
+# sequences whose hash hasn't changed are copied from the old index, only
+# new and edited sequences are searched.
+import sys, os, struct, json, zlib, hashlib, array, itertools
+
+magic = b'REOPTIDX'
+version = 1
+header = struct.Struct('<8sII')
+
+# The sites that are indexed: the sites of all enzymes in
+# Restriction_Dictionary (except the ones with two sites, e.g. AloI
+# written with "|") and the methylation motifs
+def indexed_sites():
+    from . import enzymes, methylation
+    sites = set()
+    for data in enzymes.rest_dict().values():
+        if '|' not in data['site']:
+            sites.add(data['site'].upper())
+    for site, offsets in methylation.motifs.values():
+        sites.add(site)
+    return sorted(sites)
+
+# Version of the catalogue: indexes made with other sites are rebuilt
+def catalogue_version(sites):
+    return hashlib.sha1('\n'.join(sites).encode('ascii')).hexdigest()
+
+# Hash of the content of a sequence (the topology changes the hits across
+# the origin, so it is part of the hash)
+def content_hash(sequence, circular):
+    digest = hashlib.sha1(b'circular\n' if circular else b'linear\n')
+    digest.update(sequence.encode('ascii', 'replace') if isinstance(sequence, str) else sequence)
+    return digest.hexdigest()
+
+# The hits of every site are sorted and stored as differences to the
+# previous hit, which compresses much better than the positions
+def encode_block(hits):
+    counts = array.array('I', (len(site_hits) for site_hits in hits))
+    values = array.array('I')
+    for site_hits in hits:
+        previous = 0
+        for value in sorted(position * 2 + (strand == -1) for position, strand in site_hits):
+            values.append(value - previous)
+            previous = value
+    if sys.byteorder == 'big':
+        counts.byteswap()
+        values.byteswap()
+    return zlib.compress(counts.tobytes() + values.tobytes())
+
+# Hits of the wanted sites (all if wanted is None) in a block
+def decode_block(block, sites, wanted=None):
+    data = zlib.decompress(block)
+    counts = array.array('I')
+    counts.frombytes(data[:4 * len(sites)])
+    values = array.array('I')
+    values.frombytes(data[4 * len(sites):])
+    if sys.byteorder == 'big':
+        counts.byteswap()
+        values.byteswap()
+    by_site = {}
+    start = 0
+    for site, count in zip(sites, counts):
+        if wanted is None or site in wanted:
+            by_site[site] = [(value >> 1, -1 if value & 1 else 1) for value in itertools.accumulate(values[start:start + count])]
+        start += count
+    return by_site
+
+class ScanIndex:
+    def __init__(self, filename):
+        import mmap
+        self.filename = filename
+        self.file = open(filename, 'rb')
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # An empty file can't be mapped
+            self.file.close()
+            raise ValueError(filename + " is not a scan index")
+        if len(self.map) < header.size:
+            self.close()
+            raise ValueError(filename + " is not a scan index")
+        file_magic, file_version, toc_size = header.unpack_from(self.map, 0)
+        if file_magic != magic or file_version != version:
+            self.close()
+            raise ValueError(filename + " is not a scan index (or of another version)")
+        toc = json.loads(zlib.decompress(self.map[header.size:header.size + toc_size]).decode('utf-8'))
+        self.data_start = header.size + toc_size
+        self.sites = toc['sites']
+        self.max_length = toc['max_length']
+        self.catalogue = toc['catalogue']
+        self.sequences = toc['sequences']
+        self.by_hash = {entry['hash']: entry for entry in self.sequences}
+
+    # The compressed block of a sequence (see the table of contents)
+    def block(self, entry):
+        start = self.data_start + entry['offset']
+        return self.map[start:start + entry['size']]
+
+    # The hits of the sites in a sequence ({site: [(position, strand)]},
+    # like scan.Scanner.scan(), but sorted), of all sites if sites is None.
+    # None if the sequence is not in the index.
+    def hits(self, sequence, circular, sites=None):
+        entry = self.by_hash.get(content_hash(sequence, circular))
+        if entry is None:
+            return None
+        return decode_block(self.block(entry), self.sites, sites)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+# Opened indexes, by file name. An index that has been rebuilt since it
+# was opened is closed and opened again.
+index_cache = {}
+
+def index_for(filename):
+    try:
+        stat = os.stat(filename)
+    except OSError as err:
+        sys.exit("Error opening scan index " + filename + ". Error: " + str(err))
+    stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    cached = index_cache.get(filename)
+    if cached is not None:
+        if cached[0] == stamp:
+            return cached[1]
+        del index_cache[filename]
+        cached[1].close()
+    try:
+        index = ScanIndex(filename)
+    except ValueError as err:
+        sys.exit(str(err))
+    index_cache[filename] = (stamp, index)
+    return index
+
+# Hits of all sites in a sequence from an index file ({site: hits}), and
+# the length of the longest site. None if the index doesn't have the
+# sequence or some of the sites.
+def lookup(filename, sequence, circular, sites):
+    index = index_for(filename)
+    sites = set(site.upper() for site in sites)
+    by_site = index.hits(sequence, circular, sites)
+    if by_site is None or len(by_site) < len(sites):
+        return None
+    return by_site, index.max_length
+
+# Build the index for the sequences (records of sequence.py) and write it
+# to filename. If filename is an index for the same sites, the blocks of
+# unchanged sequences are taken from it. Returns (sequences searched,
+# sequences taken from the old index).
+def build_index(records, filename):
+    from . import scan, database
+    sites = indexed_sites()
+    catalogue = catalogue_version(sites)
+    old = None
+    if os.path.exists(filename):
+        try:
+            old = ScanIndex(filename)
+        except (ValueError, OSError, zlib.error):
+            old = None
+        if old is not None and old.catalogue != catalogue:
+            old.close()
+            old = None
+    scanner = None
+    entries = []
+    blocks = []
+    offset = 0
+    searched = reused = 0
+    for record in records:
+        circular = bool(record['circular'])
+        key = content_hash(record['sequence'], circular)
+        if old is not None and key in old.by_hash:
+            block = bytes(old.block(old.by_hash[key]))
+            reused += 1
+        else:
+            if scanner is None:
+                scanner = scan.scanner_for(sites)
+            block = encode_block(scanner.scan(record['sequence'], circular))
+            searched += 1
+        entries.append({'name': record['name'],
+                        'hash': key,
+                        'length': len(record['sequence']),
+                        'circular': circular,
+                        'offset': offset,
+                        'size': len(block)})
+        blocks.append(block)
+        offset += len(block)
+    if old is not None:
+        old.close()
+    toc = zlib.compress(json.dumps({'catalogue': catalogue,
+                                    'sites': sites,
+                                    'max_length': max(len(site) for site in sites),
+                                    'sequences': entries}).encode('utf-8'))
+    # Written to a temporary file that replaces the index when it is
+    # complete, like the enzyme database (see database.publish())
+    temporary_file = database.temporary_name(filename)
+    with open(temporary_file, 'wb') as f:
+        f.write(header.pack(magic, version, len(toc)))
+        f.write(toc)
+        for block in blocks:
+            f.write(block)
+    database.publish(temporary_file, filename)
+    return searched, reused
+
+def run(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog='reoptimize index', description='Find the sites of all enzymes in a collection of sequences and store them in an index file, for reoptimize --sequence ... --index.')
+    parser.add_argument('sequences', help='Sequence files (FASTA, GenBank or plain sequence, may be gzipped)', nargs='+')
+    parser.add_argument('-o','--output', help='Index file (default: the first sequence file + .idx). An existing index is updated: only new and changed sequences are searched.')
+    topology = parser.add_mutually_exclusive_group()
+    topology.add_argument('--circular', help='The sequences are circular (default for GenBank files: from the LOCUS line, otherwise linear)', action='store_true')
+    topology.add_argument('--linear', help='The sequences are linear', action='store_true')
+    args = parser.parse_args(argv)
+
+    from . import sequence
+    output = args.output or args.sequences[0] + '.idx'
+    records = []
+    for filename in args.sequences:
+        for record in sequence.read_sequences(filename):
+            if args.circular or args.linear:
+                record['circular'] = args.circular
+            records.append(record)
+    searched, reused = build_index(records, output)
+    print(str(len(records)) + " sequences in " + output + " (" + str(searched) + " searched, " + str(reused) + " unchanged)")
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+#
+# Incubator schedule for a batch of digests.
+#
+# Example: reoptimize schedule digests.jsonl --capacity 96 --tolerance 25
+#
+# Every digest (same input as batch mode) needs one or more incubations:
+# a digest whose enzymes share a temperature is one incubation at that
+# temperature for its "time"; a sequential digest (see
+# sequential.py) is one incubation per digest and heat inactivation step,
+# in that order (clean-ups are done outside the incubator). With
+# --inactivate, the enzymes that are still active at the end are heat
+# inactivated (inact_temp in Restriction_Dictionary, if all of them can
+# be; otherwise the digest is marked for a clean-up).
+#
+# The incubations are packed into incubator runs (one temperature and one
+# duration each, at most --capacity digests). An incubation fits into a
+# run at its temperature that is at most --tolerance % longer than it
+# needs. The n-th incubations of all digests form stage n, and all runs of
+# a stage are done before those of the next stage, so the steps of every
+# digest stay in order. Within a stage and temperature, the incubations are
+# sorted by duration, longest first, and every run takes the next
+# incubations as long as they are compatible with its duration and there
+# is room (first fit decreasing: as every digest takes one place, this
+# gives the fewest runs). This needs one sort, so thousands of digests
+# are scheduled at once; only the incubations are kept, not the plans.
+import sys, itertools, textwrap
+
+from . import enzymes, sequential, incubation
+
+# Default capacity of a run (digests) and tolerance of the duration (%)
+capacity = 96
+tolerance = 0
+
+# The incubations of a plan (reoptimize.plan_digest()), in order:
+# [action, temperature, minutes, clean-up afterwards]. Returns None if the
+# enzymes need different temperatures but there is no sequential plan
+# (too many enzymes).
+def incubations(plan, inactivate=False):
+    steps = []
+    active = set()
+    if plan.sequential is not None:
+        for step in plan.sequential['steps']:
+            if step.action == 'cleanup':
+                if steps:
+                    steps[-1][3] = True
+                active = set()
+                continue
+            steps.append([step.action, step.temperature, step.minutes, False])
+            active = active | set(step.enzymes) if step.action == 'digest' else set()
+    else:
+        temperatures = set(record.reaction_temperature for record in plan.enzymes.values())
+        if len(temperatures) != 1:
+            return None
+        steps.append(['digest', temperatures.pop(), plan.time * 60, False])
+        active = set(plan.enzymes)
+    if inactivate and active:
+        inactivation = [enzymes.inactivation_temperature(name) for name in sorted(active)]
+        if all(temperature and temperature > plan.enzymes[name].reaction_temperature for name, temperature in zip(sorted(active), inactivation)):
+            steps.append(['heat_inactivation', max(inactivation), sequential.heat_inactivation_minutes, False])
+        else:
+            steps[-1][3] = True
+    return steps
+
+# Pack the incubations of one stage and temperature (items: (minutes,
+# label)) into runs: [[minutes, [labels]]], longest first
+def pack(items, capacity=capacity, tolerance=tolerance):
+    runs = []
+    run = None
+    for minutes, label in sorted(items, key=lambda item: -item[0]):
+        if run is None or run[0] > minutes * (1 + tolerance / 100) or (capacity and len(run[1]) >= capacity):
+            run = [minutes, []]
+            runs.append(run)
+        run[1].append(label)
+    return runs
+
+# Collects the incubations of a batch
+class Scheduler:
+    def __init__(self, capacity=capacity, tolerance=tolerance, inactivate=False):
+        self.capacity = capacity
+        self.tolerance = tolerance
+        self.inactivate = inactivate
+        # Incubations by (stage, temperature): [(minutes, (id, step,
+        # action, clean-up afterwards))]
+        self.stages = {}
+        # Digests without incubations: (id, reason)
+        self.unscheduled = []
+        self.digests = 0
+
+    # Add a planned digest (as yielded by batch.plan_batch())
+    def add(self, request, plan, error=None):
+        self.digests += 1
+        label = request.get('id')
+        if error is not None:
+            self.unscheduled.append((label, str(error)))
+            return
+        steps = incubations(plan, self.inactivate)
+        if not steps:
+            self.unscheduled.append((label, "needs several temperatures, but has too many enzymes for a sequential digest"))
+            return
+        for stage, (action, temperature, minutes, cleanup) in enumerate(steps, 1):
+            self.stages.setdefault((stage, temperature), []).append((minutes, (label, stage, action, cleanup)))
+
+    # The schedule: dictionary with 'digests', 'runs' (every run with
+    # 'number', 'stage', 'temperature', 'minutes' and 'digests': 'id',
+    # 'step', 'action', 'cleanup_after'), 'minutes' (total time of all
+    # runs) and 'unscheduled' ('id', 'reason')
+    def schedule(self):
+        runs = []
+        for stage, temperature in sorted(self.stages):
+            for minutes, labels in pack(self.stages[stage, temperature], self.capacity, self.tolerance):
+                runs.append({'number': len(runs) + 1,
+                             'stage': stage,
+                             'temperature': temperature,
+                             'minutes': minutes,
+                             'digests': [{'id': label, 'step': step, 'action': action, 'cleanup_after': cleanup} for label, step, action, cleanup in labels]})
+        return {'digests': self.digests,
+                'runs': runs,
+                'minutes': sum(run['minutes'] for run in runs),
+                'unscheduled': [{'id': label, 'reason': reason} for label, reason in self.unscheduled]}
+
+def format_incubation(digest):
+    notes = []
+    if digest['step'] > 1:
+        notes.append("step " + str(digest['step']))
+    if digest['action'] == 'heat_inactivation':
+        notes.append("heat inactivation")
+    if digest['cleanup_after']:
+        notes.append("clean up afterwards")
+    return str(digest['id']) + (" (" + ", ".join(notes) + ")" if notes else "")
+
+def print_schedule(result):
+    print(str(result['digests']) + " digests in " + str(len(result['runs'])) + " incubator runs (" + incubation.format_minutes(round(result['minutes'])) + " in total)")
+    for stage, runs in itertools.groupby(result['runs'], key=lambda run: run['stage']):
+        print("")
+        print("Stage " + str(stage) + ":")
+        for run in runs:
+            print("Run " + str(run['number']) + ": " + str(run['temperature']) + " °C, " + incubation.format_minutes(round(run['minutes'])) + ", " + str(len(run['digests'])) + " digests")
+            print(textwrap.fill(", ".join(format_incubation(digest) for digest in run['digests']), width=79, initial_indent="  ", subsequent_indent="  "))
+    if result['unscheduled']:
+        print("")
+        print("Digests without an incubator run:")
+        for digest in result['unscheduled']:
+            print("  " + str(digest['id']) + ": " + digest['reason'])
+
+def run(argv=None):
+    import argparse, json
+    from . import batch
+    parser = argparse.ArgumentParser(prog='reoptimize schedule', description='Pack the incubations of a batch of digests into the fewest incubator runs (one temperature and duration each).')
+    parser.add_argument('input', help='JSON lines file with the digests, as for reoptimize batch (default: stdin)', nargs='?')
+    parser.add_argument('--capacity', help='Digests per incubator run, 0 for no limit (default: %d)' % capacity, default=capacity, type=int)
+    parser.add_argument('--tolerance', help='An incubation may be this much longer than the digest needs (default: %d%%)' % tolerance, default=tolerance, type=float)
+    parser.add_argument('--inactivate', help='Heat inactivate the enzymes at the end of every digest', action='store_true')
+    parser.add_argument('--database', help='Enzyme database file (default: $REOPTIMIZE_DATABASE or REsqlite3.db in the package directory)')
+    parser.add_argument('--json', help='Write the schedule as JSON', action='store_true')
+    args = parser.parse_args(argv)
+    if args.capacity < 0 or args.tolerance < 0:
+        parser.error("The capacity and the tolerance must not be negative")
+
+    scheduler = Scheduler(args.capacity, args.tolerance, args.inactivate)
+    infile = open(args.input, encoding='utf-8') if args.input else sys.stdin
+    try:
+        for request, plan, error in batch.plan_batch(batch.read_requests(infile), args.database):
+            scheduler.add(request, plan, error)
+    finally:
+        if args.input:
+            infile.close()
+    result = scheduler.schedule()
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+    else:
+        print_schedule(result)
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+#
+# Read DNA sequences from FASTA files, GenBank files or files that contain
+# only the sequence. Files may be compressed with gzip.
+#
+# read_sequences() returns a list of records, one for every sequence in
+# the file: {'name': ..., 'sequence': ... (upper case, without spaces and
+# numbers), 'circular': True/False/None}. circular is taken from the
+# LOCUS line of GenBank files and is None if the topology is unknown.
+# Records of GenBank files also have 'features' (see parse_features()).
+#
+# stream_sequences() reads the sequences piece by piece instead, for
+# sequences that are too large to be read at once (see scan.py).
+import sys, os, gzip
+
+def open_text(filename):
+    with open(filename, 'rb') as f:
+        magic = f.read(2)
+    if magic == b'\x1f\x8b':
+        return gzip.open(filename, 'rt', encoding='utf-8', errors='replace')
+    return open(filename, encoding='utf-8', errors='replace')
+
+# Remove everything that is not a letter (spaces, numbers of GenBank
+# sequence lines) and convert to upper case
+def clean(text):
+    return ''.join(character for character in text if character.isalpha()).upper()
+
+def read_fasta(lines):
+    records = []
+    name = None
+    parts = []
+    for line in lines:
+        if line.startswith('>'):
+            if name is not None:
+                records.append({'name': name, 'sequence': clean(''.join(parts)), 'circular': None})
+            header = line[1:].strip()
+            name = header.split()[0] if header else 'sequence' + str(len(records) + 1)
+            parts = []
+        elif not line.startswith(';'):
+            parts.append(line)
+    if name is not None:
+        records.append({'name': name, 'sequence': clean(''.join(parts)), 'circular': None})
+    return records
+
+# Qualifiers that name a feature, the first one a feature has is its name
+name_qualifiers = ('label', 'gene', 'product', 'standard_name', 'locus_tag', 'note')
+
+# Parts of a GenBank feature location: ([(start, end)], strand), 1-based
+# and inclusive. complement(), join() and order() are resolved, < and >
+# (partial features) ignored; a site between two bases (123^124) is the
+# two bases. Parts in other entries (J00194.1:100..202) are left out.
+def parse_location(location):
+    strand = -1 if location.startswith('complement(') else 1
+    for operator in ('complement(', 'join(', 'order(', ')', '<', '>'):
+        location = location.replace(operator, '')
+    parts = []
+    for item in location.split(','):
+        if ':' in item:
+            continue
+        bounds = item.replace('^', '..').split('..')
+        try:
+            start = int(bounds[0])
+            end = int(bounds[-1])
+        except ValueError:
+            continue
+        parts.append((start, end))
+    return parts, strand
+
+# Features of the feature table (the lines after FEATURES): a list of
+# {'type' (e.g. CDS, rep_origin, misc_feature), 'name' (the first of
+# name_qualifiers, otherwise the type), 'location' (as in the file),
+# 'parts' and 'strand' (see parse_location()), 'qualifiers' ({name: value},
+# the first value of every qualifier)}
+def parse_features(lines):
+    features = []
+    feature = None
+    qualifier = None
+    for line in lines:
+        key = line[5:21].strip()
+        text = line[21:].strip()
+        if key:
+            feature = {'type': key, 'location': text, 'qualifiers': {}}
+            features.append(feature)
+            qualifier = None
+        elif feature is None:
+            continue
+        elif text.startswith('/'):
+            name, equals, value = text[1:].partition('=')
+            # Only the first value of a qualifier is kept
+            qualifier = name if name not in feature['qualifiers'] else None
+            if qualifier is not None:
+                feature['qualifiers'][name] = value
+        elif qualifier is not None:
+            # Continued value (translations are continued without a space)
+            separator = '' if qualifier == 'translation' else ' '
+            feature['qualifiers'][qualifier] += separator + text
+        elif not feature['qualifiers']:
+            feature['location'] += text
+    for feature in features:
+        for name, value in feature['qualifiers'].items():
+            feature['qualifiers'][name] = value.strip('"')
+        feature['name'] = next((feature['qualifiers'][name] for name in name_qualifiers if feature['qualifiers'].get(name)), feature['type'])
+        feature['parts'], feature['strand'] = parse_location(feature['location'])
+    return features
+
+def read_genbank(lines):
+    records = []
+    record = None
+    in_sequence = False
+    in_features = False
+    parts = []
+    feature_lines = []
+    for line in lines:
+        # The feature table ends with the first line that is not indented
+        if in_features and not line.startswith(' '):
+            in_features = False
+        if line.startswith('LOCUS'):
+            fields = line.split()
+            record = {'name': fields[1] if len(fields) > 1 else 'sequence' + str(len(records) + 1),
+                      'sequence': '',
+                      'circular': 'circular' in fields[2:] if 'circular' in fields[2:] or 'linear' in fields[2:] else None,
+                      'features': []}
+            in_sequence = False
+            parts = []
+            feature_lines = []
+        elif line.startswith('FEATURES'):
+            in_features = True
+        elif in_features:
+            feature_lines.append(line)
+        elif line.startswith('ORIGIN'):
+            in_sequence = True
+        elif line.startswith('//'):
+            if record is not None:
+                record['sequence'] = clean(''.join(parts))
+                record['features'] = parse_features(feature_lines)
+                records.append(record)
+            record = None
+            in_sequence = False
+        elif in_sequence:
+            parts.append(line)
+    # A file without the final //
+    if record is not None and parts:
+        record['sequence'] = clean(''.join(parts))
+        record['features'] = parse_features(feature_lines)
+        records.append(record)
+    return records
+
+# Read all sequences of a file (the format is recognized by its content)
+def read_sequences(filename):
+    with open_text(filename) as f:
+        lines = f.readlines()
+    first = next((line for line in lines if line.strip() != ''), '')
+    if first.startswith('>'):
+        return read_fasta(lines)
+    if first.startswith('LOCUS'):
+        return read_genbank(lines)
+    # Only the sequence
+    name = os.path.basename(filename).split('.')[0]
+    return [{'name': name, 'sequence': clean(''.join(lines)), 'circular': None}]
+
+# Read the first sequence of a file
+def read_sequence(filename):
+    records = read_sequences(filename)
+    if not records or records[0]['sequence'] == '':
+        sys.exit("No sequence found in " + filename)
+    return records[0]
+
+def open_binary(filename):
+    with open(filename, 'rb') as f:
+        magic = f.read(2)
+    if magic == b'\x1f\x8b':
+        return gzip.open(filename, 'rb')
+    return open(filename, 'rb')
+
+# Bytes that are removed from sequence lines (everything that is not a
+# letter) and the translation to upper case
+not_letters = bytes(byte for byte in range(256) if not (65 <= byte <= 90 or 97 <= byte <= 122))
+upper_case = bytes(range(256)).upper()
+# Longest header line that is read (FASTA header, LOCUS line)
+max_header = 65536
+
+# Read the sequences of a file (FASTA, GenBank or only the sequence, may
+# be gzipped) piece by piece. Yields (number of the sequence, name,
+# circular, piece): the pieces are upper case bytes of about size bases;
+# the pieces of one sequence follow each other (use itertools.groupby()
+# on the number). Lines are read in parts of at most size bytes, so even
+# a FASTA file with the whole genome in one line is never read at once.
+# Sequences without any bases are left out.
+def stream_sequences(filename, size=1 << 20):
+    number = -1
+    name = None
+    circular = None
+    file_format = None
+    in_sequence = False
+    # The rest of the current line is not sequence (e.g. a long header)
+    skipping = False
+    at_line_start = True
+    parts = []
+    parts_size = 0
+    with open_binary(filename) as f:
+        for line in iter(lambda: f.readline(size), b''):
+            starts_line = at_line_start
+            at_line_start = line.endswith(b'\n')
+            if starts_line:
+                skipping = False
+                if file_format is None:
+                    if line.strip() == b'':
+                        continue
+                    if line.startswith(b'>'):
+                        file_format = 'fasta'
+                    elif line.startswith(b'LOCUS'):
+                        file_format = 'genbank'
+                    else:
+                        file_format = 'plain'
+                        number = 0
+                        name = os.path.basename(filename).split('.')[0]
+                        in_sequence = True
+                is_header = (file_format == 'fasta' and line[:1] in (b'>', b';')) or (file_format == 'genbank' and not (in_sequence and line[:1] == b' '))
+                if is_header:
+                    if parts:
+                        yield number, name, circular, b''.join(parts)
+                        parts = []
+                        parts_size = 0
+                    # The header line is read completely (up to max_header
+                    # bytes), the rest of a longer line is skipped
+                    while not line.endswith(b'\n') and len(line) < max_header:
+                        more = f.readline(size)
+                        if not more:
+                            break
+                        line += more
+                    at_line_start = line.endswith(b'\n')
+                    skipping = True
+                    text = line.decode('utf-8', 'replace')
+                    if file_format == 'fasta' and text.startswith('>'):
+                        number += 1
+                        header = text[1:].strip()
+                        name = header.split()[0] if header else 'sequence' + str(number + 1)
+                        in_sequence = True
+                    elif file_format == 'genbank' and text.startswith('LOCUS'):
+                        number += 1
+                        fields = text.split()
+                        name = fields[1] if len(fields) > 1 else 'sequence' + str(number + 1)
+                        circular = 'circular' in fields[2:] if 'circular' in fields[2:] or 'linear' in fields[2:] else None
+                        in_sequence = False
+                    elif file_format == 'genbank':
+                        in_sequence = text.startswith('ORIGIN')
+                    continue
+            if not in_sequence or skipping:
+                continue
+            piece = line.translate(upper_case, not_letters)
+            if piece:
+                parts.append(piece)
+                parts_size += len(piece)
+                if parts_size >= size:
+                    yield number, name, circular, b''.join(parts)
+                    parts = []
+                    parts_size = 0
+    if parts:
+        yield number, name, circular, b''.join(parts)
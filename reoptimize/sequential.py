@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+#
+# Sequential digests.
+#
+# If the enzymes of a digest have no buffer in common or need different
+# reaction temperatures, the digest has to be done in several steps.
+# plan_sequential() finds the best way to do this for a plan calculated by
+# reoptimize.plan_digest().
+#
+# The enzymes are split into phases. All enzymes of a phase work in the
+# same buffer (at least 50% activity, no star activity); if they need
+# different temperatures, the phase has one incubation per temperature
+# (lowest temperature first), which doesn't need a new buffer. Between two
+# phases the buffer is changed, and the enzymes of the earlier phase are
+# stopped first: by heat inactivation, if all of them can be heat
+# inactivated (inact_temp in Restriction_Dictionary above their reaction
+# temperature), otherwise by a DNA clean-up (spin column).
+#
+# The best plan has the fewest buffer changes, then the fewest
+# inactivation steps (heat inactivations and clean-ups), then the
+# shortest total time. It is found by dynamic programming over the
+# subsets of enzymes: the best way to digest (and stop) a subset of the
+# enzymes is calculated once and reused for every larger subset, so the
+# run time grows with 3^n (n = number of enzymes) instead of with n! for
+# all orders of the enzymes.
+from . import enzymes, records
+
+# Minimum % activity of an enzyme in a buffer
+minimum_activity = 50
+# Duration of a heat inactivation and of a DNA clean-up (in minutes)
+heat_inactivation_minutes = 20
+cleanup_minutes = 30
+# 3^12 = 531441 subproblems take about a second
+max_enzymes = 12
+
+def popcount(mask):
+    return bin(mask).count('1')
+
+# Units of an enzyme needed in a buffer (None if it has no activity there
+# or the activity is not known, -1 in the database)
+def step_units(value, buffer):
+    activity = value.activity(buffer)
+    if activity is None or activity <= 0:
+        return None
+    return value.units * 100 / activity
+
+# Calculate the sequential digest for a plan (see reoptimize.plan_digest()).
+# Returns a dictionary with the keys
+# - 'steps': list of steps (records.Step), each with 'action' ('digest',
+#   'heat_inactivation' or 'cleanup'), 'enzymes' and 'minutes'; digest
+#   steps also have 'buffer', 'temperature' and 'units' (units of every
+#   enzyme in that buffer), heat inactivations have 'temperature'
+# - 'buffer_changes', 'inactivations' and 'minutes' (total time)
+# - 'no_buffer': enzymes without any suitable buffer (they are digested
+#   alone, in the buffer in which they are most active)
+# Returns None if there are more than max_enzymes enzymes (or no buffers).
+def plan_sequential(plan, time=None):
+    if time is None:
+        time = plan.time
+    enzyme_records = plan.enzymes
+    names = sorted(enzyme_records)
+    n = len(names)
+    buffers = sorted(set(buffer for name in names for buffer in enzyme_records[name].buffers.names))
+    if n == 0 or n > max_enzymes or not buffers:
+        return None
+    full = (1 << n) - 1
+
+    # For every buffer the enzymes (bitmask) that may be used in it
+    allowed = {}
+    for buffer in buffers:
+        allowed[buffer] = 0
+        for i, name in enumerate(names):
+            value = enzyme_records[name]
+            position = value.buffers.index[buffer]
+            activity = value.activities[position]
+            star_activity = value.star_activities[position]
+            if activity is not None and activity >= minimum_activity and star_activity == 0:
+                allowed[buffer] |= 1 << i
+    no_buffer = [name for i, name in enumerate(names) if not any(mask & (1 << i) for mask in allowed.values())]
+
+    # Enzymes that can be heat inactivated, and the reaction temperatures
+    temperatures = sorted(set(enzyme_records[name].reaction_temperature for name in names))
+    temperature_bit = [1 << temperatures.index(enzyme_records[name].reaction_temperature) for name in names]
+    inactivation_temperature = []
+    inactivatable = 0
+    for i, name in enumerate(names):
+        temperature = enzymes.inactivation_temperature(name)
+        inactivation_temperature.append(temperature)
+        if temperature and temperature > enzyme_records[name].reaction_temperature:
+            inactivatable |= 1 << i
+
+    # For every subset of the enzymes: the temperatures it needs (bitmask)
+    # and the buffer in which the enzymes have the highest total activity
+    subset_temperatures = [0] * (full + 1)
+    subset_activity = {buffer: [0] * (full + 1) for buffer in buffers}
+    phase_buffer = [None] * (full + 1)
+    for subset in range(1, full + 1):
+        low = subset & -subset
+        i = low.bit_length() - 1
+        rest = subset ^ low
+        subset_temperatures[subset] = subset_temperatures[rest] | temperature_bit[i]
+        best = None
+        for buffer in buffers:
+            activity = subset_activity[buffer][subset] = subset_activity[buffer][rest] + (enzyme_records[names[i]].activity(buffer) or 0)
+            if subset & ~allowed[buffer] == 0 and (best is None or activity > subset_activity[best][subset]):
+                best = buffer
+        if best is None and rest == 0:
+            # No suitable buffer: use the one with the highest activity. If
+            # the enzyme has no (known) activity in any buffer, its step
+            # is planned without units (see step_units()).
+            value = enzyme_records[names[i]]
+            usable = [buffer for buffer in buffers if (value.activity(buffer) or 0) > 0]
+            best = max(usable, key=value.activity) if usable else buffers[0]
+        phase_buffer[subset] = best
+
+    minutes_per_step = time * 60
+    # Cost of a phase (buffer changes, inactivations, minutes), without and
+    # with stopping its enzymes afterwards
+    def phase_cost(subset):
+        return (0, 0, popcount(subset_temperatures[subset]) * minutes_per_step)
+    def stop_cost(subset):
+        return (1, 1, heat_inactivation_minutes if subset & ~inactivatable == 0 else cleanup_minutes)
+
+    def add(a, b):
+        return (a[0] + b[0], a[1] + b[1], a[2] + b[2])
+
+    # stopped[mask]: best way to digest the enzymes in mask and stop them
+    # (so that the next phase can use another buffer)
+    stopped = [None] * (full + 1)
+    stopped_choice = [0] * (full + 1)
+    stopped[0] = (0, 0, 0)
+    for mask in range(1, full):
+        subset = mask
+        while subset:
+            if phase_buffer[subset] is not None and stopped[mask ^ subset] is not None:
+                cost = add(add(stopped[mask ^ subset], phase_cost(subset)), stop_cost(subset))
+                if stopped[mask] is None or cost < stopped[mask]:
+                    stopped[mask] = cost
+                    stopped_choice[mask] = subset
+            subset = (subset - 1) & mask
+    # The last phase is not stopped
+    best = None
+    last = 0
+    subset = full
+    while subset:
+        if phase_buffer[subset] is not None and stopped[full ^ subset] is not None:
+            cost = add(stopped[full ^ subset], phase_cost(subset))
+            if best is None or cost < best:
+                best = cost
+                last = subset
+        subset = (subset - 1) & full
+
+    # Collect the phases (first phase first)
+    phases = [last]
+    mask = full ^ last
+    while mask:
+        phases.append(stopped_choice[mask])
+        mask ^= stopped_choice[mask]
+    phases.reverse()
+
+    steps = []
+    for number, subset in enumerate(phases):
+        members = [name for i, name in enumerate(names) if subset & (1 << i)]
+        buffer = phase_buffer[subset]
+        for temperature in temperatures:
+            step_enzymes = [name for name in members if enzyme_records[name].reaction_temperature == temperature]
+            if step_enzymes:
+                steps.append(records.Step('digest', step_enzymes, minutes_per_step,
+                                  buffer=buffer,
+                                  temperature=temperature,
+                                  units={name: step_units(enzyme_records[name], buffer) for name in step_enzymes}))
+        if number < len(phases) - 1:
+            if subset & ~inactivatable == 0:
+                steps.append(records.Step('heat_inactivation', members, heat_inactivation_minutes,
+                                  temperature=max(inactivation_temperature[i] for i in range(n) if subset & (1 << i))))
+            else:
+                steps.append(records.Step('cleanup', members, cleanup_minutes))
+    return {'steps': steps,
+            'buffer_changes': best[0],
+            'inactivations': best[1],
+            'minutes': best[2],
+            'no_buffer': no_buffer}
+
+def format_units(units):
+    if units is None:
+        return "?"
+    if units < 1:
+        return str(round(units, 2))
+    return str(round(units, 1))
+
+def format_minutes(minutes):
+    return str(int(minutes)) if minutes == int(minutes) else str(round(minutes, 1))
+
+# Print a sequential digest (see plan_sequential())
+def print_sequential(sequential):
+    print("Sequential digest (" + str(sequential['buffer_changes']) + " buffer change" + ("" if sequential['buffer_changes'] == 1 else "s") + ", " + str(sequential['inactivations']) + " inactivation step" + ("" if sequential['inactivations'] == 1 else "s") + ", " + format_minutes(sequential['minutes']) + " min in total):")
+    for number, step in enumerate(sequential['steps'], 1):
+        if step['action'] == 'digest':
+            print(str(number) + ". " + step['buffer'] + ", " + str(step['temperature']) + "°C, " + format_minutes(step['minutes']) + " min: " + ' '.join(name + ": " + format_units(step['units'][name]) + " units" for name in step['enzymes']))
+        elif step['action'] == 'heat_inactivation':
+            print(str(number) + ". Heat inactivation (" + ', '.join(step['enzymes']) + "): " + str(step['temperature']) + "°C, " + format_minutes(step['minutes']) + " min")
+        else:
+            print(str(number) + ". DNA clean-up (" + ', '.join(step['enzymes']) + " can't be heat inactivated), " + format_minutes(step['minutes']) + " min")
+    for name in sequential['no_buffer']:
+        print("Note: " + name + " has no buffer with at least " + str(minimum_activity) + "% activity and without star activity!")
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+#
+# Find the enzymes that cut a sequence once (unique cutters) or twice.
+#
+# Example: reoptimize sites pUC19.gb
+#          reoptimize sites construct.fasta --cuts 1 --suppliers N --circular
+#          reoptimize sites pUC19.gb --inside MCS --protect AmpR rep_origin
+#
+# The recognition sites of all enzymes in Restriction_Dictionary that are
+# sold by at least one supplier (or by the given suppliers) are searched in
+# a single pass over the sequence (see scan.py). The enzymes that are in
+# the NEB enzyme database are listed first, ranked by the number of NEB
+# buffers in which they have at least 50% activity and no star activity.
+#
+# For GenBank records, the enzymes can be restricted to those that cut
+# inside a region (--inside, e.g. the MCS or a feature, see features.py)
+# and nowhere in protected regions (--protect, e.g. the origin, the
+# resistance gene or all CDS). The cut positions of every enzyme (from the
+# same single scan) are looked up in an interval index over the regions.
+import sys, os
+
+from . import enzymes, reoptimize, database
+
+# Enzymes whose sites have fewer specified (not N) bases are left out
+# (e.g. AbaSI, site C): they cut far too often to be useful here
+min_specified_bases = 4
+# Minimum % activity of an enzyme in a compatible buffer
+minimum_activity = 50
+
+# Select the enzymes: {name: site}. suppliers is a list of supplier codes
+# (see Restriction_Dictionary.suppliers); if it is None, all commercially
+# available enzymes are used, if it is empty, all enzymes. properties and
+# excluded are types of Restriction_Dictionary.typedict (e.g. Blunt, Ov5,
+# Meth_Dep) the enzymes must have or must not have, site_lengths the
+# lengths of the sites (e.g. [6] for 6-cutters). The selection is made with
+# the bitset indexes of enzymes.py.
+def select_enzymes(suppliers=None, properties=(), excluded=(), site_lengths=None):
+    dictionary = enzymes.restriction_dictionary()
+    index = enzymes.enzyme_index()
+    if suppliers is None:
+        suppliers = list(dictionary.suppliers)
+    for supplier in suppliers:
+        if supplier not in index['suppliers']:
+            sys.exit("Unknown supplier " + supplier + ". Suppliers are: " + ', '.join(code + " (" + name + ")" for code, (name, supplied) in sorted(dictionary.suppliers.items())))
+    for prop in list(properties) + list(excluded):
+        if prop not in index['properties']:
+            sys.exit("Unknown enzyme type " + prop + ". Types are: " + ', '.join(sorted(index['properties'])))
+    selected = {}
+    for name in enzymes.query(suppliers or None, properties, excluded, site_lengths):
+        site = dictionary.rest_dict[name]['site']
+        if '|' in site or len(site) - site.count('N') < min_specified_bases:
+            continue
+        selected[name] = site
+    return selected
+
+# Find the sites of the enzymes ({name: site}) in a sequence. Returns
+# {name: ([(position, strand), ...], number of sites blocked by the
+# methylation of the host)} (0-based positions, see scan.py).
+def find_sites(sequence, circular, selected, host=None):
+    from . import scan, methylation
+    scanner = scan.scanner_for(list(selected.values()) + methylation.host_motifs(host))
+    hits = scanner.scan(sequence, circular)
+    by_site = dict(zip(scanner.sites, hits))
+    methylated = methylation.methylated_bases(host, by_site, len(sequence), circular, scanner.max_length)
+    result = {}
+    for name, site in selected.items():
+        open_sites, blocked = methylation.split_blocked(name, len(site), by_site[site.upper()], methylated)
+        result[name] = (open_sites, len(blocked))
+    return result
+
+# Enzymes that cut the sequence the given number of times. Returns a list
+# of {'enzyme', 'site', 'cuts', 'positions' (1-based), 'blocked' (sites
+# blocked by the methylation of the host, not counted in cuts)}, sorted
+# by name.
+def cutters(sequence, circular, cuts=(1, 2), suppliers=None, host=None, selected=None):
+    if selected is None:
+        selected = select_enzymes(suppliers)
+    result = []
+    for name, (hits, blocked) in sorted(find_sites(sequence, circular, selected, host).items()):
+        if len(hits) in cuts:
+            result.append({'enzyme': name,
+                           'site': selected[name],
+                           'cuts': len(hits),
+                           'positions': sorted(position + 1 for position, strand in hits),
+                           'blocked': blocked})
+    return result
+
+# Enzymes that cut inside the given regions and in none of the protected
+# regions. inside and protected are {region: [(start, end)]} (see
+# features.find_regions()). An enzyme must cut at least once in one of the
+# inside regions (if there are any; with only_inside, all of its cuts
+# must be) and never in a protected region, except where that contains an
+# inside region (e.g. the MCS in lacZα). Enzymes whose cut positions are
+# not known are left out. Returns the records of cutters() with
+# 'cut_positions' (top strand cuts, see fragments.py) and 'regions' (the
+# inside regions that are cut).
+def region_cutters(sequence, circular, inside, protected, cuts=(1, 2), only_inside=False, suppliers=None, host=None, selected=None):
+    from . import features, fragments
+    if selected is None:
+        selected = select_enzymes(suppliers)
+    rest_dict = enzymes.rest_dict()
+    length = len(sequence)
+    intervals = [(start, end, ('inside', region)) for region, parts in inside.items() for start, end in parts]
+    intervals += [(start, end, ('protected', region)) for region, parts in protected.items() for start, end in parts]
+    index = features.FeatureIndex(intervals, length, circular)
+    result = []
+    for name, (hits, blocked) in sorted(find_sites(sequence, circular, selected, host).items()):
+        if len(hits) not in cuts or rest_dict[name]['fst5'] is None:
+            continue
+        positions = fragments.cut_positions(rest_dict[name], hits, length, circular)
+        regions = set()
+        allowed = bool(positions)
+        for position in positions:
+            labels = index.cut(position)
+            targets = [region for kind, region in labels if kind == 'inside']
+            if targets:
+                regions.update(targets)
+            elif only_inside or any(kind == 'protected' for kind, region in labels):
+                allowed = False
+                break
+        if not allowed or (inside and not regions):
+            continue
+        result.append({'enzyme': name,
+                       'site': selected[name],
+                       'cuts': len(hits),
+                       'positions': sorted(position + 1 for position, strand in hits),
+                       'blocked': blocked,
+                       'cut_positions': positions,
+                       'regions': sorted(regions)})
+    return result
+
+# NEB buffers compatible with every enzyme, from the enzyme database:
+# {dictionary name: (NEB product, {buffer: % activity})}. If NEB sells
+# several versions of an enzyme (e.g. EcoRI and EcoRI-HF), the one that is
+# compatible with the most buffers is used.
+def neb_buffers(sqlite_file=None):
+    compatible = {}
+    for product, activities in reoptimize.buffer_activities(sqlite_file).items():
+        name = enzymes.dictionary_name(product)
+        if name is None:
+            continue
+        buffers = {buffer: activity for buffer, (activity, star_activity) in activities.items()
+                   if activity is not None and activity >= minimum_activity and star_activity == 0}
+        if name not in compatible or len(buffers) > len(compatible[name][1]):
+            compatible[name] = (product, buffers)
+    return compatible
+
+# Rank the cutters by NEB buffer compatibility (adds 'neb_product' and
+# 'buffers' to the enzymes that are in the database)
+def rank_by_buffers(result, compatible):
+    for record in result:
+        if record['enzyme'] in compatible:
+            record['neb_product'], record['buffers'] = compatible[record['enzyme']]
+    return sorted(result, key=lambda record: (record['cuts'],
+                                              'buffers' not in record,
+                                              -len(record.get('buffers', {})),
+                                              -sum(record.get('buffers', {}).values()),
+                                              record['enzyme']))
+
+def print_cutters(record, result):
+    topology = {True: 'circular', False: 'linear', None: 'linear'}[record['circular']]
+    print(record['name'] + " (" + str(len(record['sequence'])) + " bp, " + topology + ")")
+    for cuts in sorted(set(item['cuts'] for item in result)):
+        print("Enzymes that cut " + {1: "once", 2: "twice"}.get(cuts, str(cuts) + " times") + ":")
+        for item in result:
+            if item['cuts'] != cuts:
+                continue
+            line = "  %-12s %-14s %-16s" % (item['enzyme'], item['site'], ','.join(str(position) for position in item['positions']))
+            if item['blocked']:
+                line += ' [' + str(item['blocked']) + ' blocked]'
+            if 'cut_positions' in item:
+                line += ' [cut after ' + ','.join(str(position) for position in item['cut_positions']) + (' in ' + ', '.join(item['regions']) if item['regions'] else '') + ']'
+            if 'buffers' in item:
+                line += ' ' + ', '.join(buffer + " (" + str(activity) + ")" for buffer, activity in sorted(item['buffers'].items(), key=lambda pair: -pair[1]))
+            print(line.rstrip())
+    print("")
+
+def print_features(record):
+    print(record['name'] + ": " + str(len(record.get('features', ()))) + " features")
+    for feature in record.get('features', ()):
+        print("  %-14s %-24s %s" % (feature['type'], feature['name'], feature['location']))
+    print("")
+
+def run(argv=None):
+    import argparse, json
+    from . import methylation
+    parser = argparse.ArgumentParser(prog='reoptimize sites', description='Find the enzymes that cut a sequence once or twice.')
+    parser.add_argument('sequence', help='Sequence file (FASTA, GenBank or plain sequence, may be gzipped)')
+    parser.add_argument('-c','--cuts', help='Numbers of cuts (default: 1 2)', nargs='+', default=[1, 2], type=int)
+    parser.add_argument('-s','--suppliers', help='Only enzymes sold by these suppliers (e.g. N for NEB, default: all suppliers)', nargs='+')
+    parser.add_argument('--all', help='Also enzymes that are not commercially available', action='store_true')
+    parser.add_argument('-t','--types', help='Only enzymes of these types (e.g. Blunt, Ov5, Ov3, Palindromic, Meth_Undep)', nargs='+', default=[])
+    parser.add_argument('--not-types', help='No enzymes of these types (e.g. Meth_Dep)', nargs='+', default=[])
+    parser.add_argument('--site-length', help='Only enzymes with sites of these lengths (e.g. 6)', nargs='+', type=int)
+    topology = parser.add_mutually_exclusive_group()
+    topology.add_argument('--circular', help='The sequence is circular (default for GenBank files: from the LOCUS line, otherwise linear)', action='store_true')
+    topology.add_argument('--linear', help='The sequence is linear', action='store_true')
+    parser.add_argument('--host', help='Host the DNA was isolated from: sites blocked by its methylation are not counted (default: none)', choices=sorted(methylation.hosts))
+    parser.add_argument('--inside', help='Only enzymes that cut inside one of these regions: types or names of features of the GenBank record (e.g. MCS) or START..END', nargs='+', metavar='REGION', default=[])
+    parser.add_argument('--protect', help='No enzymes that cut inside one of these regions (e.g. AmpR rep_origin CDS)', nargs='+', metavar='REGION', default=[])
+    parser.add_argument('--only-inside', help='All cuts must be inside the --inside regions', action='store_true')
+    parser.add_argument('--list-features', help='List the features of the GenBank records (names for --inside and --protect)', action='store_true')
+    parser.add_argument('--database', help='Enzyme database file (default: $REOPTIMIZE_DATABASE or REsqlite3.db in the package directory)')
+    parser.add_argument('--json', help='Write the results as JSON', action='store_true')
+    args = parser.parse_args(argv)
+    if args.only_inside and not args.inside:
+        parser.error("--only-inside needs --inside")
+
+    from . import sequence, features
+    if args.list_features:
+        for record in sequence.read_sequences(args.sequence):
+            print_features(record)
+        return
+    suppliers = [] if args.all else args.suppliers
+    selected = select_enzymes(suppliers, args.types, args.not_types, args.site_length)
+    sqlite_file = args.database or database.default_database()
+    compatible = {}
+    if os.path.exists(sqlite_file):
+        compatible = neb_buffers(sqlite_file)
+    else:
+        print("Enzyme database " + sqlite_file + " not found, the enzymes are not ranked by buffer compatibility.", file=sys.stderr)
+    results = []
+    for record in sequence.read_sequences(args.sequence):
+        if args.circular or args.linear:
+            record['circular'] = args.circular
+        if args.inside or args.protect:
+            inside = features.find_regions(record, args.inside)
+            protected = features.find_regions(record, args.protect)
+            for region, parts in list(inside.items()) + list(protected.items()):
+                if not parts:
+                    print("There is no feature " + region + " in " + record['name'] + " (see --list-features).", file=sys.stderr)
+            if args.inside and not any(inside.values()):
+                continue
+            result = region_cutters(record['sequence'], bool(record['circular']), {region: parts for region, parts in inside.items() if parts}, protected, args.cuts, args.only_inside, suppliers, args.host, selected)
+        else:
+            result = cutters(record['sequence'], bool(record['circular']), args.cuts, suppliers, args.host, selected)
+        result = rank_by_buffers(result, compatible)
+        if args.json:
+            results.append({'name': record['name'], 'length': len(record['sequence']), 'circular': bool(record['circular']), 'enzymes': result})
+        else:
+            print_cutters(record, result)
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
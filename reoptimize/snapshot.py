@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+#
+# Snapshot of the catalogue of a database file.
+#
+# Example: reoptimize snapshot --database REsqlite3.db
+#
+# A new planner process has to read the enzymes and their activities from
+# REsqlite3.db (one query per enzyme and buffer) before its first plan.
+# make_sqlite_database.py therefore also writes everything the planner
+# needs into a snapshot file next to the database (REsqlite3.snapshot,
+# see snapshot_name()), and the planner uses it instead of the database
+# when it was made from the same data:
+#
+# header: magic (8 bytes), format, marshal version (1 byte each) and the
+#         catalogue version of the database (16 bytes, see
+#         database.catalogue_version())
+# data:   marshal of a dictionary with
+#         'buffers': the names of the buffer tables, in database order
+#         'enzymes': {upper case enzyme name: (row, activities, star
+#                    activities)}, row as read by the planner (enzyme_id,
+#                    default_buffer, assay_DNA, assay_DNA_cuts, survival,
+#                    reaction_temperature, enzyme_name,
+#                    reaction_supplement, enzyme_concentration,
+#                    timesaver), the activities in the order of 'buffers'
+#         'equivalents': marshal of {name: ((enzyme name, relation),
+#                    ...)} (see reoptimize.find_equivalents()), only
+#                    decoded when an enzyme is not in the database
+# (The lengths of the assay DNAs are constants of reoptimize.py.)
+#
+# The file is memory mapped and the data decoded by marshal (strings,
+# ints and tuples only), which takes well below a millisecond. A snapshot whose
+# catalogue version doesn't match the database (or that was written by
+# another version of Python) is ignored, so the planner never uses stale
+# data.
+import os, sys, struct
+
+try:
+    from . import database, metrics
+except ImportError:
+    # Imported by make_sqlite_database.py run as a script
+    import database, metrics
+
+magic = b'REOPTSNP'
+format_version = 1
+header = struct.Struct('<8sBB16s')
+
+# Set to False to always read the database (for benchmarks)
+enabled = True
+
+# The snapshot file of a database file
+def snapshot_name(sqlite_file):
+    return os.path.splitext(sqlite_file)[0] + '.snapshot'
+
+# The catalogue read from a database file (see above)
+def read_catalogue(sqlite_file):
+    sqlcon = database.connect(sqlite_file)
+    try:
+        cursor = sqlcon.cursor()
+        # The same buffer tables as reoptimize.discover_buffers()
+        buffers = [name for (name,) in cursor.execute("SELECT name FROM sqlite_master WHERE type='table'") if name == 'buffer' or 'Buffer' in name]
+        activities = {}
+        for position, buffer in enumerate(buffers):
+            for enzyme_id, activity, star_activity in cursor.execute("SELECT enzyme_id, activity, star_activity FROM `" + buffer + "`"):
+                values = activities.setdefault(enzyme_id, ([None] * len(buffers), [None] * len(buffers)))
+                values[0][position] = activity
+                values[1][position] = star_activity
+        enzymes = {}
+        for row in cursor.execute("SELECT enzyme_id, default_buffer, assay_DNA, assay_DNA_cuts, survival, reaction_temperature, enzyme_name, reaction_supplement, enzyme_concentration, timesaver FROM restriction_enzyme ORDER BY enzyme_id"):
+            values = activities.get(row[0], ([None] * len(buffers), [None] * len(buffers)))
+            enzymes.setdefault(row[6].upper(), (tuple(row), tuple(values[0]), tuple(values[1])))
+        equivalents = {}
+        try:
+            for name, enzyme_name, relation in cursor.execute("SELECT equivalent_enzyme.name, restriction_enzyme.enzyme_name, equivalent_enzyme.relation FROM equivalent_enzyme INNER JOIN restriction_enzyme ON restriction_enzyme.enzyme_id = equivalent_enzyme.enzyme_id ORDER BY equivalent_enzyme.name, equivalent_enzyme.relation, equivalent_enzyme.score DESC, restriction_enzyme.enzyme_name"):
+                equivalents[name] = equivalents.get(name, ()) + ((enzyme_name, relation),)
+        except sqlcon.Error:
+            # Databases built by older versions have no equivalent_enzyme table
+            pass
+    finally:
+        sqlcon.close()
+    return {'buffers': tuple(buffers),
+            'enzymes': enzymes,
+            'equivalents': equivalents}
+
+# Write the snapshot of a database file (into a temporary file that is
+# renamed when it is complete, like the database itself). Returns the
+# name of the snapshot file.
+def write(sqlite_file, snapshot_file=None):
+    import marshal
+    if snapshot_file is None:
+        snapshot_file = snapshot_name(sqlite_file)
+    catalogue = read_catalogue(sqlite_file)
+    catalogue['equivalents'] = marshal.dumps(catalogue['equivalents'])
+    version = database.catalogue_version(sqlite_file)
+    temporary_file = database.temporary_name(snapshot_file)
+    with open(temporary_file, 'wb') as f:
+        f.write(header.pack(magic, format_version, marshal.version, version.encode('ascii')))
+        marshal.dump(catalogue, f)
+    database.publish(temporary_file, snapshot_file)
+    return snapshot_file
+
+# A catalogue loaded from a snapshot file
+class Catalogue:
+    __slots__ = ('buffers', 'enzymes', 'equivalent_data', 'equivalent_table')
+
+    def __init__(self, data):
+        self.buffers = data['buffers']
+        self.enzymes = data['enzymes']
+        self.equivalent_data = data['equivalents']
+        self.equivalent_table = None
+
+    # The equivalents of an enzyme (upper case name, see
+    # reoptimize.find_equivalents())
+    def equivalents(self, name):
+        import marshal
+        if self.equivalent_table is None:
+            self.equivalent_table = marshal.loads(self.equivalent_data)
+        return self.equivalent_table.get(name, ())
+
+# Loaded snapshots by database file: (stamps of the database and snapshot
+# files, Catalogue or None)
+loaded = {}
+
+def file_stamp(filename):
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+# The catalogue of the snapshot of a database file, None if there is no
+# snapshot or it doesn't match the database
+def load(sqlite_file):
+    if not enabled:
+        return None
+    snapshot_file = snapshot_name(sqlite_file)
+    stamps = (file_stamp(sqlite_file), file_stamp(snapshot_file))
+    cached = loaded.get(sqlite_file)
+    if cached is not None and cached[0] == stamps:
+        return cached[1]
+    catalogue = None
+    if stamps[0] is not None and stamps[1] is not None:
+        catalogue = read_snapshot(snapshot_file, database.catalogue_version(sqlite_file))
+    loaded[sqlite_file] = (stamps, catalogue)
+    return catalogue
+
+# Read a snapshot file, if its catalogue version is version
+def read_snapshot(snapshot_file, version):
+    import mmap, marshal
+    try:
+        with open(snapshot_file, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    try:
+        if len(mapped) < header.size:
+            return None
+        file_magic, file_format, marshal_version, file_version = header.unpack_from(mapped)
+        if file_magic != magic or file_format != format_version or marshal_version != marshal.version or file_version.decode('ascii', 'replace') != version:
+            return None
+        with memoryview(mapped) as view, view[header.size:] as data:
+            catalogue = Catalogue(marshal.loads(data))
+        if not isinstance(catalogue.equivalent_data, bytes):
+            return None
+    except (ValueError, EOFError, TypeError, KeyError):
+        return None
+    finally:
+        mapped.close()
+    metrics.increment('reoptimize_snapshot_loads_total')
+    return catalogue
+
+def run(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog='reoptimize snapshot', description='Write the snapshot of the catalogue of a database file, which the planner reads instead of the database (make_sqlite_database.py writes it, too).')
+    parser.add_argument('--database', help='Enzyme database file (default: $REOPTIMIZE_DATABASE or REsqlite3.db in the package directory)')
+    parser.add_argument('-o','--output', help='Snapshot file (default: the database file name with .snapshot)')
+    args = parser.parse_args(argv)
+    sqlite_file = args.database or database.default_database()
+    if not os.path.exists(sqlite_file):
+        sys.exit("Database file " + sqlite_file + " not found!")
+    if args.output and args.output != snapshot_name(sqlite_file):
+        print("Note: the planner only reads the snapshot from " + snapshot_name(sqlite_file), file=sys.stderr)
+    print("Snapshot written to " + write(sqlite_file, args.output))
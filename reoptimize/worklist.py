@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+#
+# Worklists for liquid handlers.
+#
+# Example: reoptimize worklist plate.jsonl --dialect tecan-gwl -o digests.gwl --layout reagents.csv
+#
+# For every digest (same input as batch mode, with "well" and "plate" as
+# for plate mode) one transfer per component is written, as soon as the
+# digest is planned: water, 10x buffer (the best possible buffer), DNA and
+# the enzymes (last). The enzyme volumes are the units of the plan divided
+# by the concentration of the product (the least concentrated one that
+# NEB sells of which at most --max-volume µl are needed, see
+# incubation.choose_concentration()), the DNA volume is "microgram" /
+# "dna_concentration" (ng/µl) and water fills up to --volume.
+#
+# The DNA comes from the plate "dna_plate" (default: DNA), well "dna_well"
+# (default: the same well as the digest). The reagents (water, buffers,
+# enzymes) come from one source plate (--source-plate); every reagent gets
+# the next free well of it when it is used for the first time, so the
+# transfers can be written without reading the whole batch first. At the
+# end, the layout of the source plate with the volume needed of every
+# reagent is written to stderr (or --layout FILE, as CSV).
+#
+# Dialects:
+# - generic: CSV with source plate and well, destination plate and well,
+#   volume (µl) and reagent
+# - tecan-gwl: Tecan Freedom EVOware worklist (aspirate, dispense and
+#   wash lines, positions numbered down the columns)
+# - echo: CSV for Labcyte Echo acoustic dispensers (volumes in nl,
+#   rounded up to droplets of 2.5 nl)
+# Digests without a buffer for all enzymes (e.g. sequential digests with
+# a buffer change) are left out, with a message on stderr.
+import sys, csv, math
+
+from . import incubation, plate
+
+# Rows of the plates (A-P: up to 384 wells)
+plate_rows = 'ABCDEFGHIJKLMNOP'
+plate_formats = {96: (8, 12), 384: (16, 24)}
+echo_droplet = 2.5
+
+# Number of a well (A1 = 1, B1 = 2, ..., numbered down the columns) on a
+# plate of the given size
+def well_position(well, size=96):
+    rows, columns = plate_formats[size]
+    try:
+        row = plate_rows.index(well[0].upper())
+        column = int(well[1:])
+    except (ValueError, IndexError):
+        sys.exit("Invalid well " + str(well) + "!")
+    if row >= rows or not 1 <= column <= columns:
+        sys.exit("Well " + str(well) + " is not on a plate with " + str(size) + " wells!")
+    return (column - 1) * rows + row + 1
+
+# Name of the well at a position (see well_position())
+def position_well(position, size=96):
+    rows, columns = plate_formats[size]
+    column, row = divmod(position - 1, rows)
+    return plate_rows[row] + str(column + 1)
+
+# The components of a digest in the order in which they are pipetted:
+# ([(reagent, µl)], None), the DNA as reagent 'DNA', or (None, reason) if
+# the digest can't be pipetted
+def transfers(request, plan, volume=plate.reaction_volume, dna_concentration=plate.dna_concentration, max_volume=incubation.max_volume):
+    if not plan.possible_buffers:
+        if plan.sequential is not None:
+            return None, "needs a buffer change (sequential digest)"
+        return None, "has no buffer in which all enzymes work"
+    try:
+        dna = float(request.get('microgram', 1)) * 1000 / float(request.get('dna_concentration', dna_concentration))
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None, "invalid DNA amount or concentration"
+    buffer = plan.possible_buffers[0][0]
+    enzymes = []
+    for name, record in sorted(plan.enzymes.items()):
+        if not record.concentrations:
+            return None, "the concentration of " + name + " is not known"
+        units = record.units * 100 / record.activity(buffer)
+        concentration = incubation.choose_concentration(units, record.concentrations, max_volume)
+        enzymes.append((name + " (" + str(concentration) + " units/µl)", units / concentration))
+    water = volume - volume / 10 - dna - sum(microliter for name, microliter in enzymes)
+    if water < 0:
+        return None, "does not fit into " + str(volume) + " µl"
+    return [('water', water), ('10x ' + buffer, volume / 10), ('DNA', dna)] + enzymes, None
+
+# Writes the transfers in one of the dialects
+class Worklist:
+    def __init__(self, output, dialect='generic', size=96, source_plate='Reagents'):
+        self.output = output
+        self.dialect = dialect
+        self.size = size
+        self.source_plate = source_plate
+        # Source wells and volumes of the reagents: {reagent: [well, µl]}
+        self.reagents = {}
+        self.transfers = 0
+        if dialect in ('generic', 'echo'):
+            self.writer = csv.writer(output, lineterminator='\n')
+            if dialect == 'generic':
+                self.writer.writerow(['source_plate', 'source_well', 'destination_plate', 'destination_well', 'volume_ul', 'reagent'])
+            else:
+                self.writer.writerow(['Source Plate Name', 'Source Well', 'Destination Plate Name', 'Destination Well', 'Transfer Volume'])
+
+    # Source well of a reagent (the next free well for a new reagent)
+    def reagent_well(self, reagent, microliter):
+        source = self.reagents.get(reagent)
+        if source is None:
+            if len(self.reagents) >= self.size:
+                sys.exit("More than " + str(self.size) + " reagents do not fit on the source plate!")
+            source = self.reagents[reagent] = [position_well(len(self.reagents) + 1, self.size), 0.0]
+        source[1] += microliter
+        return source[0]
+
+    def write(self, reagent, source_plate, source_well, destination_plate, destination_well, microliter):
+        self.transfers += 1
+        if self.dialect == 'generic':
+            self.writer.writerow([source_plate, source_well, destination_plate, destination_well, "%.2f" % microliter, reagent])
+        elif self.dialect == 'echo':
+            self.writer.writerow([source_plate, source_well, destination_plate, destination_well, "%g" % (math.ceil(microliter * 1000 / echo_droplet) * echo_droplet)])
+        else:
+            self.output.write("A;" + source_plate + ";;;" + str(well_position(source_well, self.size)) + ";;" + "%.2f" % microliter + "\n")
+            self.output.write("D;" + destination_plate + ";;;" + str(well_position(destination_well, self.size)) + ";;" + "%.2f" % microliter + "\n")
+            self.output.write("W;\n")
+
+    # Write the transfers of a digest (see transfers()) into a well. The
+    # wells are checked before anything is written (sys.exit if one is
+    # not on the plate).
+    def add(self, request, components):
+        destination_plate = 'Plate' + str(request.get('plate', 1))
+        destination_well = str(request.get('well', request.get('id')))
+        dna_well = str(request.get('dna_well', destination_well))
+        well_position(destination_well, self.size)
+        well_position(dna_well, self.size)
+        for reagent, microliter in components:
+            if microliter <= 0:
+                continue
+            if reagent == 'DNA':
+                self.write(reagent, str(request.get('dna_plate', 'DNA')), dna_well, destination_plate, destination_well, microliter)
+            else:
+                self.write(reagent, self.source_plate, self.reagent_well(reagent, microliter), destination_plate, destination_well, microliter)
+
+    # Layout of the source plate: [(well, reagent, µl needed)]
+    def layout(self):
+        return [(well, reagent, microliter) for reagent, (well, microliter) in self.reagents.items()]
+
+def run(argv=None):
+    import argparse
+    from . import batch
+    parser = argparse.ArgumentParser(prog='reoptimize worklist', description='Write a worklist for a liquid handler (water, buffer, DNA and enzymes for every digest of a batch).')
+    parser.add_argument('input', help='JSON lines file with the digests (with "well" and "plate"), as for reoptimize batch (default: stdin)', nargs='?')
+    parser.add_argument('-o','--output', help='Worklist file (default: stdout)')
+    parser.add_argument('--dialect', help='Format of the worklist (default: generic)', choices=['generic', 'tecan-gwl', 'echo'], default='generic')
+    parser.add_argument('--plate-size', help='Wells of the plates (default: 96)', choices=sorted(plate_formats), default=96, type=int)
+    parser.add_argument('--source-plate', help='Name of the plate with the reagents (default: Reagents)', default='Reagents')
+    parser.add_argument('--layout', help='Write the layout of the source plate (CSV) to this file instead of stderr')
+    parser.add_argument('--volume', help='Reaction volume (default: %s µl)' % plate.reaction_volume, default=plate.reaction_volume, type=float)
+    parser.add_argument('--dna-concentration', help='DNA concentration of the digests without "dna_concentration" (default: %s ng/µl)' % plate.dna_concentration, default=plate.dna_concentration, type=float)
+    parser.add_argument('--max-volume', help='Use the least concentrated product of which at most this volume is needed (default: %s µl)' % incubation.max_volume, default=incubation.max_volume, type=float)
+    parser.add_argument('--database', help='Enzyme database file (default: $REOPTIMIZE_DATABASE or REsqlite3.db in the package directory)')
+    args = parser.parse_args(argv)
+    if args.volume <= 0 or args.dna_concentration <= 0:
+        parser.error("The volume and the DNA concentration must be positive")
+
+    infile = open(args.input, encoding='utf-8') if args.input else sys.stdin
+    output = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+    try:
+        worklist = Worklist(output, args.dialect, args.plate_size, args.source_plate)
+        for request, plan, error in batch.plan_batch(batch.read_requests(infile), args.database):
+            if error is None:
+                components, error = transfers(request, plan, args.volume, args.dna_concentration, args.max_volume)
+            if error is not None:
+                print("Digest " + str(request.get('id')) + " is left out: " + str(error), file=sys.stderr)
+                continue
+            try:
+                worklist.add(request, components)
+            except SystemExit as err:
+                print("Digest " + str(request.get('id')) + " is left out: " + str(err.code), file=sys.stderr)
+    finally:
+        if args.input:
+            infile.close()
+        if args.output:
+            output.close()
+    if args.layout:
+        with open(args.layout, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow(['well', 'reagent', 'volume_ul'])
+            for well, reagent, microliter in worklist.layout():
+                writer.writerow([well, reagent, "%.2f" % microliter])
+    else:
+        print("Source plate " + args.source_plate + ":", file=sys.stderr)
+        for well, reagent, microliter in worklist.layout():
+            print("  %-4s %-40s %10.2f µl" % (well, reagent, microliter), file=sys.stderr)
+    print(str(worklist.transfers) + " transfers written.", file=sys.stderr)
@@ -79,7 +79,7 @@ setup(
     # installed, specify them here.  If using Python 2.6 or less, then these
     # have to be included in MANIFEST.in as well.
     package_data={
-        'reoptimize': ['Restriction_Dictionary.py', 'assay_DNAs.fasta', 'REsqlite3.db']
+        'reoptimize': ['Restriction_Dictionary.py', 'assay_DNAs.fasta', 'REsqlite3.db', 'REsqlite3.snapshot']
     },
 
     # To provide executable scripts, use entry points in preference to the
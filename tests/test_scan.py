@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+#
+# scan.Scanner against a search of every site at every position.
+import random, unittest
+
+from reoptimize import scan
+
+sites = ['GAATTC', 'GGTCTC', 'GCCNNNNNGGC', 'CCWGG', 'GATC', 'ACNNNNGTAYC', 'GCAATG', 'RGCGCY']
+
+# Hits of a site by comparing it at every position (the reverse
+# complement, too, if the site isn't palindromic)
+def brute_force(sequence, site, circular):
+    length = len(sequence)
+    orientations = [(site, 1)]
+    if not scan.is_palindromic(site):
+        orientations.append((scan.reverse_complement(site), -1))
+    hits = []
+    for start in range(length):
+        if not circular and start + len(site) > length:
+            break
+        for oriented, strand in orientations:
+            if all(sequence[(start + offset) % length] in scan.iupac[code] for offset, code in enumerate(oriented)):
+                hits.append((start, strand))
+    return sorted(hits)
+
+def random_sequence(generator, length):
+    return ''.join(generator.choice('ACGT') for i in range(length))
+
+class ScannerTest(unittest.TestCase):
+    def check(self, sequence, circular):
+        scanner = scan.Scanner(sites)
+        for site, hits in zip(scanner.sites, scanner.scan(sequence, circular)):
+            self.assertEqual(sorted(hits), brute_force(sequence, site, circular), site)
+
+    def test_random_sequences(self):
+        generator = random.Random(1)
+        for length in (0, 1, 5, 10, 50, 2000):
+            sequence = random_sequence(generator, length)
+            self.check(sequence, False)
+            self.check(sequence, True)
+
+    def test_sites_across_the_origin(self):
+        # GAATTC and GGTCTC across the end of the sequence
+        sequence = 'TTCAAAAGGTCAAAAAAGAA'
+        self.check(sequence, True)
+        scanner = scan.Scanner(['GAATTC'])
+        self.assertEqual(scanner.scan(sequence, True), [[(17, 1)]])
+        self.assertEqual(scanner.scan(sequence, False), [[]])
+
+    def test_sequence_shorter_than_the_site(self):
+        # The site wraps around the sequence more than once
+        self.check('GGC', True)
+        self.check('GCCATGG', True)
+
+    def test_lower_case(self):
+        scanner = scan.Scanner(['GAATTC'])
+        self.assertEqual(scanner.scan('aagaattcaa'), [[(2, 1)]])
+
+if __name__ == '__main__':
+    unittest.main()
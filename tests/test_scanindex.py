@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#
+# Blocks and files of the scan index (scanindex.py).
+import os, random, shutil, tempfile, unittest
+
+from reoptimize import scan, scanindex
+
+# The order of the hits in a block: by position, the top strand first
+def block_order(hits):
+    return sorted(hits, key=lambda hit: (hit[0], hit[1] == -1))
+
+class BlockTest(unittest.TestCase):
+    def test_round_trip(self):
+        generator = random.Random(2)
+        sites = ['GAATTC', 'GATC', 'CCWGG', 'GGTCTC']
+        hits = [sorted(set((generator.randrange(100000), generator.choice((1, -1))) for i in range(count))) for count in (0, 1, 500, 20)]
+        # Same position on both strands
+        hits[1] = [(7, -1), (7, 1)]
+        decoded = scanindex.decode_block(scanindex.encode_block(hits), sites)
+        self.assertEqual(decoded, {site: block_order(site_hits) for site, site_hits in zip(sites, hits)})
+        self.assertEqual(decoded['GATC'], [(7, 1), (7, -1)])
+
+    def test_wanted_sites(self):
+        sites = ['GAATTC', 'GATC']
+        block = scanindex.encode_block([[(5, 1)], [(1, 1), (9, -1)]])
+        self.assertEqual(scanindex.decode_block(block, sites, {'GATC'}), {'GATC': [(1, 1), (9, -1)]})
+
+    def test_unsorted_hits(self):
+        sites = ['GAATTC']
+        block = scanindex.encode_block([[(30, 1), (4, -1), (12, 1)]])
+        self.assertEqual(scanindex.decode_block(block, sites), {'GAATTC': [(4, -1), (12, 1), (30, 1)]})
+
+class IndexFileTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'test.idx')
+        generator = random.Random(3)
+        self.records = [{'name': 'seq' + str(number), 'sequence': ''.join(generator.choice('ACGT') for i in range(300)), 'circular': number % 2 == 1}
+                        for number in range(3)]
+
+    def tearDown(self):
+        for filename, (stamp, index) in list(scanindex.index_cache.items()):
+            if filename == self.filename:
+                index.close()
+                del scanindex.index_cache[filename]
+        shutil.rmtree(self.directory)
+
+    def test_hits_like_a_scan(self):
+        self.assertEqual(scanindex.build_index(self.records, self.filename), (3, 0))
+        index = scanindex.ScanIndex(self.filename)
+        try:
+            scanner = scan.Scanner(index.sites)
+            for record in self.records:
+                expected = {site: block_order(hits) for site, hits in zip(scanner.sites, scanner.scan(record['sequence'], record['circular']))}
+                self.assertEqual(index.hits(record['sequence'], record['circular']), expected)
+            # The topology is part of the key
+            record = self.records[0]
+            self.assertIsNone(index.hits(record['sequence'], not record['circular']))
+        finally:
+            index.close()
+
+    def test_rebuild(self):
+        scanindex.build_index(self.records, self.filename)
+        self.records[1]['sequence'] = 'GAATTC' + self.records[1]['sequence'][6:]
+        self.assertEqual(scanindex.build_index(self.records, self.filename), (1, 2))
+
+    def test_rebuilt_index_is_opened_again(self):
+        scanindex.build_index(self.records[:1], self.filename)
+        first = scanindex.index_for(self.filename)
+        self.assertIs(scanindex.index_for(self.filename), first)
+        scanindex.build_index(self.records, self.filename)
+        second = scanindex.index_for(self.filename)
+        self.assertIsNot(second, first)
+        self.assertTrue(first.map.closed)
+        self.assertTrue(first.file.closed)
+        self.assertEqual(len(second.sequences), 3)
+
+    def test_not_an_index(self):
+        with open(self.filename, 'wb') as f:
+            f.write(b'not an index at all')
+        with self.assertRaises(ValueError):
+            scanindex.ScanIndex(self.filename)
+
+if __name__ == '__main__':
+    unittest.main()
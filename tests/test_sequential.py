@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+#
+# The dynamic programming of sequential.plan_sequential() against all
+# orders of all splits of the enzymes into phases.
+import random, unittest
+
+from reoptimize import records, sequential
+
+buffers = records.buffer_table(['NEBuffer 1.1', 'NEBuffer 2.1', 'NEBuffer 3.1', 'CutSmart® Buffer'])
+names = ['BamHI', 'EcoRI', 'HindIII', 'KpnI', 'NotI']
+
+def enzyme(name, activities, temperature=37, star_activities=None):
+    record = records.EnzymeRecord(name, buffers)
+    record.activities = list(activities)
+    record.star_activities = list(star_activities or [0] * len(buffers))
+    record.units = 10.0
+    record.reaction_temperature = temperature
+    return record
+
+def make_plan(enzyme_records, time=1):
+    return records.Plan({record.name: record for record in enzyme_records}, [], len(enzyme_records), time)
+
+# All ordered splits of the enzymes into non-empty phases
+def phase_orders(members):
+    if not members:
+        yield []
+        return
+    first, rest = members[0], members[1:]
+    for order in phase_orders(rest):
+        # first in a new phase at any place, or in one of the phases
+        for position in range(len(order) + 1):
+            yield order[:position] + [[first]] + order[position:]
+        for position in range(len(order)):
+            yield order[:position] + [[first] + order[position]] + order[position + 1:]
+
+# Cost (buffer changes, inactivations, minutes) of phases done one after
+# the other, None if a phase has no buffer
+def phases_cost(plan, phases):
+    minutes_per_step = plan.time * 60
+    changes = inactivations = minutes = 0
+    for number, phase in enumerate(phases):
+        values = [plan.enzymes[name] for name in phase]
+        usable = any(all(value.activity(buffer) is not None and value.activity(buffer) >= sequential.minimum_activity and value.star_activities[buffers.index[buffer]] == 0
+                         for value in values) for buffer in buffers.names)
+        if not usable and len(phase) > 1:
+            return None
+        minutes += len(set(value.reaction_temperature for value in values)) * minutes_per_step
+        if number < len(phases) - 1:
+            changes += 1
+            inactivations += 1
+            if all(sequential.enzymes.inactivation_temperature(value.name) > value.reaction_temperature for value in values):
+                minutes += sequential.heat_inactivation_minutes
+            else:
+                minutes += sequential.cleanup_minutes
+    return changes, inactivations, minutes
+
+def brute_force(plan):
+    costs = [phases_cost(plan, phases) for phases in phase_orders(sorted(plan.enzymes))]
+    return min(cost for cost in costs if cost is not None)
+
+class SequentialTest(unittest.TestCase):
+    def check(self, plan):
+        result = sequential.plan_sequential(plan)
+        self.assertEqual((result['buffer_changes'], result['inactivations'], result['minutes']), brute_force(plan))
+        # Every enzyme is digested once, in a buffer it may be used in
+        digested = []
+        for step in result['steps']:
+            if step.action == 'digest':
+                digested.extend(step.enzymes)
+                for name in step.enzymes:
+                    value = plan.enzymes[name]
+                    self.assertEqual(value.reaction_temperature, step.temperature)
+                    if name not in result['no_buffer']:
+                        self.assertGreaterEqual(value.activity(step.buffer), sequential.minimum_activity)
+        self.assertEqual(sorted(digested), sorted(plan.enzymes))
+        return result
+
+    def test_one_buffer(self):
+        result = self.check(make_plan([enzyme('EcoRI', [25, 100, 50, 100]), enzyme('HindIII', [25, 100, 50, 100])]))
+        self.assertEqual(result['buffer_changes'], 0)
+        self.assertEqual([step.buffer for step in result['steps']], ['CutSmart® Buffer'])
+
+    def test_no_common_buffer(self):
+        result = self.check(make_plan([enzyme('EcoRI', [100, 10, 10, 10]), enzyme('HindIII', [10, 10, 10, 100])]))
+        self.assertEqual(result['buffer_changes'], 1)
+        self.assertEqual([step.action for step in result['steps']], ['digest', 'heat_inactivation', 'digest'])
+
+    def test_temperatures(self):
+        # Two temperatures in one buffer: two incubations, no buffer change
+        result = self.check(make_plan([enzyme('EcoRI', [100] * 4), enzyme('NotI', [100] * 4, temperature=50)]))
+        self.assertEqual(result['buffer_changes'], 0)
+        self.assertEqual([step.temperature for step in result['steps']], [37, 50])
+
+    def test_cleanup(self):
+        # Not inactivated at their reaction temperature: clean-up between
+        # the phases
+        result = self.check(make_plan([enzyme('EcoRI', [100, 0, 0, 0], temperature=65), enzyme('HindIII', [0, 0, 0, 100], temperature=65)]))
+        self.assertEqual([step.action for step in result['steps']], ['digest', 'cleanup', 'digest'])
+
+    def test_star_activity(self):
+        self.check(make_plan([enzyme('EcoRI', [100] * 4, star_activities=[1, 1, 0, 1]), enzyme('HindIII', [100, 100, 25, 100])]))
+
+    def test_unknown_activity(self):
+        result = self.check(make_plan([enzyme('EcoRI', [None, -1, None, None]), enzyme('HindIII', [100] * 4)]))
+        self.assertEqual(result['no_buffer'], ['EcoRI'])
+        units = [step.units['EcoRI'] for step in result['steps'] if 'EcoRI' in step.enzymes and step.action == 'digest']
+        self.assertEqual(units, [None])
+
+    def test_random_plans(self):
+        generator = random.Random(4)
+        for repeat in range(40):
+            enzyme_records = []
+            for name in generator.sample(names, generator.randint(1, 5)):
+                activities = [generator.choice((0, 10, 25, 50, 75, 100)) for buffer in buffers.names]
+                stars = [generator.choice((0, 0, 0, 1)) for buffer in buffers.names]
+                enzyme_records.append(enzyme(name, activities, generator.choice((37, 37, 50, 65)), stars))
+            self.check(make_plan(enzyme_records, generator.choice((0.25, 1, 2))))
+
+    def test_too_many_enzymes(self):
+        enzyme_records = [enzyme('E' + str(number), [100] * 4) for number in range(sequential.max_enzymes + 1)]
+        self.assertIsNone(sequential.plan_sequential(make_plan(enzyme_records)))
+
+if __name__ == '__main__':
+    unittest.main()